@@ -11,6 +11,7 @@ from tkinter import ttk  # noqa (stored here for cleaner API)
 from tkinter.font import Font  # noqa
 
 from .dialogs import (
+    show_ask,
     show_error,
     show_info,
     show_question,
@@ -185,6 +186,17 @@ class WinBase(object):
         debug(f'{type(self).__name__} geometry: {self.geometry()}')
         return super().destroy()
 
+    def show_ask(self, msg, title=None, initial=None):
+        """ Show a tkinter askstring dialog, but make sure this window is
+            out of the way. Returns None if cancelled.
+        """
+        old_topmost = self.attributes('-topmost')
+        self.attributes('-topmost', 0)
+        ans = show_ask(msg, title=title, parent=self, initial=initial)
+        self.attributes('-topmost', old_topmost)
+        self.lift()
+        return ans
+
     def show_error(self, msg, fatal=False):
         """ Use show_error, but make sure this window is out of the way.
             If `fatal` is truthy, call `self.destroy()` afterwards.
@@ -316,6 +328,9 @@ class WinToolTipBase(WinToplevelBase):
         self.geometry(f'{width}x{height}+{x}+{y}')
 
     def start_destroy(self):
+        if self.cb_ids:
+            # Already scheduled, the first one would win anyway.
+            return
         self.cb_ids.append(self.after(self.delay, self.destroy))
 
 
@@ -6,12 +6,37 @@
     -Christopher Welborn 05-01-2019
 """
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import (
+    messagebox,
+    simpledialog,
+)
 
 
 NAME = 'WinCNC-History'
 
 
+def show_ask(msg, title=None, parent=None, initial=None):
+    """ Show a tkinter askstring dialog. Returns None if cancelled. """
+    win = None
+    if parent is None:
+        win = tk.Tk()
+        # Fix message boxes.
+        win.option_add('*Dialog.msg.font', ('Arial', 10))
+        win.withdraw()
+
+    utitle = title or 'Input'
+    title = f'{NAME} - {utitle}'
+    ret = simpledialog.askstring(
+        title=title,
+        prompt=str(msg),
+        initialvalue=initial,
+        parent=parent or win,
+    )
+    if win is not None:
+        win.destroy()
+    return ret
+
+
 def show_done_msg(msg, errors=0):
     """ Shows either a success or error dialog, based on whether `errors` is
         non-zero.
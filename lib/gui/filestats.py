@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - GUI - File Stats
+    A sortable table of run count, run time, and errors for each file.
+    -Christopher Welborn 05-26-2019
+"""
+
+from ..util.config import (
+    NAME,
+    config,
+)
+from ..util.parser import (
+    time_str,
+    timedelta_str,
+)
+from .common import (
+    WinToplevelBase,
+    tk,
+    ttk,
+)
+
+
+class WinFileStats(WinToplevelBase):
+    """ A window with FileStats from a History, one row per file name.
+        Click a column heading to sort by it, click it again to reverse.
+    """
+    # (column, heading, sort key, width)
+    columns = (
+        ('count', 'Runs', 'count', 50),
+        ('total', 'Total', 'total', 95),
+        ('mean', 'Mean', 'mean', 75),
+        ('min', 'Min', 'min', 75),
+        ('max', 'Max', 'max', 75),
+        ('rapid', 'Rapid', 'rapid', 85),
+        ('feed', 'Feed', 'feed', 85),
+        ('errors', 'Errors', 'errors', 60),
+        ('last', 'Last Run', 'last', 160),
+    )
+
+    def __init__(self, master=None, history=None, destroy_cb=None):
+        if master is None:
+            raise ValueError(f'No master provided, got: {master!r}')
+        super().__init__(master=master)
+        self.master = master
+        self.history = history
+        self.destroy_cb = destroy_cb
+        self.sort_key = 'total'
+        self.sort_reverse = True
+        # Whether the History is being loaded/updated in another thread,
+        # it isn't read until it is done (see `self.set_state()`).
+        self.loading = False
+
+        self.title(f'{NAME} - File Stats')
+        self.geometry('1000x400')
+
+        self.frm_main = ttk.Frame(self, padding='2 2 2 2')
+        self.frm_main.pack(fill=tk.BOTH, expand=True)
+
+        self.var_user_files = tk.BooleanVar(self, value=True)
+        self.chk_user_files = ttk.Checkbutton(
+            self.frm_main,
+            text='User files only',
+            variable=self.var_user_files,
+            command=self.refresh,
+        )
+        self.chk_user_files.pack(side=tk.TOP, anchor=tk.W)
+
+        self.scroll_files = ttk.Scrollbar(self.frm_main, orient='vertical')
+        self.scroll_files.pack(side=tk.RIGHT, fill=tk.Y, expand=False)
+        self.tree_files = ttk.Treeview(
+            self.frm_main,
+            selectmode='browse',
+            columns=tuple(col for col, _, _, _ in self.columns),
+            show='tree headings',
+            yscrollcommand=self.scroll_files.set,
+        )
+        self.tree_files.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scroll_files.configure(command=self.tree_files.yview)
+        self.tree_files.heading(
+            '#0',
+            anchor=tk.CENTER,
+            text='File:',
+            command=lambda: self.sort_by('name'),
+        )
+        self.tree_files.column('#0', stretch=True, width=250, anchor=tk.W)
+        for col, heading, key, width in self.columns:
+            self.tree_files.heading(
+                col,
+                anchor=tk.CENTER,
+                text=f'{heading}:',
+                command=lambda key=key: self.sort_by(key),
+            )
+            self.tree_files.column(
+                col,
+                stretch=False,
+                width=width,
+                anchor=tk.E,
+            )
+        self.tree_files.tag_configure(
+            'error',
+            foreground=config['fg_error'],
+        )
+        self.refresh()
+
+    def destroy(self):
+        if callable(self.destroy_cb):
+            self.destroy_cb()
+        super().destroy()
+
+    def refresh(self, history=None):
+        """ Rebuild the rows from the History's file index. """
+        if history is not None:
+            self.history = history
+        if self.loading:
+            return
+        self.tree_files.delete(*self.tree_files.get_children())
+        files = self.history.file_stats(
+            key=self.sort_key,
+            reverse=self.sort_reverse,
+            user_files=self.var_user_files.get(),
+        )
+        for stats in files:
+            times = (
+                stats.total_delta,
+                stats.mean_delta,
+                stats.min_delta,
+                stats.max_delta,
+                stats.rapid_delta,
+                stats.feed_delta,
+            )
+            values = (
+                (stats.count, ) +
+                tuple(timedelta_str(delta, short=True) for delta in times) +
+                (f'{stats.error_rate:.1%}', time_str(stats.last_time))
+            )
+            self.tree_files.insert(
+                '',
+                tk.END,
+                values=values,
+                text=stats.filename,
+                tags=('error', ) if stats.errors else (),
+            )
+
+    def set_state(self, state):
+        """ Enable/disable (tk.NORMAL/tk.DISABLED) sorting and filtering,
+            while the History is loading.
+        """
+        self.loading = state == tk.DISABLED
+        self.chk_user_files.configure(state=state)
+
+    def sort_by(self, key):
+        """ Sort the rows by a `FileIndex.sort_keys` key. Sorting by the
+            same key again reverses the order.
+        """
+        if self.loading:
+            return
+        if key == self.sort_key:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_key = key
+            self.sort_reverse = key != 'name'
+        self.refresh()
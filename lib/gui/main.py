@@ -5,6 +5,13 @@
     -Christopher Welborn 04-27-2019
 """
 
+import os
+import time
+
+from ..util.cache import (
+    load_history,
+    save_history,
+)
 from ..util.config import (
     AUTHOR,
     ICONFILE,
@@ -17,8 +24,11 @@ from ..util.debug import (
     debug_err,
     print_err,
 )
+from ..util.loader import HistoryLoader
 from ..util.parser import (
     History,
+    parse_user_datetime,
+    time_str,
     timedelta_str,
 )
 from .common import (
@@ -27,15 +37,23 @@ from .common import (
     create_event_handler,
     WinTkBase,
 )
+from ..util.query import (
+    QUERY_HELP,
+    InvalidQuery,
+    Query,
+)
+from .filestats import WinFileStats
 from .tooltips import (
     WinToolTipCommand,
     WinToolTipSession,
 )
 
 
-def load_gui(filepath=None):
-    """ Load WinMain and run the event loop. """
-    win = WinMain(filepath=filepath)  # noqa
+def load_gui(filepath=None, days=None, sessions=None):
+    """ Load WinMain and run the event loop.
+        `days`/`sessions` set the recent window, see `History.from_file()`.
+    """
+    win = WinMain(filepath=filepath, days=days, sessions=sessions)  # noqa
     try:
         tk.mainloop()
     except Exception as ex:
@@ -50,16 +68,54 @@ def load_gui(filepath=None):
 class WinMain(WinTkBase):
     """ Main window for WinCNC History. """
 
-    def __init__(self, filepath=None):
+    def __init__(self, filepath=None, days=None, sessions=None):
         super().__init__()
         self.filepath = filepath or config.get('wincnc_file', None)
 
-        # History instance set in `self.refresh()`.
-        self.history = History()
+        # Recent window for the first load, see `History.from_file()`.
+        self.days = days
+        self.sessions = sessions
+        # History instance (from the cache, if possible), loaded and
+        # updated in the background by `self.refresh()`. Only the recent
+        # window is loaded, older Sessions are loaded when scrolling to the
+        # top. It is empty until the first load is done.
+        self.history = History(
+            filepath=self.filepath,
+            lazy=True,
+            days=days,
+            sessions=sessions,
+        )
+        self.history_loaded = False
+        # History offset when the cache was last saved.
+        self.history_saved = self.history.offset
+        # HistoryLoader, while the history is being loaded/updated.
+        self.loader = None
+        # Callback id for polling the loader, see `self.poll_loader()`.
+        self.loader_cb_id = None
+        # Delay between loader polls, in ms.
+        self.loader_delay = 100
+        # Menu labels that need a loaded history, disabled while loading.
+        self.history_menu_labels = []
+        # Auto-refresh, watching the file for changes (see
+        # `self.poll_file()`), and the delay between checks in ms.
+        self.auto_refresh = config.get('auto_refresh', False)
+        self.auto_refresh_delay = max(config.get('auto_refresh_ms', 500), 50)
+        # Callback id for the next check.
+        self.auto_refresh_cb_id = None
+        # File size/mtime at the last check.
+        self.file_stat = None
+        # When a change was first seen, while waiting for writes to stop.
+        self.file_changed = None
         # Style for theme.
         self.style = ttk.Style()
-        # Last "focused" row.
+        # Last "focused" row, and its tags before it was focused.
         self.last_focus = None
+        self.last_focus_tags = ()
+        # Last mouse motion over the tree, handled at most once per frame
+        # (delay in ms), see `self.event_tree_session_motion()`.
+        self.motion_event = None
+        self.motion_cb_id = None
+        self.motion_delay = 16
         # Delay for tooltips, in ms.
         self.tooltip_delay = 1250
         self.tooltip_kill_delay = 750
@@ -68,6 +124,21 @@ class WinMain(WinTkBase):
         self.tooltip_cb_id = None
         # Tooltip window.
         self.win_tooltip = None
+        # File stats window, while it is open.
+        self.win_file_stats = None
+        # Query from the filter bar, only matching rows are shown.
+        self.query = None
+        # Callback id for loading older Sessions, see `self.load_older()`.
+        self.load_older_cb_id = None
+        # Commands for each Session row (by item id), their rows are only
+        # inserted while the Session is expanded.
+        self.session_commands = {}
+        # Session rows expanded while loading, populated when it is done.
+        self.pending_open = set()
+        # Last Session in the history when the tree was built/updated, and
+        # how many Commands it had, see `self.update_tree()`.
+        self.tree_last_session = None
+        self.tree_last_count = 0
 
         # Set icon for main window and all children.
         try:
@@ -135,10 +206,29 @@ class WinMain(WinTkBase):
                 },
             },
             'file': {
+                'File Stats': {
+                    'char': 'S',
+                    'func': self.cmd_menu_file_stats,
+                    'order': 0,
+                    'history': True,
+                },
+                'Jump To Time': {
+                    'char': 'J',
+                    'func': self.cmd_menu_jump,
+                    'order': 0,
+                    'history': True,
+                },
+                'Load Older': {
+                    'char': 'O',
+                    'func': self.cmd_menu_load_older,
+                    'order': 0,
+                    'history': True,
+                },
                 'Refresh': {
                     'char': 'R',
                     'func': self.cmd_menu_refresh,
                     'order': 0,
+                    'history': True,
                 },
                 # Separator under tiger viewer (order: 2).
                 '-': {'order': 1},
@@ -159,15 +249,20 @@ class WinMain(WinTkBase):
                 self.menu_file.add_separator()
                 continue
             fileinfo = hotkeys['file'][lbl]
+            func = fileinfo['func']
+            if fileinfo.get('history', False):
+                # Hotkeys still work while the menu item is disabled.
+                self.history_menu_labels.append(lbl)
+                func = self.when_loaded(func)
             self.menu_file.add_command(
                 label=lbl,
                 underline=lbl.index(fileinfo['char']),
-                command=fileinfo['func'],
+                command=func,
                 accelerator='Ctrl+{}'.format(fileinfo['char'].upper()),
             )
             self.bind_all(
                 '<Control-{}>'.format(fileinfo['char'].lower()),
-                create_event_handler(fileinfo['func'])
+                create_event_handler(func)
             )
         self.menu_main.add_cascade(
             label='File',
@@ -201,6 +296,58 @@ class WinMain(WinTkBase):
         self.frm_main = ttk.Frame(self, padding='2 2 2 2')
         self.frm_main.pack(fill=tk.BOTH, expand=True)
 
+        # Filter bar.
+        self.frm_filter = ttk.Frame(self.frm_main, padding='0 0 0 2')
+        self.frm_filter.pack(side=tk.TOP, fill=tk.X, expand=False)
+        self.lbl_filter = ttk.Label(self.frm_filter, text='Filter:')
+        self.lbl_filter.pack(side=tk.LEFT, anchor=tk.W, expand=False)
+        self.var_query = tk.StringVar(self.frm_filter)
+        self.entry_filter = ttk.Entry(
+            self.frm_filter,
+            textvariable=self.var_query,
+            style='TEntry',
+            font=config['font_entry'],
+        )
+        self.entry_filter.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.entry_filter.bind('<Return>', lambda event: self.apply_filter())
+        self.entry_filter.bind('<Escape>', lambda event: self.clear_filter())
+        self.btn_filter_help = ttk.Button(
+            self.frm_filter,
+            text='?',
+            width=2,
+            command=lambda: self.show_info(QUERY_HELP, title='Filter'),
+        )
+        self.btn_filter_help.pack(side=tk.RIGHT, expand=False)
+        self.btn_filter_clear = ttk.Button(
+            self.frm_filter,
+            text='Clear',
+            command=self.clear_filter,
+        )
+        self.btn_filter_clear.pack(side=tk.RIGHT, expand=False)
+        self.btn_filter = ttk.Button(
+            self.frm_filter,
+            text='Filter',
+            command=self.apply_filter,
+        )
+        self.btn_filter.pack(side=tk.RIGHT, expand=False)
+
+        # Progress bar, only packed while loading.
+        self.frm_progress = ttk.Frame(self.frm_main, padding='0 0 0 2')
+        self.lbl_progress = ttk.Label(self.frm_progress, text='Loading...')
+        self.lbl_progress.pack(side=tk.LEFT, anchor=tk.W, expand=False)
+        self.progress_load = ttk.Progressbar(
+            self.frm_progress,
+            orient='horizontal',
+            mode='determinate',
+        )
+        self.progress_load.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.btn_cancel_load = ttk.Button(
+            self.frm_progress,
+            text='Cancel',
+            command=self.cancel_load,
+        )
+        self.btn_cancel_load.pack(side=tk.RIGHT, expand=False)
+
         # Top frame.
         self.frm_top = ttk.Frame(self.frm_main)
         self.frm_top.pack(side=tk.TOP, fill=tk.X, expand=True)
@@ -219,7 +366,7 @@ class WinMain(WinTkBase):
             self.frm_session,
             selectmode='browse',
             height=tree_height,
-            yscrollcommand=self.scroll_session.set,
+            yscrollcommand=self.event_tree_session_scroll,
         )
         self.tree_session.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.scroll_session.configure(command=self.tree_session.yview)
@@ -352,11 +499,25 @@ class WinMain(WinTkBase):
             '<Motion>',
             self.event_tree_session_motion,
         )
+        self.tree_session.bind(
+            '<<TreeviewOpen>>',
+            self.event_tree_session_open,
+        )
+        self.tree_session.bind(
+            '<<TreeviewClose>>',
+            self.event_tree_session_close,
+        )
         if self.filepath is None:
             self.show_error('No WinCNC.csv file to use.', fatal=True)
         else:
             # Load file.
             self.refresh()
+            if self.auto_refresh:
+                self.file_stat = self.stat_file()
+                self.auto_refresh_cb_id = self.after(
+                    self.auto_refresh_delay,
+                    self.poll_file,
+                )
 
     def _build_entry(self, parent, attr, lbltext=None, entrywidth=5):
         """ Build a single Label/Entry pair wrapped in a frame. """
@@ -405,6 +566,58 @@ class WinMain(WinTkBase):
             pady=5,
         )
 
+    def apply_filter(self):
+        """ Parse the filter bar text, and rebuild the tree with only the
+            matching rows.
+        """
+        if self.loader is not None:
+            # The history is still changing.
+            return
+        text = self.var_query.get().strip()
+        try:
+            query = Query.parse(text)
+        except InvalidQuery as ex:
+            self.show_error(ex)
+            return
+        if (not query) and (not self.query):
+            return
+        self.query = query
+        self.build_tree()
+
+    def build_tree(self):
+        """ Build the session/command tree from `self.history`, with only
+            the rows that match `self.query` (if it is set).
+        """
+        self.clear_treeview(self.tree_session)
+        self.last_focus = None
+        self.session_commands.clear()
+        if self.query:
+            matches = self.query.sessions(self.history)
+        else:
+            matches = ((session, session) for session in self.history)
+
+        for session, commands in matches:
+            self.insert_session(session, commands)
+        self.remember_last_session()
+        # Select last history item.
+        children = self.tree_session.get_children()
+        if children:
+            lastsessionid = children[-1]
+            self.tree_session.see(lastsessionid)
+            self.populate_session(lastsessionid)
+            lastlines = self.tree_session.get_children(item=lastsessionid)
+            if lastlines:
+                lastlineid = lastlines[-1]
+                self.tree_session.see(lastlineid)
+                self.tree_session.selection_set(lastlineid)
+
+    def cancel_load(self):
+        """ Stop loading the history, see `self.loader_done()`. """
+        if self.loader is not None:
+            self.btn_cancel_load.configure(state=tk.DISABLED)
+            self.lbl_progress.configure(text='Cancelling...')
+            self.loader.cancel()
+
     def clear_entry(self, entry):
         entry.delete(0, tk.END)
 
@@ -414,6 +627,11 @@ class WinMain(WinTkBase):
             var = getattr(self, name)
             var.set('')
 
+    def clear_filter(self):
+        """ Clear the filter bar, and show all rows again. """
+        self.var_query.set('')
+        self.apply_filter()
+
     def clear_treeview(self, treeview):
         treeview.delete(*treeview.get_children())
 
@@ -436,6 +654,44 @@ class WinMain(WinTkBase):
     def cmd_menu_exit(self):
         self.destroy()
 
+    def cmd_menu_file_stats(self):
+        """ Show run count, run time, and errors for each file. """
+        if self.win_file_stats is not None:
+            self.win_file_stats.lift()
+            return
+        self.win_file_stats = WinFileStats(
+            self,
+            history=self.history,
+            destroy_cb=self.reset_win_file_stats,
+        )
+
+    def cmd_menu_jump(self):
+        """ Ask for a date/time, and select whatever was running then. """
+        focused = self.tree_session.selection()
+        initial = None
+        if focused and (self.tree_session.parent(focused[0]) != ''):
+            cmdid = self.tree_session.item(focused[0])['tags'][0]
+            initial = self.history.get_command(cmdid).time_str()
+        answer = self.show_ask(
+            'Enter a date/time (mm-dd-yy hh:mm[:ss]):',
+            title='Jump To Time',
+            initial=initial,
+        )
+        if not answer:
+            return
+        try:
+            when = parse_user_datetime(answer)
+        except ValueError as ex:
+            self.show_error(ex)
+            return
+        self.jump_to_time(when)
+
+    def cmd_menu_load_older(self):
+        if not self.history.has_older():
+            self.show_info('All sessions are loaded.', title='Load Older')
+            return
+        self.load_older()
+
     def cmd_menu_refresh(self):
         self.refresh()
 
@@ -443,6 +699,21 @@ class WinMain(WinTkBase):
         if save_config:
             config['geometry'] = self.geometry()
             config.save()
+        if self.loader_cb_id is not None:
+            self.after_cancel(self.loader_cb_id)
+            self.loader_cb_id = None
+        if self.auto_refresh_cb_id is not None:
+            self.after_cancel(self.auto_refresh_cb_id)
+            self.auto_refresh_cb_id = None
+        if self.motion_cb_id is not None:
+            self.after_cancel(self.motion_cb_id)
+            self.motion_cb_id = None
+        if self.loader is not None:
+            # Stop parsing before the history is saved.
+            self.loader.cancel()
+            self.loader.join()
+        if self.history.offset != self.history_saved:
+            save_history(self.history)
         super().destroy()
 
     def event_tooltip(self, itemid, event):
@@ -450,32 +721,62 @@ class WinMain(WinTkBase):
             an item in `self.tree_session`.
         """
         self.tooltip_cb_id = None
+        if self.loader is not None:
+            return
         selected = self.tree_session.item(itemid)
-        hsh = selected['tags'][0]
+        objid = selected['tags'][0]
         if 'session' not in selected['tags']:
             # Single line item.
-            return self.show_tooltip_command(hsh, itemid, event)
+            return self.show_tooltip_command(objid, itemid, event)
 
-        return self.show_tooltip_session(hsh, itemid, event)
+        return self.show_tooltip_session(objid, itemid, event)
 
     def event_tree_session_button3(self, event):
         """ Handle r-click. """
         itemid = self.tree_session.identify_row(event.y)
         self.event_tooltip(itemid, event)
 
+    def event_tree_session_close(self, event):
+        """ Remove Command rows for a Session when it is collapsed. """
+        if config.get('release_closed_rows', True):
+            self.release_session(self.tree_session.focus())
+
     def event_tree_session_motion(self, event):
-        """ Highlights the row underneath the mouse. """
-        itemid = self.tree_session.identify_row(event.y)
-        if itemid != self.last_focus:
-            self.focus_remove()
-            # Focus the new item.
-            self.focus_set(itemid)
-        # Kill tooltip on this motion.
-        if self.win_tooltip is not None:
-            self.win_tooltip.start_destroy()
+        """ Highlights the row underneath the mouse. Motion events come in
+            faster than they can be drawn, so only the last one is handled,
+            once per frame.
+        """
+        self.motion_event = event
+        if self.motion_cb_id is None:
+            self.motion_cb_id = self.after(self.motion_delay, self.hover)
+
+    def event_tree_session_open(self, event):
+        """ Insert Command rows for a Session when it is expanded. While
+            loading, the open Session is still receiving Commands, so that
+            waits until it is done.
+        """
+        if self.loader is not None:
+            self.pending_open.add(self.tree_session.focus())
+            return
+        self.populate_session(self.tree_session.focus())
+
+    def event_tree_session_scroll(self, first, last):
+        """ Update the scrollbar, and load older Sessions when the tree is
+            scrolled to the top.
+        """
+        self.scroll_session.set(first, last)
+        if float(first) > 0 or (self.load_older_cb_id is not None):
+            return
+        if self.loader is not None:
+            return
+        if self.history.has_older():
+            # Not while Tk is still drawing the tree.
+            self.load_older_cb_id = self.after_idle(self.load_older_at_top)
 
     def event_tree_session_select(self, event):
         """ Populates all the entries for the selected item. """
+        if self.loader is not None:
+            return
         index = self.tree_session.selection()
         selected = self.tree_session.item(index)
         if 'session' in selected['tags']:
@@ -483,16 +784,17 @@ class WinMain(WinTkBase):
             self.clear_entries()
             return
 
-        hsh = selected['tags'][0]
-        hl = self.history.get_command(hsh)
+        cmdid = selected['tags'][0]
+        hl = self.history.get_command(cmdid)
         self.set_entries(hl)
 
     def focus_remove(self):
         if not self.last_focus:
             return
 
-        # Un-focus last focused item.
-        self.tag_remove(self.last_focus, 'focused')
+        # Un-focus last focused item, its old tags are cached.
+        self.tree_session.item(self.last_focus, tags=self.last_focus_tags)
+        self.last_focus = None
 
         # Cancel tooltip callback if it has not fired.
         if self.tooltip_cb_id is not None:
@@ -500,97 +802,383 @@ class WinMain(WinTkBase):
 
     def focus_set(self, itemid):
         """ Set focus to a row, by item id. """
-        if itemid == self.last_focus:
+        if (not itemid) or (itemid == self.last_focus):
             return
-        self.tag_add(itemid, 'focused')
+        tags = self.tree_session.item(itemid)['tags']
+        # Sometimes tags is an empty str.
+        self.last_focus_tags = tuple(tags) if tags else ()
+        self.tree_session.item(
+            itemid,
+            tags=self.last_focus_tags + ('focused', ),
+        )
         self.last_focus = itemid
 
     def get_row_bottom(self, itemid, event):
         """ Get a Treeview item's bottom position (max y). """
-        previtem = itemid
-        itemy = event.y
-        while previtem == itemid:
-            itemy += 1
-            previtem = self.tree_session.identify_row(itemy)
-        return itemy - 1
+        bbox = self.tree_session.bbox(itemid)
+        if not bbox:
+            # Not visible.
+            return event.y
+        _, itemy, _, height = bbox
+        return itemy + height - 1
 
     def get_row_top(self, itemid, event):
         """ Get a Treeview item's top position (min y). """
-        previtem = itemid
-        itemy = event.y
-        while previtem == itemid:
-            itemy -= 1
-            previtem = self.tree_session.identify_row(itemy)
-        return itemy + 1
+        bbox = self.tree_session.bbox(itemid)
+        if not bbox:
+            # Not visible.
+            return event.y
+        return bbox[1]
 
-    def refresh(self):
-        """ Read the WinCNC file and build the session/command trees. """
-        self.clear_treeview(self.tree_session)
-        self.last_focus = None
+    def hover(self):
+        """ Handle the last mouse motion over the tree, see
+            `self.event_tree_session_motion()`.
+        """
+        self.motion_cb_id = None
+        event = self.motion_event
+        if event is None:
+            return
+        self.motion_event = None
+        itemid = self.tree_session.identify_row(event.y)
+        if itemid != self.last_focus:
+            self.focus_remove()
+            # Focus the new item.
+            self.focus_set(itemid)
+        # Kill tooltip on this motion.
+        if self.win_tooltip is not None:
+            self.win_tooltip.start_destroy()
 
-        # Reload from file.
-        self.history = History.from_file(self.filepath)
-        if not self.history:
-            self.show_error(f'No lines from history file:\n{self.filepath}')
+    def insert_command(self, sessionid, hl):
+        """ Insert a tree row for a Command, under a Session row. """
+        itemduration = timedelta_str(hl.duration_delta, short=True)
+        statustext = hl.status.split()[0]
+        timetext = hl.time_str(time_only=True)
+
+        self.tree_session.insert(
+            sessionid,
+            tk.END,
+            iid=hl.treeview_iid(),
+            values=(itemduration, hl.filename, ),
+            text=f'{timetext} - {statustext}',
+            tags=hl.treeview_tags(),
+        )
+
+    def insert_placeholder(self, sessionid):
+        """ Insert an empty child row for a Session row, so it can be
+            expanded before its Command rows are inserted.
+        """
+        if not self.session_commands.get(sessionid, None):
             return
+        self.tree_session.insert(
+            sessionid,
+            tk.END,
+            iid=self.placeholder_iid(sessionid),
+            tags=('placeholder', ),
+        )
 
-        for session in self.history:
-            sessiontext = f'Status: {session.last_status()}'
-            if session.duration_delta:
-                sessionduration = session.duration
-            else:
-                sessionduration = ''
-            sessionid = self.tree_session.insert(
-                '',
-                tk.END,
-                values=(sessionduration, sessiontext, ),
-                text=session.time_str(human=True),
-                tags=session.treeview_tags(),
-            )
-            for hl in session:
-                itemduration = timedelta_str(hl.duration_delta, short=True)
-                statustext = hl.status.split()[0]
-                timetext = hl.time_str(time_only=True)
-
-                self.tree_session.insert(
-                    sessionid,
-                    tk.END,
-                    values=(itemduration, hl.filename, ),
-                    text=f'{timetext} - {statustext}',
-                    tags=hl.treeview_tags(),
+    def insert_session(self, session, commands, index=tk.END):
+        """ Insert a tree row for a Session at `index`. Rows for `commands`
+            (the Session's Commands, or the matching ones) are not inserted
+            until the Session is expanded, see `self.populate_session()`.
+        """
+        sessionid = self.tree_session.insert(
+            '',
+            index,
+            iid=session.treeview_iid(),
+            values=self.session_values(session),
+            text=session.time_str(human=True),
+            tags=session.treeview_tags(),
+        )
+        self.session_commands[sessionid] = commands
+        self.insert_placeholder(sessionid)
+
+    def jump_to_time(self, when):
+        """ Select the Command (or Session) that was running at `when`.
+        """
+        commands = self.history.commands_at(when)
+        if commands:
+            session, cmd = commands[-1]
+            self.populate_session(session.treeview_iid())
+            itemid = cmd.treeview_iid()
+        else:
+            sessions = self.history.sessions_at(when)
+            if not sessions:
+                self.show_info(
+                    f'Nothing was running at: {time_str(when)}',
+                    title='Jump To Time',
                 )
-        # Select last history item.
+                return
+            itemid = sessions[-1].treeview_iid()
+        if not self.tree_session.exists(itemid):
+            debug_err(f'Missing tree item: {itemid}')
+            return
+        self.tree_session.see(itemid)
+        self.tree_session.selection_set(itemid)
+        self.tree_session.focus(itemid)
+
+    def load_older(self):
+        """ Load Sessions from before the recent window, and insert their
+            rows at the top of the tree.
+        """
+        self.load_older_cb_id = None
+        if not self.history.has_older():
+            return
+        sessions = self.history.load_older()
         children = self.tree_session.get_children()
+        if self.query:
+            matches = self.query.filter_sessions(sessions, self.history)
+        else:
+            matches = ((session, session) for session in sessions)
+        for i, (session, commands) in enumerate(matches):
+            self.insert_session(session, commands, index=i)
         if children:
-            lastsessionid = children[-1]
-            self.tree_session.see(lastsessionid)
-            lastlines = self.tree_session.get_children(item=lastsessionid)
-            if lastlines:
-                lastlineid = lastlines[-1]
-                self.tree_session.see(lastlineid)
-                self.tree_session.selection_set(lastlineid)
+            # Keep the rows that were at the top in view.
+            self.tree_session.see(children[0])
+        if self.win_file_stats is not None:
+            self.win_file_stats.refresh(self.history)
+
+    def load_older_at_top(self):
+        """ Load older Sessions if the tree is still scrolled to the top.
+        """
+        self.load_older_cb_id = None
+        if self.tree_session.yview()[0] > 0:
+            return
+        self.load_older()
+
+    def loader_done(self, msg, value):
+        """ Handle the last message from `self.loader` (see HistoryLoader),
+            and build the session/command trees.
+        """
+        self.loader = None
+        self.frm_progress.pack_forget()
+        self.set_history_menu_state(tk.NORMAL)
+        if msg == 'error':
+            self.show_error(
+                f'Unable to load history file:\n{self.filepath}\n\n{value}'
+            )
+            return
+        if msg == 'cancelled':
+            if not self.history_loaded:
+                self.show_info(
+                    'Loading was cancelled, use Refresh to try again.',
+                    title='Refresh',
+                )
+                return
+            # Sessions parsed before it was cancelled are still shown.
+        elif not self.history_loaded:
+            self.history = value
+            self.history_saved = self.history.offset
+            self.history_loaded = True
+            self.tree_last_session = None
+        if not self.history:
+            self.clear_treeview(self.tree_session)
+            self.last_focus = None
+            self.session_commands.clear()
+            self.tree_last_session = None
+            self.show_error(f'No lines from history file:\n{self.filepath}')
+            return
+        at_bottom = self.tree_session.yview()[1] >= 1
+        self.update_tree()
+        self.populate_pending()
+        if at_bottom:
+            # Follow new rows, unless the user scrolled up.
+            self.see_last_row()
+        if self.win_file_stats is not None:
+            self.win_file_stats.refresh(self.history)
+
+    @staticmethod
+    def placeholder_iid(sessionid):
+        """ Item id for the empty child row of a Session row. """
+        return f'{sessionid}.placeholder'
+
+    def poll_file(self):
+        """ Check the file's size/mtime, and refresh once it has stopped
+            changing (or has been changing for a few checks), so a burst
+            of writes only causes one refresh.
+        """
+        self.auto_refresh_cb_id = None
+        stat = self.stat_file()
+        if stat != self.file_stat:
+            self.file_stat = stat
+            now = time.monotonic()
+            if self.file_changed is None:
+                self.file_changed = now
+            waited = (now - self.file_changed) * 1000
+            if waited < (self.auto_refresh_delay * 3):
+                # Still being written.
+                self.auto_refresh_cb_id = self.after(
+                    self.auto_refresh_delay,
+                    self.poll_file,
+                )
+                return
+        if (self.file_changed is not None) and (self.loader is None):
+            self.file_changed = None
+            if stat is not None:
+                self.refresh()
+        self.auto_refresh_cb_id = self.after(
+            self.auto_refresh_delay,
+            self.poll_file,
+        )
+
+    def poll_loader(self):
+        """ Show progress from `self.loader`, until it is done. """
+        self.loader_cb_id = None
+        if self.loader is None:
+            return
+        for msg, value in self.loader.messages():
+            if msg != 'progress':
+                self.loader_done(msg, value)
+                return
+            done, total = value
+            self.progress_load.configure(value=done, maximum=max(total, 1))
+            self.lbl_progress.configure(
+                text=f'Loading: {done / 1048576:0.1f}/{total / 1048576:0.1f}MB'
+            )
+        if not self.frm_progress.winfo_manager():
+            self.frm_progress.pack(
+                side=tk.TOP,
+                fill=tk.X,
+                expand=False,
+                before=self.frm_top,
+            )
+        self.loader_cb_id = self.after(self.loader_delay, self.poll_loader)
+
+    def populate_pending(self):
+        """ Populate Session rows that were expanded while loading. """
+        for sessionid in self.pending_open:
+            if not self.tree_session.exists(sessionid):
+                continue
+            if self.tree_session.item(sessionid, 'open'):
+                self.populate_session(sessionid)
+        self.pending_open.clear()
+
+    def populate_session(self, sessionid):
+        """ Replace a Session row's placeholder with rows for its Commands.
+        """
+        placeholder = self.placeholder_iid(sessionid)
+        if not self.tree_session.exists(placeholder):
+            # Not a Session row, or it is already populated.
+            return
+        self.tree_session.delete(placeholder)
+        for hl in self.session_commands.get(sessionid, ()):
+            self.insert_command(sessionid, hl)
+
+    def refresh(self):
+        """ Read the WinCNC file in a background thread, and build the
+            session/command trees when it is done (see `self.loader_done()`).
+        """
+        if self.loader is not None:
+            return
+        if self.history_loaded:
+            # Parse new lines from the file (only them, unless it was
+            # replaced).
+            self.loader = HistoryLoader(self.history.update)
+        else:
+            # Use the cache, and parse new lines (or all of them).
+            self.loader = HistoryLoader(
+                load_history,
+                self.filepath,
+                lazy=True,
+                days=self.days,
+                sessions=self.sessions,
+            )
+        self.set_history_menu_state(tk.DISABLED)
+        self.btn_cancel_load.configure(state=tk.NORMAL)
+        self.lbl_progress.configure(text='Loading...')
+        self.progress_load.configure(value=0, maximum=1)
+        # The progress bar is shown on the first poll, so small updates
+        # don't make it flicker.
+        self.loader.start()
+        self.loader_cb_id = self.after(self.loader_delay, self.poll_loader)
+
+    def release_session(self, sessionid):
+        """ Remove the Command rows for a collapsed Session row, leaving a
+            placeholder. Rows are kept while one of them is selected.
+        """
+        if sessionid not in self.session_commands:
+            return
+        children = self.tree_session.get_children(item=sessionid)
+        placeholder = self.placeholder_iid(sessionid)
+        if (not children) or (placeholder in children):
+            return
+        if any(s in children for s in self.tree_session.selection()):
+            return
+        if self.last_focus in children:
+            self.focus_remove()
+        self.tree_session.delete(*children)
+        self.insert_placeholder(sessionid)
+
+    def remember_last_session(self):
+        """ Remember the last Session in the history, and how many Commands
+            it has, so `self.update_tree()` knows what is new.
+        """
+        if self.history:
+            self.tree_last_session = self.history.data[-1]
+            self.tree_last_count = len(self.tree_last_session)
+        else:
+            self.tree_last_session = None
+            self.tree_last_count = 0
+
+    def reset_win_file_stats(self):
+        """ Set win_file_stats to None. This is a callback for
+            WinFileStats.
+        """
+        self.win_file_stats = None
 
     def reset_win_tooltip(self):
         """ Set win_tooltip to None. This is a callback for WinToolTip*. """
         self.win_tooltip = None
 
+    def see_last_row(self):
+        """ Scroll to the last row, the last Command row if the last
+            Session is expanded.
+        """
+        children = self.tree_session.get_children()
+        if not children:
+            return
+        lastid = children[-1]
+        if self.tree_session.item(lastid, 'open'):
+            lastlines = self.tree_session.get_children(item=lastid)
+            if lastlines:
+                lastid = lastlines[-1]
+        self.tree_session.see(lastid)
+
+    @staticmethod
+    def session_values(session):
+        """ Return Treeview column values for a Session row. """
+        sessiontext = f'Status: {session.last_status()}'
+        if session.duration_delta:
+            sessionduration = session.duration
+        else:
+            sessionduration = ''
+        return (sessionduration, sessiontext, )
+
     def set_entries(self, hl):
         """ Set all entry values from a Command. """
         for name in self.var_names:
             var = getattr(self, name)
             var.set(getattr(hl, name[4:]))
 
-    def show_tooltip_command(self, hsh, itemid, event):
+    def set_history_menu_state(self, state):
+        """ Enable/disable (tk.NORMAL/tk.DISABLED) the menu items, and the
+            File Stats window, that need a loaded history.
+        """
+        for lbl in self.history_menu_labels:
+            self.menu_file.entryconfigure(lbl, state=state)
+        if self.win_file_stats is not None:
+            self.win_file_stats.set_state(state)
+
+    def show_tooltip_command(self, cmdid, itemid, event):
         if self.win_tooltip is not None:
             return
         try:
-            command = self.history.get_command(hsh)
+            command = self.history.get_command(cmdid)
         except ValueError:
             # No real item was focused.
             return
         parentid = self.tree_session.parent(itemid)
-        parenthsh = self.tree_session.item(parentid)['tags'][0]
-        session = self.history.get_session(parenthsh)
+        sessionid = self.tree_session.item(parentid)['tags'][0]
+        session = self.history.get_session(sessionid)
 
         # Ensure the tooltip always draws in the same row-relative place.
         itemy = self.get_row_top(itemid, event)
@@ -608,11 +1196,11 @@ class WinMain(WinTkBase):
             destroy_cb=self.reset_win_tooltip,
         )
 
-    def show_tooltip_session(self, hsh, itemid, event):
+    def show_tooltip_session(self, sessionid, itemid, event):
         if self.win_tooltip is not None:
             return
         try:
-            session = self.history.get_session(hsh)
+            session = self.history.get_session(sessionid)
         except ValueError:
             # No real item was focused.
             return
@@ -630,25 +1218,86 @@ class WinMain(WinTkBase):
             destroy_cb=self.reset_win_tooltip,
         )
 
-    def tag_add(self, itemid, tag):
-        """ Add a tag to a treeview item, by item id. """
-        tags = self.tree_session.item(itemid)['tags']
-        if not tags:
-            # Sometimes tags is an empty str.
-            self.tree_session.item(itemid, tags=[tag])
-            return
+    def stat_file(self):
+        """ Return the file's (size, mtime), or None if it is missing. """
+        try:
+            st = os.stat(self.filepath)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
 
-        if tag not in tags:
-            tags.append(tag)
-        self.tree_session.item(itemid, tags=tags)
+    def update_session(self, session, commands):
+        """ Update the row for a Session that received new `commands` (or
+            was closed), and add rows for the new Commands if it is
+            expanded. With a filter, only matching Commands are added, and
+            the row is inserted if it didn't match before.
+        """
+        sessionid = session.treeview_iid()
+        if self.query:
+            commands = self.query.filter_commands(commands, self.history)
+        if not self.tree_session.exists(sessionid):
+            if commands:
+                self.insert_session(session, commands)
+            return
+        tags = session.treeview_tags()
+        if sessionid == self.last_focus:
+            self.last_focus_tags = tags
+            tags += ('focused', )
+        self.tree_session.item(
+            sessionid,
+            values=self.session_values(session),
+            tags=tags,
+        )
+        known = self.session_commands[sessionid]
+        if known is not session:
+            # A list of matching Commands, the Session itself has them
+            # already.
+            known.extend(commands)
+        if not commands:
+            return
+        children = self.tree_session.get_children(item=sessionid)
+        if not children:
+            # It had no Commands before.
+            self.insert_placeholder(sessionid)
+        elif self.placeholder_iid(sessionid) not in children:
+            # Expanded, or populated by a jump/selection. Rows that were
+            # already inserted (populated during the update) are skipped.
+            for hl in commands:
+                if not self.tree_session.exists(hl.treeview_iid()):
+                    self.insert_command(sessionid, hl)
 
-    def tag_remove(self, itemid, tag):
-        """ Remove a tag from a treeview item, by item id. """
-        item = self.tree_session.item(itemid)
-        tags = item['tags']
-        try:
-            tags.remove(tag)
-        except ValueError:
-            pass
+    def update_tree(self):
+        """ Add rows for the Sessions/Commands that were parsed since the
+            tree was built, and update the row for the Session that was
+            open then. Scrolling, expanded rows, and the selection are
+            left alone. If the history was parsed again from the start, the
+            tree is rebuilt.
+        """
+        last = self.tree_last_session
+        # New Sessions are appended after the last one, so it is found
+        # near the end.
+        i = len(self.history) if last is not None else 0
+        while i and (self.history.data[i - 1] is not last):
+            i -= 1
+        if not i:
+            self.build_tree()
+            return
+        self.update_session(last, last.data[self.tree_last_count:])
+        sessions = self.history.data[i:]
+        if self.query:
+            matches = self.query.filter_sessions(sessions, self.history)
         else:
-            self.tree_session.item(self.last_focus, tags=tags)
+            matches = ((session, session) for session in sessions)
+        for session, commands in matches:
+            self.insert_session(session, commands)
+        self.remember_last_session()
+
+    def when_loaded(self, func):
+        """ Wrap a menu/hotkey function, so it does nothing while the history
+            is loading.
+        """
+        def func_when_loaded():
+            if self.loader is not None:
+                return None
+            return func()
+        return func_when_loaded
@@ -5,6 +5,7 @@
     -Christopher Welborn 04-29-2019
 """
 
+from ..util.breaks import break_schedule
 from ..util.config import (
     config,
 )
@@ -170,6 +171,12 @@ class WinToolTipSession(WinToolTipCommon):
             ('between_duration', 'Time Between:'),
             ('avg_between_duration', 'Average Time Between:'),
         )
+        if break_schedule:
+            info += (
+                ('actual_adjusted_duration', 'Session Time (No Breaks):'),
+                ('end_of_day_adjusted_duration', 'End of Day (No Breaks):'),
+                ('between_adjusted_duration', 'Time Between (No Breaks):'),
+            )
         self.max_label_len = len(max(info, key=lambda t: len(t[1]))[1])
         info_vals = {
             attr: getattr(session, attr)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - Libraries - Breaks
+    Daily break windows (`break_morning`, `break_lunch` in the config), and
+    how much break time falls between two datetimes.
+    -Christopher Welborn 05-25-2019
+"""
+
+from datetime import timedelta
+
+from .config import config
+
+# Seconds in a day.
+DAY_SECS = 24 * 60 * 60
+# Config keys for the break windows.
+BREAK_KEYS = ('break_morning', 'break_lunch')
+
+
+def clock_secs(dt):
+    """ Seconds since midnight for a datetime/time. """
+    return (dt.hour * 3600) + (dt.minute * 60) + dt.second
+
+
+class BreakSchedule(object):
+    """ Break windows that happen every day.
+        The windows are merged once, and the break time before any datetime
+        is whole days of breaks plus the windows that already started that
+        day. Break time between two datetimes is the difference of those,
+        no matter how many days apart they are.
+    """
+    def __init__(self, windows=None):
+        # Seconds since midnight for each (start, end) window, windows that
+        # cross midnight are split.
+        spans = []
+        for start, end in (windows or ()):
+            startsecs, endsecs = clock_secs(start), clock_secs(end)
+            if endsecs >= startsecs:
+                spans.append((startsecs, endsecs))
+            else:
+                spans.append((startsecs, DAY_SECS))
+                spans.append((0, endsecs))
+        self.spans = []
+        for start, end in sorted(spans):
+            if self.spans and (start <= self.spans[-1][1]):
+                prevstart, prevend = self.spans[-1]
+                self.spans[-1] = (prevstart, max(prevend, end))
+            elif end > start:
+                self.spans.append((start, end))
+        # Break time for a whole day.
+        self.day_secs = sum(end - start for start, end in self.spans)
+
+    def __bool__(self):
+        return bool(self.day_secs)
+
+    def __repr__(self):
+        spans = ', '.join(
+            f'{start // 3600:02}:{start % 3600 // 60:02}-'
+            f'{end // 3600:02}:{end % 3600 // 60:02}'
+            for start, end in self.spans
+        )
+        return f'{type(self).__name__}({spans})'
+
+    @classmethod
+    def from_config(cls):
+        """ Build a BreakSchedule from the `break_*` config settings. """
+        windows = []
+        for key in BREAK_KEYS:
+            window = config.get(key, None)
+            if window and all(window):
+                windows.append(window)
+        return cls(windows)
+
+    def break_secs_before(self, dt):
+        """ Return seconds of break time from the start of the proleptic
+            calendar up to `dt`.
+        """
+        secs = clock_secs(dt)
+        today = 0
+        for start, end in self.spans:
+            if secs <= start:
+                break
+            today += min(secs, end) - start
+        return (dt.toordinal() * self.day_secs) + today
+
+    def overlap(self, start, end):
+        """ Return a timedelta for the break time between two datetimes. """
+        if (not self.day_secs) or (start is None) or (end is None):
+            return timedelta()
+        if end <= start:
+            return timedelta()
+        return timedelta(
+            seconds=self.break_secs_before(end) - self.break_secs_before(start)
+        )
+
+
+# Break windows from the config, used by Sessions.
+break_schedule = BreakSchedule.from_config()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - Libraries - Cache
+    On-disk snapshot of a parsed History, so a warm start only has to parse
+    the lines appended to WinCNC.csv since the last run.
+    -Christopher Welborn 05-22-2019
+"""
+
+import gc
+import os
+import pickle
+import zlib
+
+from .breaks import break_schedule
+from .config import (
+    CACHEFILE,
+    config,
+)
+from .debug import (
+    debug,
+    debug_err,
+)
+from .parser import (
+    History,
+    LazyCommand,
+    change_hours,
+    change_minutes,
+)
+
+# Bump this when History/Session/Command change in a way that makes old
+# snapshots unusable.
+CACHE_VERSION = 10
+
+
+def cache_key(history):
+    """ Return a dict that identifies the file/settings a History snapshot
+        was parsed with. A file with the same size and a different mtime
+        was rewritten (see `same_source()`), otherwise `History.update()`
+        knows how much of it was already parsed.
+    """
+    st = os.stat(history.filepath)
+    return {
+        'version': CACHE_VERSION,
+        'path': os.path.abspath(history.filepath),
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'change_hours': change_hours,
+        'change_minutes': change_minutes,
+        # Sessions keep a running total of break time.
+        'breaks': break_schedule.spans,
+        'lazy': history.command_class is LazyCommand,
+        'days': history.days,
+        'sessions': history.sessions,
+    }
+
+
+def load_history(
+        filepath, lazy=False, workers=None, days=None, sessions=None,
+        progress=None, cachefile=CACHEFILE):
+    """ Load a History for `filepath`, from the snapshot in `cachefile` if
+        it is usable, and parse any lines that were appended since it was
+        saved. Stale or corrupt snapshots are rebuilt from scratch.
+        The snapshot is saved again if anything new was parsed.
+        `days`/`sessions` set the recent window, see `History.from_file()`.
+        `progress` is passed to `History.update()`.
+    """
+    if not config.get('cache_history', True):
+        return History.from_file(
+            filepath,
+            lazy=lazy,
+            workers=workers,
+            days=days,
+            sessions=sessions,
+            progress=progress,
+        )
+
+    history = History(
+        filepath=filepath,
+        lazy=lazy,
+        workers=workers,
+        days=days,
+        sessions=sessions,
+    )
+    key = cache_key(history)
+    cached_key, cached = read_cache(key, cachefile=cachefile)
+    if cached is None:
+        history.update(progress=progress)
+        save_history(history, cachefile=cachefile)
+        return history
+
+    history = cached
+    if workers is not None:
+        history.workers = workers
+    unchanged = (key['size'] == cached_key['size']) and (
+        key['mtime'] == cached_key['mtime']
+    )
+    cached_offset = history.offset
+    # Even an unchanged file is checked, it may have grown while the last
+    # snapshot was saved.
+    if history.update(progress=progress):
+        debug(f'Cache miss (file was replaced): {cachefile}')
+    elif history.offset == cached_offset:
+        state = 'unchanged' if unchanged else 'no new lines'
+        debug(f'Cache hit ({state}): {cachefile}')
+        return history
+    else:
+        newbytes = history.offset - cached_offset
+        debug(f'Cache hit, parsed {newbytes} new bytes: {cachefile}')
+    save_history(history, cachefile=cachefile)
+    return history
+
+
+def read_cache(key, cachefile=CACHEFILE):
+    """ Read a History snapshot from `cachefile`, if it was saved for the
+        same file path, settings, and cache version as `key`.
+        Returns a tuple of (cached_key, history), or (None, None) if the
+        snapshot is missing, stale, or corrupt.
+    """
+    try:
+        with open(cachefile, 'rb') as f:
+            cached_key = pickle.load(f)
+            if not same_source(key, cached_key):
+                debug(f'Cache miss (stale): {cachefile}')
+                return None, None
+            data = zlib.decompress(f.read())
+        # Unpickling creates millions of objects, and none of them can be
+        # garbage yet. Collecting while they are created is most of the
+        # load time.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            history = pickle.loads(data)
+        finally:
+            if gc_enabled:
+                gc.enable()
+    except FileNotFoundError:
+        debug(f'Cache miss (no cache file): {cachefile}')
+        return None, None
+    except Exception as ex:
+        debug_err(f'Cache miss (corrupt cache file): {cachefile}\n{ex}')
+        return None, None
+    if not isinstance(history, History):
+        debug_err(f'Cache miss (not a History): {cachefile}')
+        return None, None
+    return cached_key, history
+
+
+def same_source(key, cached_key):
+    """ Returns True if a snapshot saved with `cached_key` can be used as
+        the start of a History for `key` (same file and settings).
+        The file may have grown, appended lines are parsed later, but a
+        file with the same size and a different mtime was rewritten.
+    """
+    if not isinstance(cached_key, dict):
+        return False
+    rewritten = (key['size'] == cached_key.get('size', None)) and (
+        key['mtime'] != cached_key.get('mtime', None)
+    )
+    if rewritten:
+        return False
+    return all(
+        key[k] == cached_key.get(k, None)
+        for k in key
+        if k not in ('size', 'mtime')
+    )
+
+
+def save_history(history, cachefile=CACHEFILE):
+    """ Save a History snapshot to `cachefile`.
+        The file is written to a temporary file first, and then moved into
+        place, so a crash can't leave a half-written cache behind.
+    """
+    if not config.get('cache_history', True):
+        return False
+    key = cache_key(history)
+    tmpfile = f'{cachefile}.tmp'
+    try:
+        with open(tmpfile, 'wb') as f:
+            pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(
+                zlib.compress(
+                    pickle.dumps(history, protocol=pickle.HIGHEST_PROTOCOL),
+                    1,
+                )
+            )
+        os.replace(tmpfile, cachefile)
+    except OSError as ex:
+        debug_err(f'Unable to save cache file: {cachefile}\n{ex}')
+        return False
+    debug(f'Saved cache file: {cachefile}')
+    return True
@@ -45,6 +45,9 @@ SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
 SCRIPTDIR = os.path.abspath(sys.path[0])
 
 CONFIGFILE = os.path.join(SCRIPTDIR, 'wincnc-history.json')
+CACHEFILE = os.path.join(SCRIPTDIR, 'wincnc-history.cache')
+DBFILE = os.path.join(SCRIPTDIR, 'wincnc-history.db')
+OFFSETSFILE = os.path.join(SCRIPTDIR, 'wincnc-history.offsets')
 ICONFILE = os.path.join(
     SCRIPTDIR,
     'resources',
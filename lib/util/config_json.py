@@ -42,11 +42,15 @@ config_defaults = {
     'change_hours': 0,
     'theme': 'winnative' if OS == 'windows' else 'clam',
     'geometry': '1111x612+110+22',
+    'auto_refresh': False,
+    'auto_refresh_ms': 500,
     'bg_entry': '#F4F4F4',
     'bg_focus': '#DEDEDE',
     'bg_treeview': '#F4F4F4',
     'break_lunch': None,
     'break_morning': None,
+    'cache_history': True,
+    'offset_index': True,
     'fg_command': '#002050',
     'fg_error': '#5B0000',
     'fg_file': '#004C13',
@@ -57,6 +61,11 @@ config_defaults = {
     'font_entry': ['Consolas', 9] if OS == 'windows' else ['Monospace', 9],
     'font_treeview': ['Consolas', 9] if OS == 'windows' else ['Monospace', 9],
     'font_treeview_heading': ['Arial', 12],
+    'parse_workers': 1,
+    'parse_workers_min_mb': 64,
+    'recent_days': 0,
+    'recent_sessions': 0,
+    'release_closed_rows': True,
 }
 config_keys = set(config_defaults)
 config_keys.add('wincnc_file')
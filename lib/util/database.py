@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - Libraries - Database
+    SQLite storage for WinCNC.csv, imported incrementally, so a date range
+    can be loaded without parsing (or holding) the whole file.
+    -Christopher Welborn 05-23-2019
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+from .config import DBFILE
+from .debug import debug
+from .parser import (
+    FIELD_SEP,
+    History,
+    Session,
+    change_hours,
+    change_minutes,
+)
+
+# Bump this when the tables change, old databases are rebuilt.
+# Version 2: databases imported with a recent window are rebuilt.
+# Version 3: durations of a day or more were stored wrong.
+DB_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    start_time TEXT NOT NULL,
+    end_time TEXT,
+    duration INTEGER NOT NULL DEFAULT 0,
+    commands INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_start_time ON sessions (start_time);
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    type_code INTEGER NOT NULL,
+    error INTEGER NOT NULL,
+    fields TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS commands_session_id ON commands (session_id);
+CREATE INDEX IF NOT EXISTS commands_end_time ON commands (end_time);
+CREATE INDEX IF NOT EXISTS commands_filename ON commands (filename);
+"""
+
+
+def db_time(dt):
+    """ Convert a datetime into the (sortable) text stored in the database.
+    """
+    return None if dt is None else dt.isoformat(' ')
+
+
+def from_db_time(s):
+    """ Convert text from the database back into a datetime. """
+    return None if s is None else datetime.fromisoformat(s)
+
+
+class HistoryDB(object):
+    """ A SQLite database of Sessions and Commands from WinCNC.csv. """
+    def __init__(self, dbfile=DBFILE):
+        self.dbfile = dbfile
+        self.conn = sqlite3.connect(dbfile)
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+    def clear(self):
+        """ Remove all Sessions, Commands, and import state. """
+        with self.conn:
+            self.conn.execute('DELETE FROM commands')
+            self.conn.execute('DELETE FROM sessions')
+            self.conn.execute('DELETE FROM meta')
+
+    def close(self):
+        self.conn.close()
+
+    def count_sessions(self, start=None, end=None):
+        """ Return the number of Sessions started between `start` and `end`
+            (datetimes, either may be None).
+        """
+        where, params = self.where_start_time(start, end)
+        cur = self.conn.execute(
+            f'SELECT COUNT(*) FROM sessions {where}',
+            params,
+        )
+        return cur.fetchone()[0]
+
+    def get_meta(self, key, default=None):
+        cur = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,))
+        row = cur.fetchone()
+        return default if row is None else row[0]
+
+    def import_file(self, filepath):
+        """ Import new rows from a WinCNC.csv file.
+            Only lines appended since the last import are parsed. If the
+            file was replaced, or the time offsets changed, everything is
+            imported again.
+            Returns the number of Commands that were imported.
+        """
+        filepath = os.path.abspath(filepath)
+        source = (filepath, change_hours, change_minutes, DB_VERSION)
+        stored = (
+            self.get_meta('filepath'),
+            self.get_meta('change_hours'),
+            self.get_meta('change_minutes'),
+            self.get_meta('version'),
+        )
+        if stored != source:
+            self.clear()
+
+        # LazyCommands are enough here, most columns are only stored.
+        # The whole file is imported, whatever the recent window is.
+        history = History(filepath=filepath, lazy=True, days=0, sessions=0)
+        history.offset = self.get_meta('offset', 0)
+        history.signature = self.get_meta('signature', b'')
+        open_id = self.get_meta('open_session', None)
+        if open_id is not None:
+            # Lines for the open Session are appended to a placeholder.
+            start_time, = self.conn.execute(
+                'SELECT start_time FROM sessions WHERE id = ?',
+                (open_id, ),
+            ).fetchone()
+            history.session = Session(
+                [],
+                start_time=from_db_time(start_time),
+            )
+            history.append(history.session)
+
+        full = history.update()
+        count = 0
+        with self.conn:
+            if full:
+                debug(f'Importing all of: {filepath}')
+                for table in ('commands', 'sessions'):
+                    self.conn.execute(f'DELETE FROM {table}')
+                open_id = None
+            session_ids = []
+            for session in history:
+                if (open_id is not None) and not session_ids:
+                    # The placeholder is always first.
+                    session_id = open_id
+                    self.conn.execute(
+                        'UPDATE sessions SET end_time = ? WHERE id = ?',
+                        (db_time(session.end_time), session_id),
+                    )
+                else:
+                    session_id = self.conn.execute(
+                        ' '.join((
+                            'INSERT INTO sessions (start_time, end_time)',
+                            'VALUES (?, ?)',
+                        )),
+                        (
+                            db_time(session.start_time),
+                            db_time(session.end_time),
+                        ),
+                    ).lastrowid
+                session_ids.append(session_id)
+                self.conn.executemany(
+                    ' '.join((
+                        'INSERT INTO commands (',
+                        'session_id, start_time, end_time, filename,',
+                        'status, duration, type_code, error, fields',
+                        ') VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    )),
+                    (
+                        (
+                            session_id,
+                            db_time(cmd.start_time),
+                            db_time(cmd.end_time),
+                            cmd.filename,
+                            cmd.status,
+                            int(cmd.duration_delta.total_seconds()),
+                            cmd.type_code,
+                            cmd.is_error(),
+                            FIELD_SEP.join(cmd.raw_fields()),
+                        )
+                        for cmd in session
+                    ),
+                )
+                count += len(session)
+            self.update_sessions(session_ids)
+            if (history.session is not None) and session_ids:
+                open_id = session_ids[-1]
+            else:
+                open_id = None
+            self.set_meta(
+                filepath=filepath,
+                change_hours=change_hours,
+                change_minutes=change_minutes,
+                version=DB_VERSION,
+                offset=history.offset,
+                signature=history.signature,
+                open_session=open_id,
+            )
+        debug(f'Imported {count} commands into: {self.dbfile}')
+        return count
+
+    def load_history(self, start=None, end=None, lazy=False):
+        """ Load a History with the Sessions that were started between
+            `start` and `end` (datetimes, either may be None).
+        """
+        history = History(lazy=lazy, days=0, sessions=0)
+        where, params = self.where_start_time(start, end)
+        sessions = self.conn.execute(
+            ' '.join((
+                'SELECT id, start_time, end_time FROM sessions',
+                where,
+                'ORDER BY id',
+            )),
+            params,
+        ).fetchall()
+        if not sessions:
+            return history
+        # Commands for the whole range, in one query.
+        rows = {}
+        cur = self.conn.execute(
+            ' '.join((
+                'SELECT session_id, fields FROM commands',
+                'WHERE session_id IN',
+                '(SELECT id FROM sessions', where, ')',
+                'ORDER BY id',
+            )),
+            params,
+        )
+        for session_id, fields in cur:
+            rows.setdefault(session_id, []).append(fields.split(FIELD_SEP))
+
+        for session_id, start_time, end_time in sessions:
+            history.append(
+                Session(
+                    history.command_class.from_rows(rows.get(session_id, [])),
+                    start_time=from_db_time(start_time),
+                    end_time=from_db_time(end_time),
+                )
+            )
+        return history
+
+    def set_meta(self, **kwargs):
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            kwargs.items(),
+        )
+
+    def update_sessions(self, session_ids):
+        """ Recalculate the totals for Sessions, from their Commands. """
+        self.conn.executemany(
+            ' '.join((
+                'UPDATE sessions SET',
+                '(duration, commands, errors) = (',
+                'SELECT COALESCE(SUM(duration), 0), COUNT(*),',
+                'COALESCE(SUM(error), 0)',
+                'FROM commands WHERE session_id = sessions.id',
+                ') WHERE id = ?',
+            )),
+            ((session_id, ) for session_id in session_ids),
+        )
+
+    @staticmethod
+    def where_start_time(start=None, end=None):
+        """ Return a WHERE clause and parameters for Sessions started
+            between `start` and `end` (datetimes, either may be None).
+        """
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append('start_time >= ?')
+            params.append(db_time(start))
+        if end is not None:
+            conditions.append('start_time < ?')
+            params.append(db_time(end))
+        if not conditions:
+            return '', params
+        return f'WHERE {" AND ".join(conditions)}', params
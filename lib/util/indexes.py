@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - Libraries - Indexes
+    Sorted indexes over the Sessions/Commands in a History, for time-range
+    queries that don't have to look at every Command.
+    -Christopher Welborn 05-24-2019
+"""
+
+from bisect import (
+    bisect_left,
+    bisect_right,
+)
+from datetime import timedelta
+from itertools import accumulate
+
+
+def history_key(history):
+    """ Return a value that changes when Sessions/Commands are added to a
+        History, or the last Session ends. Used to tell when an index is
+        out of date.
+    """
+    if not history:
+        return (0, 0, None)
+    return (len(history), len(history.command_index), history[-1].end_time)
+
+
+class TimeIndex(object):
+    """ Prefix sums of Command run time and Session time (start to end),
+        ordered by start time. The totals for any time range are two
+        binary searches and a subtraction.
+    """
+    def __init__(self, history):
+        self.key = history_key(history)
+        commands = sorted(
+            (cmd.start_time, int(cmd.duration_delta.total_seconds()))
+            for session in history
+            for cmd in session
+        )
+        self.command_starts = [start for start, _ in commands]
+        self.command_sums = [0]
+        self.command_sums.extend(accumulate(secs for _, secs in commands))
+
+        sessions = sorted(
+            (
+                session.start_time,
+                int(session.actual_delta.total_seconds()),
+                int(session.actual_adjusted_delta.total_seconds()),
+            )
+            for session in history
+        )
+        self.session_starts = [start for start, _, _ in sessions]
+        self.session_sums = [0]
+        self.session_sums.extend(accumulate(secs for _, secs, _ in sessions))
+        # Session time without the configured breaks.
+        self.session_adjusted_sums = [0]
+        self.session_adjusted_sums.extend(
+            accumulate(secs for _, _, secs in sessions)
+        )
+
+    def is_current(self, history):
+        """ Returns True if this index is still up to date for `history`. """
+        return self.key == history_key(history)
+
+    def runtime(self, start=None, end=None):
+        """ Return a dict with the number of Commands/Sessions started
+            between `start` and `end` (datetimes, either may be None), the
+            total Command run time (`run_delta`), and the total Session time
+            (`session_delta`, start to end of each Session, and
+            `session_adjusted_delta` without the configured breaks).
+            `end` is not included in the range.
+        """
+        commands, run_secs = self.sum_range(
+            self.command_starts,
+            self.command_sums,
+            start,
+            end,
+        )
+        sessions, session_secs = self.sum_range(
+            self.session_starts,
+            self.session_sums,
+            start,
+            end,
+        )
+        _, adjusted_secs = self.sum_range(
+            self.session_starts,
+            self.session_adjusted_sums,
+            start,
+            end,
+        )
+        return {
+            'commands': commands,
+            'run_delta': timedelta(seconds=run_secs),
+            'sessions': sessions,
+            'session_delta': timedelta(seconds=session_secs),
+            'session_adjusted_delta': timedelta(seconds=adjusted_secs),
+        }
+
+    @staticmethod
+    def sum_range(starts, sums, start=None, end=None):
+        """ Return the number of items, and the sum of their values, for
+            items in `starts` (sorted) from `start` up to `end`.
+        """
+        i = 0 if start is None else bisect_left(starts, start)
+        j = len(starts) if end is None else bisect_left(starts, end)
+        if j <= i:
+            return 0, 0
+        return j - i, sums[j] - sums[i]
+
+
+class IntervalIndex(object):
+    """ (start, end, item) intervals sorted by start, with a tree of the
+        latest end time for each pair, each pair of pairs, and so on,
+        for "what was running at this time?" queries.
+        A query bisects the starts, and only walks down into the parts of
+        the tree that still reach the query time, so one long interval
+        doesn't make every query look at everything after it.
+    """
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.items = [item for _, _, item in intervals]
+        # Latest end times, level 0 is `self.ends`, and each level after
+        # that has the latest end for each pair in the level before it.
+        self.max_ends = [self.ends]
+        level = self.ends
+        while len(level) > 1:
+            pairs = list(map(max, level[0::2], level[1::2]))
+            if len(level) % 2:
+                pairs.append(level[-1])
+            self.max_ends.append(pairs)
+            level = pairs
+
+    def __len__(self):
+        return len(self.starts)
+
+    def at(self, when):
+        """ Return items for the intervals that contain `when`
+            (start <= when <= end), ordered by start.
+        """
+        return self.overlapping(when, when)
+
+    def overlapping(self, start, end):
+        """ Return items for the intervals that overlap `start` to `end`
+            (both included), ordered by start.
+        """
+        # Only intervals before this one start in time.
+        stop = bisect_right(self.starts, end)
+        found = []
+        if not stop:
+            return found
+        # (level, index) for tree nodes, left-most on top.
+        todo = [(len(self.max_ends) - 1, 0)]
+        while todo:
+            depth, i = todo.pop()
+            level = self.max_ends[depth]
+            if (i >= len(level)) or ((i << depth) >= stop):
+                # Past the end of the level, or nothing in here starts in
+                # time.
+                continue
+            if level[i] < start:
+                # Everything in here ended before `start`.
+                continue
+            if not depth:
+                found.append(self.items[i])
+                continue
+            todo.append((depth - 1, (i * 2) + 1))
+            todo.append((depth - 1, i * 2))
+        return found
+
+
+class HistoryIntervals(object):
+    """ IntervalIndexes for the Sessions and Commands in a History.
+        Session items are Sessions, Command items are (session, command)
+        tuples.
+    """
+    def __init__(self, history):
+        self.key = history_key(history)
+        self.sessions = IntervalIndex(
+            (session.start_time, session_end(session), session)
+            for session in history
+        )
+        self.commands = IntervalIndex(
+            (cmd.start_time, cmd.end_time, (session, cmd))
+            for session in history
+            for cmd in session
+        )
+
+    def is_current(self, history):
+        """ Returns True if these indexes are still up to date for
+            `history`.
+        """
+        return self.key == history_key(history)
+
+
+def session_end(session):
+    """ Return the end time for a Session. A Session that hasn't ended yet
+        ends with its last Command (or its start, with no Commands).
+    """
+    if session.end_time is not None:
+        return session.end_time
+    if session:
+        return max(session.start_time, session[-1].end_time)
+    return session.start_time
+
+
+class FileStats(object):
+    """ Running totals for every Command with the same file name. """
+    __slots__ = (
+        'filename', 'type_code', 'count', 'errors', 'total_secs',
+        'rapid_secs', 'feed_secs', 'laser_secs', 'min_secs', 'max_secs',
+        'last_time',
+    )
+
+    def __init__(self, filename, type_code):
+        self.filename = filename
+        self.type_code = type_code
+        self.count = 0
+        self.errors = 0
+        self.total_secs = 0
+        self.rapid_secs = 0
+        self.feed_secs = 0
+        self.laser_secs = 0
+        self.min_secs = None
+        self.max_secs = None
+        # End time for the latest run.
+        self.last_time = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return ''.join((
+            f'{type(self).__name__}(',
+            f'{self.filename!r}, count={self.count}, ',
+            f'total_secs={self.total_secs}, errors={self.errors})',
+        ))
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def add(self, command):
+        """ Add the run time/status for one Command. """
+        rapid = int(command.rapid_delta.total_seconds())
+        feed = int(command.feed_delta.total_seconds())
+        laser = int(command.laser_delta.total_seconds())
+        secs = rapid + feed + laser
+        self.count += 1
+        self.total_secs += secs
+        self.rapid_secs += rapid
+        self.feed_secs += feed
+        self.laser_secs += laser
+        if (self.min_secs is None) or (secs < self.min_secs):
+            self.min_secs = secs
+        if (self.max_secs is None) or (secs > self.max_secs):
+            self.max_secs = secs
+        if command.is_error():
+            self.errors += 1
+        if (self.last_time is None) or (command.end_time > self.last_time):
+            self.last_time = command.end_time
+
+    @property
+    def error_rate(self):
+        """ Fraction of runs that ended with an error (0.0-1.0). """
+        return (self.errors / self.count) if self.count else 0.0
+
+    @property
+    def feed_delta(self):
+        return timedelta(seconds=self.feed_secs)
+
+    @property
+    def laser_delta(self):
+        return timedelta(seconds=self.laser_secs)
+
+    @property
+    def max_delta(self):
+        return timedelta(seconds=self.max_secs or 0)
+
+    @property
+    def mean_delta(self):
+        if not self.count:
+            return timedelta()
+        return timedelta(seconds=self.total_secs // self.count)
+
+    @property
+    def min_delta(self):
+        return timedelta(seconds=self.min_secs or 0)
+
+    @property
+    def rapid_delta(self):
+        return timedelta(seconds=self.rapid_secs)
+
+    @property
+    def total_delta(self):
+        return timedelta(seconds=self.total_secs)
+
+
+class FileIndex(object):
+    """ FileStats by file name, kept up to date as Commands are parsed, so
+        per-file reports never have to look at every Command.
+    """
+    # Sort keys for `self.sorted()`, and the FileStats value they use.
+    sort_keys = {
+        'count': lambda stats: stats.count,
+        'errors': lambda stats: stats.error_rate,
+        'feed': lambda stats: stats.feed_secs,
+        'last': lambda stats: stats.last_time,
+        'max': lambda stats: stats.max_secs or 0,
+        'mean': lambda stats: stats.total_secs / (stats.count or 1),
+        'min': lambda stats: stats.min_secs or 0,
+        'name': lambda stats: stats.filename,
+        'rapid': lambda stats: stats.rapid_secs,
+        'total': lambda stats: stats.total_secs,
+    }
+
+    def __init__(self, commands=None):
+        self.files = {}
+        self.extend(commands or ())
+
+    def __bool__(self):
+        return bool(self.files)
+
+    def __contains__(self, filename):
+        return filename in self.files
+
+    def __getitem__(self, filename):
+        return self.files[filename]
+
+    def __iter__(self):
+        return iter(self.files.values())
+
+    def __len__(self):
+        return len(self.files)
+
+    def add(self, command):
+        """ Add one Command to the stats for its file name. """
+        stats = self.files.get(command.filename, None)
+        if stats is None:
+            stats = FileStats(command.filename, command.type_code)
+            self.files[command.filename] = stats
+        stats.add(command)
+
+    def clear(self):
+        self.files.clear()
+
+    def extend(self, commands):
+        """ Add several Commands. """
+        for command in commands:
+            self.add(command)
+
+    def sorted(self, key='total', reverse=None, type_codes=None):
+        """ Return a list of FileStats, sorted by one of `self.sort_keys`.
+            Names sort A-Z by default, everything else sorts largest first.
+            If `type_codes` is given, only files with one of those
+            Command.type_code values are included.
+        """
+        try:
+            keyfunc = self.sort_keys[key]
+        except KeyError:
+            keys = ', '.join(sorted(self.sort_keys))
+            raise ValueError(f'Expecting one of: {keys}, got: {key!r}')
+        if reverse is None:
+            reverse = key != 'name'
+        stats = (
+            self.files.values()
+            if type_codes is None
+            else (s for s in self.files.values() if s.type_code in type_codes)
+        )
+        # Ties are broken by name, so the order is stable between reports.
+        stats = sorted(stats, key=lambda s: s.filename)
+        return sorted(stats, key=keyfunc, reverse=reverse)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - Libraries - Loader
+    Parses a History in a background thread, so the GUI can keep drawing.
+    Progress and the result are handed back through a queue, which the GUI
+    polls from its own thread.
+    -Christopher Welborn 05-28-2019
+"""
+
+import queue
+import threading
+
+from .debug import debug
+from .parser import LoadCancelled
+
+
+class HistoryLoader(threading.Thread):
+    """ Runs `func(*args, progress=callback, **kwargs)` in a thread.
+        `func` is something that parses a History (`load_history`,
+        `History.update`), and the callback raises LoadCancelled once
+        `self.cancel()` has been called.
+        Messages put on `self.queue`:
+            ('progress', (bytes_done, bytes_total))
+            ('done', result)
+            ('error', exception)
+            ('cancelled', None)
+    """
+    def __init__(self, func, *args, **kwargs):
+        super().__init__(daemon=True)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.queue = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """ Stop parsing at the next block. """
+        self.cancelled.set()
+
+    def messages(self):
+        """ Yield all of the messages that are waiting, without blocking.
+        """
+        while True:
+            try:
+                yield self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def progress(self, done, total):
+        """ Progress callback for `self.func`, running in this thread. """
+        if self.cancelled.is_set():
+            raise LoadCancelled()
+        self.queue.put(('progress', (done, total)))
+
+    def run(self):
+        try:
+            result = self.func(
+                *self.args,
+                progress=self.progress,
+                **self.kwargs
+            )
+        except LoadCancelled:
+            debug('History loading was cancelled.')
+            self.queue.put(('cancelled', None))
+        except Exception as ex:
+            self.queue.put(('error', ex))
+        else:
+            self.queue.put(('done', result))
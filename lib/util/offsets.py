@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - Libraries - Offsets
+    Sidecar index of the byte offset and start time for every Session in
+    WinCNC.csv, so a date range can be parsed without reading the rest of
+    the file. The index is appended to as the file grows, and rebuilt if
+    the file is replaced.
+    -Christopher Welborn 05-27-2019
+"""
+
+import json
+import os
+import zlib
+from bisect import (
+    bisect_left,
+    bisect_right,
+)
+from datetime import datetime
+
+from .config import (
+    OFFSETSFILE,
+    config,
+)
+from .debug import (
+    debug,
+    debug_err,
+)
+from .parser import (
+    BLOCK_SIZE,
+    FILE_ENCODING,
+    SESSION_START,
+    SIGNATURE_SIZE,
+    History,
+    change_hours,
+    change_minutes,
+    parse_workers_min_mb,
+    read_session_start,
+    row_complete,
+)
+
+# Bump this when the index file format changes, old ones are rebuilt.
+OFFSETS_VERSION = 1
+# The header line is padded to at least this size, so it can be rewritten
+# in place before new records are appended.
+HEADER_SIZE = 256
+
+
+def load_history_range(
+        filepath, start=None, end=None, at=None, lazy=False, workers=None,
+        indexfile=OFFSETSFILE):
+    """ Parse only the Sessions started between `start` and `end`
+        (datetimes, either may be None, `end` is not included), or only the
+        Session that was open at `at` (a datetime), into a new History.
+        The session offset index is used to find the bytes to parse, and
+        to split large ranges between worker processes.
+    """
+    index = SessionOffsets.load(filepath, indexfile=indexfile)
+    if at is None:
+        lo, hi = index.range(start=start, end=end)
+    else:
+        lo, hi = index.range_at(at)
+    history = History(
+        filepath=filepath,
+        lazy=lazy,
+        workers=workers,
+        days=0,
+        sessions=0,
+    )
+    with open(filepath, 'rb') as f:
+        history.signature = f.read(SIGNATURE_SIZE)
+        size = os.fstat(f.fileno()).st_size
+        if hi is None:
+            hi = size
+        history.offset = history.start_offset = lo
+        min_size = parse_workers_min_mb * 1024 * 1024
+        if (history.workers > 1) and ((hi - lo) >= min_size):
+            bounds = index.split(lo, hi, history.workers)
+            history.parse_parallel(f, hi, bounds=bounds)
+        else:
+            f.seek(lo)
+            history.parse_rows(history.iter_rows(f, end=hi))
+    if hi < size:
+        # The next Session (not loaded) closes the last one.
+        history.close_session()
+    debug(f'Parsed bytes {lo}-{hi} of {size}: {filepath}')
+    return history
+
+
+def signature_crc(signature):
+    """ Return a checksum for the first bytes of a file. """
+    return zlib.crc32(signature)
+
+
+class SessionOffsets(object):
+    """ Byte offsets and start times for the Sessions in a WinCNC.csv file,
+        in file order, saved in a sidecar file.
+    """
+    def __init__(self, filepath, indexfile=OFFSETSFILE):
+        self.filepath = filepath
+        self.indexfile = indexfile
+        # Byte offset of each "Starting" line, and its start time.
+        self.offsets = []
+        self.starts = []
+        # Byte offset just past the last complete line that was scanned.
+        self.scanned = 0
+        # File size/mtime, and first bytes, when it was last scanned.
+        self.size = 0
+        self.mtime = None
+        self.signature_len = 0
+        self.signature_crc = 0
+        # Number of records already in the index file, the rest are new.
+        self.saved = 0
+        # Size of the header line in the index file.
+        self.header_size = 0
+        # Whether the start times are in order (they should be), so they
+        # can be searched with bisect.
+        self.ordered = True
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, offset, start_time):
+        """ Add a Session's byte offset and start time. """
+        if self.starts and (start_time < self.starts[-1]):
+            self.ordered = False
+        self.offsets.append(offset)
+        self.starts.append(start_time)
+
+    def header(self):
+        """ Return a dict identifying the file/settings this index is for,
+            and how much of the file was scanned.
+        """
+        return {
+            'version': OFFSETS_VERSION,
+            'path': os.path.abspath(self.filepath),
+            'change_hours': change_hours,
+            'change_minutes': change_minutes,
+            'signature_len': self.signature_len,
+            'signature_crc': self.signature_crc,
+            'size': self.size,
+            'mtime': self.mtime,
+            'scanned': self.scanned,
+        }
+
+    def is_source(self, header):
+        """ Returns True if an index file `header` was saved for the same
+            file path, settings, and index version as this one.
+        """
+        mine = self.header()
+        return all(
+            header.get(k, None) == mine[k]
+            for k in ('version', 'path', 'change_hours', 'change_minutes')
+        )
+
+    @classmethod
+    def load(cls, filepath, indexfile=OFFSETSFILE):
+        """ Load the index for `filepath` from `indexfile`, scan any lines
+            that were appended since it was saved, and save it again.
+            A missing, stale, or corrupt index is rebuilt from scratch.
+        """
+        index = cls(filepath, indexfile=indexfile)
+        if config.get('offset_index', True):
+            index.read()
+        header = index.header()
+        index.update()
+        if (index.header() != header) or (index.saved != len(index)):
+            index.save()
+        return index
+
+    def range(self, start=None, end=None):
+        """ Return (lo, hi) byte offsets for the Sessions started between
+            `start` and `end` (datetimes, either may be None, `end` is not
+            included). `hi` is None for the end of the file.
+        """
+        count = len(self.offsets)
+        if self.ordered:
+            i = 0 if start is None else bisect_left(self.starts, start)
+            j = count if end is None else bisect_left(self.starts, end)
+        else:
+            found = [
+                i
+                for i, when in enumerate(self.starts)
+                if ((start is None) or (when >= start)) and
+                ((end is None) or (when < end))
+            ]
+            i, j = (found[0], found[-1] + 1) if found else (count, count)
+        if i >= j:
+            # Nothing in range.
+            return self.scanned, self.scanned
+        return self.offsets[i], self.offsets[j] if j < count else None
+
+    def range_at(self, when):
+        """ Return (lo, hi) byte offsets for the last Session that started
+            at or before `when` (a datetime). `hi` is None for the end of
+            the file.
+        """
+        if self.ordered:
+            i = bisect_right(self.starts, when) - 1
+        else:
+            found = [i for i, start in enumerate(self.starts) if start <= when]
+            i = found[-1] if found else -1
+        if i < 0:
+            return self.scanned, self.scanned
+        j = i + 1
+        return self.offsets[i], self.offsets[j] if j < len(self) else None
+
+    def read(self):
+        """ Read the index file. Returns True if it was usable, otherwise
+            this index is left empty.
+        """
+        try:
+            with open(self.indexfile, 'r', encoding='ascii') as f:
+                headerline = f.readline()
+                header = json.loads(headerline)
+                if not self.is_source(header):
+                    debug(f'Offset index is stale: {self.indexfile}')
+                    return False
+                for line in f:
+                    offset, _, start = line.rstrip('\n').partition(',')
+                    self.add(int(offset), datetime.fromisoformat(start))
+        except FileNotFoundError:
+            debug(f'No offset index: {self.indexfile}')
+            return False
+        except (OSError, ValueError) as ex:
+            debug_err(f'Corrupt offset index: {self.indexfile}\n{ex}')
+            self.reset()
+            return False
+        self.scanned = header['scanned']
+        self.size = header['size']
+        self.mtime = header['mtime']
+        self.signature_len = header['signature_len']
+        self.signature_crc = header['signature_crc']
+        self.saved = len(self)
+        self.header_size = len(headerline)
+        return True
+
+    def reset(self):
+        """ Forget all offsets, so the next update scans the whole file. """
+        self.offsets.clear()
+        self.starts.clear()
+        self.scanned = 0
+        self.size = 0
+        self.mtime = None
+        self.signature_len = 0
+        self.signature_crc = 0
+        self.saved = 0
+        self.header_size = 0
+        self.ordered = True
+
+    def save(self):
+        """ Write new records to the index file. The header is rewritten in
+            place, and only the new records are appended, unless the index
+            was rebuilt or the header no longer fits in its old line.
+        """
+        if not config.get('offset_index', True):
+            return False
+        header = json.dumps(self.header())
+        header = f'{header:<{HEADER_SIZE - 1}}\n'
+        inplace = self.saved and (len(header) <= self.header_size)
+        if inplace:
+            # Same size as the old header line, so no records are touched.
+            header = f'{header.rstrip():<{self.header_size - 1}}\n'
+        first = self.saved if inplace else 0
+        records = ''.join(
+            f'{offset},{start.isoformat(" ")}\n'
+            for offset, start in zip(
+                self.offsets[first:],
+                self.starts[first:],
+            )
+        )
+        try:
+            if inplace:
+                with open(self.indexfile, 'r+', encoding='ascii') as f:
+                    f.write(header)
+                    f.seek(0, os.SEEK_END)
+                    f.write(records)
+            else:
+                with open(self.indexfile, 'w', encoding='ascii') as f:
+                    f.write(header)
+                    f.write(records)
+        except OSError as ex:
+            debug_err(f'Unable to save offset index: {self.indexfile}\n{ex}')
+            return False
+        self.saved = len(self)
+        self.header_size = len(header)
+        return True
+
+    def scan(self, f, size):
+        """ Find "Starting" lines from `self.scanned` up to the last complete
+            line (see `row_complete()`) before `size`, in a binary WinCNC.csv
+            file object.
+            Returns a list of byte offsets.
+        """
+        f.seek(max(self.scanned - 1, 0))
+        pos = f.tell()
+        # The start of the file is the start of a line.
+        tail = b'' if pos else b'\n'
+        found = []
+        lastline = self.scanned
+        while pos < size:
+            block = f.read(min(BLOCK_SIZE, size - pos))
+            if not block:
+                break
+            data = tail + block
+            base = pos - len(tail)
+            for match in SESSION_START.finditer(data):
+                offset = base + match.start() + 1
+                # Matches in the tail were found with the last block.
+                if (not found) or (offset > found[-1]):
+                    found.append(offset)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                lastline = pos + newline + 1
+            # Keep enough bytes to match across blocks.
+            tail = data[-(len(SESSION_START.pattern) - 1):]
+            pos += len(block)
+        if 0 < (size - lastline) <= BLOCK_SIZE:
+            # A last line with no newline counts if it is a complete row.
+            f.seek(lastline)
+            line = f.read(size - lastline).decode(
+                FILE_ENCODING,
+                errors='replace',
+            )
+            if row_complete(line.rstrip('\r').split(',')):
+                lastline = size
+        self.scanned = lastline
+        # Lines that haven't been finished yet are scanned next time.
+        return [offset for offset in found if offset < lastline]
+
+    def split(self, lo, hi, parts):
+        """ Return byte offsets splitting `lo` to `hi` into (up to) `parts`
+            ranges of about the same size, at Session starts.
+        """
+        bounds = [lo]
+        for i in range(1, parts):
+            target = lo + ((hi - lo) * i // parts)
+            j = bisect_left(self.offsets, target)
+            if (j < len(self.offsets)) and (bounds[-1] < self.offsets[j] < hi):
+                bounds.append(self.offsets[j])
+        bounds.append(hi)
+        return bounds
+
+    def update(self):
+        """ Scan any lines appended to the file since the last scan. If the
+            file was replaced, truncated, or rewritten, everything is
+            scanned again.
+            Returns True if the whole file was scanned.
+        """
+        with open(self.filepath, 'rb') as f:
+            st = os.fstat(f.fileno())
+            signature = f.read(SIGNATURE_SIZE)
+            full = (
+                (not self.scanned) or
+                (st.st_size < self.size) or
+                ((st.st_size == self.size) and (st.st_mtime != self.mtime)) or
+                (len(signature) < self.signature_len) or
+                (
+                    signature_crc(signature[:self.signature_len]) !=
+                    self.signature_crc
+                ) or
+                not self.still_valid(f)
+            )
+            if full:
+                self.reset()
+            self.signature_len = len(signature)
+            self.signature_crc = signature_crc(signature)
+            self.size = st.st_size
+            self.mtime = st.st_mtime
+            if self.scanned >= st.st_size:
+                return full
+            for offset in self.scan(f, st.st_size):
+                start_time = read_session_start(f, offset)
+                if start_time is not None:
+                    self.add(offset, start_time)
+        if full:
+            debug(f'Rebuilt offset index ({len(self)} sessions).')
+        return full
+
+    def still_valid(self, f):
+        """ Returns True if the last indexed offset is still the start of a
+            "Starting" line in the binary file object `f`.
+        """
+        if not self.offsets:
+            return True
+        return read_session_start(f, self.offsets[-1]) == self.starts[-1]
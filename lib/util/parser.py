@@ -4,29 +4,265 @@
     -Christopher Welborn 04-25-2019
 """
 import csv
+import locale
+import os
+import re
 from collections import UserList
+from concurrent.futures import ProcessPoolExecutor
 from datetime import (
     datetime,
     timedelta,
 )
+from functools import lru_cache
+from itertools import repeat
+from sys import intern
 
 from colr import Colr as C
 
+from .breaks import break_schedule
 from .config import config
+from .indexes import (
+    FileIndex,
+    HistoryIntervals,
+    TimeIndex,
+)
 
 
 change_hours = int(config.get('change_hours', 0) or 0)
 change_minutes = int(config.get('change_minutes', 0) or 0)
+change_delta = timedelta(hours=change_hours, minutes=change_minutes)
+# Worker processes for parsing large files (1 means no workers, 0 means
+# one per CPU), and the minimum file size (in MB) before they are used.
+# Workers are opt-in, the gain hasn't been measured yet.
+parse_workers = config.get('parse_workers', 1) or os.cpu_count() or 1
+parse_workers_min_mb = config.get('parse_workers_min_mb', 64)
+# Only load Sessions from the last few days of the file, and/or the last
+# few Sessions (0 means no limit). Older Sessions are loaded on demand.
+recent_days = config.get('recent_days', 0) or 0
+recent_sessions = config.get('recent_sessions', 0) or 0
+
+# Separator for the packed raw fields in LazyCommand. The csv module will
+# not accept NUL characters, so it can never be part of a field.
+FIELD_SEP = '\0'
+# Number of Command rows to build at a time.
+BATCH_SIZE = 512
+# Bytes to read at a time when parsing WinCNC.csv.
+BLOCK_SIZE = 1024 * 1024
+# Encoding for WinCNC.csv, the same one that `open()` would use.
+FILE_ENCODING = locale.getpreferredencoding(False)
+# First fields (lowercased) that mark a row as a header/session marker.
+MARKERS = ('file name', 'starting', 'exiting')
+# Finds the start of a "Starting" line in raw bytes (the match includes the
+# newline before it).
+SESSION_START = re.compile(rb'\nstarting', re.IGNORECASE)
+# Bytes from the start of WinCNC.csv used to detect a replaced file.
+SIGNATURE_SIZE = 512
+# Last field of a complete marker row (date), or Command row (ATC time),
+# for a last line that has no newline (see `row_complete()`).
+MARKER_ROW_END = re.compile(r'^\d{2}-\d{2}-\d{2}$')
+COMMAND_ROW_END = re.compile(r'^\d+:\d{2}$')
+
+# Date formats accepted from the user (see `parse_user_date()`).
+USER_DATE_FORMATS = ('%Y-%m-%d', '%m-%d-%y')
+# Date/time formats accepted from the user (see `parse_user_datetime()`).
+USER_DATETIME_FORMATS = (
+    '%m-%d-%y %H:%M:%S',
+    '%m-%d-%y %H:%M',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+)
+
+# Command.type_code values, and their names/Treeview tags.
+TYPE_COMMAND = 0
+TYPE_COMMAND_FILE = 1
+TYPE_USER_FILE = 2
+command_types = ('command', 'command file', 'user file')
+treeview_type_tags = ('command', 'file_command', 'file')
+
+
+def find_session_start(f, offset):
+    """ Return the byte offset of the first "Starting" line at or after
+        `offset` in a binary WinCNC.csv file object, or the end of the file
+        if there are no more sessions.
+    """
+    f.seek(max(offset - 1, 0))
+    pos = f.tell()
+    # The start of the file is the start of a line.
+    tail = b'' if pos else b'\n'
+    while True:
+        block = f.read(BLOCK_SIZE)
+        if not block:
+            return pos
+        data = tail + block
+        match = SESSION_START.search(data)
+        if match is not None:
+            return pos - len(tail) + match.start() + 1
+        # Keep enough bytes to match across blocks.
+        tail = data[-(len(SESSION_START.pattern) - 1):]
+        pos += len(block)
+
+
+def find_recent_start(f, end, days=0, sessions=0):
+    """ Return the byte offset of the oldest "Starting" line to load in a
+        binary WinCNC.csv file object, reading backwards in blocks from
+        byte offset `end`. Scanning stops at the `sessions`-th Session
+        before `end`, or the first Session started before the last `days`
+        days (counting the day of the newest Session before `end`),
+        whichever comes first. Zero/None means no limit.
+        Returns 0 if the whole file before `end` is needed.
+    """
+    if not (days or sessions):
+        return 0
+    cutoff = None
+    found = 0
+    newer = end
+    pos = end
+    # Bytes after the current block, kept to match across blocks.
+    head = b''
+    while pos > 0:
+        size = min(BLOCK_SIZE, pos)
+        pos -= size
+        f.seek(pos)
+        data = f.read(size) + head
+        if not pos:
+            # The start of the file is the start of a line.
+            data = b'\n' + data
+        starts = [
+            match.start() + 1 - (0 if pos else 1) + pos
+            for match in SESSION_START.finditer(data)
+        ]
+        for offset in reversed(starts):
+            if offset >= newer:
+                # Already seen at the end of the last block.
+                continue
+            if days:
+                start_time = read_session_start(f, offset)
+                if start_time is None:
+                    continue
+                if cutoff is None:
+                    cutoff = start_time.replace(
+                        hour=0,
+                        minute=0,
+                        second=0,
+                    ) - timedelta(days=days - 1)
+                elif start_time < cutoff:
+                    return newer
+            found += 1
+            newer = offset
+            if sessions and (found >= sessions):
+                return offset
+        head = data[:len(SESSION_START.pattern) - 1]
+        if not pos:
+            break
+    return 0
+
+
+@lru_cache(maxsize=None)
+def parse_clock(s):
+    """ Parse a zero-padded time in the form 'hh:mm:ss' into a timedelta
+        since midnight. Returns None if `s` is not in that exact form.
+        Results are cached, there are only 86400 of them.
+    """
+    if (len(s) != 8) or (s[2] != ':') or (s[5] != ':'):
+        return None
+    if not f'{s[:2]}{s[3:5]}{s[6:]}'.isdigit():
+        return None
+    hours, mins, secs = int(s[:2]), int(s[3:5]), int(s[6:])
+    if (hours > 23) or (mins > 59) or (secs > 59):
+        return None
+    return timedelta(hours=hours, minutes=mins, seconds=secs)
+
+
+@lru_cache(maxsize=None)
+def parse_date(s):
+    """ Parse a zero-padded date in the form 'mm-dd-yy' into a datetime
+        at midnight, with `change_hours`/`change_minutes` already applied.
+        Returns None if `s` is not a valid date in that exact form.
+        Results are cached, most dates are shared by many Commands.
+    """
+    if (len(s) != 8) or (s[2] != '-') or (s[5] != '-'):
+        return None
+    if not f'{s[:2]}{s[3:5]}{s[6:]}'.isdigit():
+        return None
+    year = int(s[6:])
+    # Same century rule as strptime's %y.
+    year += 1900 if year > 68 else 2000
+    try:
+        dt = datetime(year, int(s[:2]), int(s[3:5]))
+    except ValueError:
+        return None
+    return dt + change_delta
 
 
 def parse_datetime(s):
-    """ Parse a datetime in the form 'm-d-y h:m:s'. """
+    """ Parse a datetime in the form 'm-d-y h:m:s'.
+        The zero-padded form that WinCNC writes is sliced apart with the
+        cached `parse_date()`/`parse_clock()`, anything else falls back to
+        `strptime`.
+    """
+    if (len(s) == 17) and (s[8] == ' '):
+        date = parse_date(s[:8])
+        if date is not None:
+            clock = parse_clock(s[9:])
+            if clock is not None:
+                return date + clock
     dt = datetime.strptime(s, '%m-%d-%y %H:%M:%S')
     if change_hours or change_minutes:
-        dt = dt + timedelta(hours=change_hours, minutes=change_minutes)
+        dt = dt + change_delta
     return dt
 
 
+def parse_range(filepath, start, end, lazy=False):
+    """ Parse bytes `start` to `end` of a WinCNC.csv file into a new
+        History. `start` should be the start of a "Starting" line (or 0).
+        This is what the worker processes run for `History.parse_parallel()`.
+    """
+    history = History(
+        filepath=filepath,
+        lazy=lazy,
+        workers=1,
+        days=0,
+        sessions=0,
+    )
+    history.offset = start
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        history.parse_rows(history.iter_rows(f, end=end))
+    return history
+
+
+def read_session_start(f, offset):
+    """ Return the start time from the "Starting" line at byte `offset` in
+        a binary WinCNC.csv file object, or None if it can't be parsed.
+    """
+    f.seek(offset)
+    line = f.readline().decode(FILE_ENCODING, errors='replace')
+    row = line.split(',')
+    try:
+        return parse_datetime(f'{row[2].strip()} {row[1].strip()}')
+    except (IndexError, ValueError):
+        return None
+
+
+def row_complete(row):
+    """ Returns True if a split csv row from a line with no newline (the
+        end of the file) is complete, and not still being written.
+        Marker rows need all 3 fields and a whole date, Command rows need
+        all of their fields and a whole last time.
+    """
+    if not row:
+        return False
+    marker = row[0][:9].lower()
+    if marker.startswith('file name'):
+        # Headers are skipped anyway.
+        return True
+    if marker.startswith(MARKERS):
+        return (len(row) == 3) and bool(MARKER_ROW_END.match(row[2].strip()))
+    return (len(row) == Command.row_len) and bool(
+        COMMAND_ROW_END.match(row[-1].strip())
+    )
+
+
 def parse_int(s):
     """ Try to parse a string into an integer. """
     try:
@@ -43,14 +279,45 @@ def parse_time(s):
     return datetime.strptime(s, '%H:%M:%S')
 
 
+@lru_cache(maxsize=8192)
 def parse_timedelta(durstr):
     """ Convert a string like '01:29' (1 minute and 29 seconds)
         into a `datetime.timedelta`.
+        Results are cached, the same durations show up over and over.
     """
     mins, secs = (int(s) for s in durstr.split(':'))
     return timedelta(minutes=mins, seconds=secs)
 
 
+def parse_user_date(s):
+    """ Parse a date typed in by the user, in the form 'yyyy-mm-dd' or
+        'mm-dd-yy'. Raises ValueError for anything else.
+    """
+    s = s.strip()
+    for fmt in USER_DATE_FORMATS:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'Expecting yyyy-mm-dd or mm-dd-yy, got: {s!r}')
+
+
+def parse_user_datetime(s):
+    """ Parse a date and time typed in by the user, in the form
+        'mm-dd-yy hh:mm[:ss]' or 'yyyy-mm-dd hh:mm[:ss]'.
+        Raises ValueError for anything else.
+    """
+    s = ' '.join(s.split())
+    for fmt in USER_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    raise ValueError(
+        f'Expecting mm-dd-yy hh:mm or yyyy-mm-dd hh:mm, got: {s!r}'
+    )
+
+
 def time_str(dt, human=False, time_only=False):
     """ Use strftime to format a datetime. """
     if dt is None:
@@ -93,82 +360,561 @@ def timedelta_str(delta, short=False):
     return f'{secs} {plurals}'
 
 
+class LoadCancelled(Exception):
+    """ Raised by a progress callback to stop parsing. Everything parsed
+        before it was raised is kept, so a later update picks up where it
+        stopped.
+    """
+    pass
+
+
 class History(UserList):
     """ A collection of Sessions. """
+    def __init__(
+            self, iterable=None, filepath=None, lazy=False, workers=None,
+            days=None, sessions=None):
+        super().__init__(iterable)
+        # Command class for new rows, LazyCommand only parses what the
+        # session tree needs until other columns are used.
+        self.command_class = LazyCommand if lazy else Command
+        # Worker processes for a full parse of a large file.
+        self.workers = parse_workers if workers is None else workers
+        # File that this History is parsed from, used by `self.update()`.
+        self.filepath = filepath
+        # Byte offset just past the last complete line that was parsed.
+        self.offset = 0
+        # Recent window for a full parse (see `find_recent_start()`), and
+        # the byte offset where the parsed Sessions start. Anything before
+        # that can be loaded with `self.load_older()`.
+        self.days = recent_days if days is None else days
+        self.sessions = recent_sessions if sessions is None else sessions
+        self.start_offset = 0
+        # First few bytes of the file, used to detect a replaced file.
+        self.signature = b''
+        # The last Session, while it is still waiting for an "Exiting" line.
+        self.session = None
+        # Sessions and Commands by id, ids are given out in parse order.
+        # Sessions from `iterable` (a slice/copy of another History) keep
+        # the ids they already have.
+        self.session_index = {}
+        self.command_index = {}
+        self.rebuild_indexes()
+        # Next ids to give out. Released Sessions (see `self.release()`)
+        # keep their ids, so these can be more than the index sizes.
+        self.next_session_id = len(self.session_index)
+        self.next_command_id = len(self.command_index)
+        # FileStats by file name, updated as Commands are added.
+        self.file_index = FileIndex(
+            cmd
+            for session in self
+            for cmd in session
+        )
+        # TimeIndex for runtime queries, see `self.get_time_index()`.
+        self.time_index = None
+        # HistoryIntervals for "running at" queries, see `get_intervals()`.
+        self.intervals = None
+
     def __bool__(self):
         return bool(self.data)
 
     def __colr__(self):
         return C('\n').join(C(ses) for ses in self)
 
+    def __getstate__(self):
+        """ Pickle without the indexes, the id indexes are rebuilt from
+            the Sessions/Commands (which keep their ids).
+            The file index is small, and is kept.
+        """
+        state = self.__dict__.copy()
+        del state['session_index']
+        del state['command_index']
+        del state['time_index']
+        del state['intervals']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rebuild_indexes()
+        self.time_index = None
+        self.intervals = None
+
+    def add_commands(self, commands):
+        """ Give new Commands an id, and add them to the open Session. """
+        index = self.command_index
+        cmdid = self.next_command_id
+        for cmd in commands:
+            cmd.id = cmdid
+            index[cmdid] = cmd
+            cmdid += 1
+        self.next_command_id = cmdid
+        self.session.extend(commands)
+        self.file_index.extend(commands)
+
+    def append(self, session):
+        """ Add a Session, giving it (and its Commands) an id. """
+        session.id = self.next_session_id
+        self.next_session_id += 1
+        self.session_index[session.id] = session
+        index = self.command_index
+        cmdid = self.next_command_id
+        for cmd in session:
+            cmd.id = cmdid
+            index[cmdid] = cmd
+            cmdid += 1
+        self.next_command_id = cmdid
+        self.file_index.extend(session)
+        self.data.append(session)
+
+    def commands_at(self, when):
+        """ Return (session, command) tuples for Commands that were running
+            at `when` (a datetime).
+        """
+        return self.get_intervals().commands.at(when)
+
+    def commands_between(self, start, end):
+        """ Return (session, command) tuples for Commands that were running
+            at any time from `start` to `end` (datetimes).
+        """
+        return self.get_intervals().commands.overlapping(start, end)
+
+    def close_session(self):
+        """ Stop adding Commands to the currently open Session, if any.
+            Sessions keep their own totals up to date, so there is nothing
+            to recalculate.
+        """
+        self.session = None
+
     @classmethod
-    def from_file(cls, filepath):
+    def from_file(
+            cls, filepath, lazy=False, workers=None, days=None,
+            sessions=None, progress=None):
         """ Parse a WinCNC.csv file and return an initialized History
             instance.
+            If `lazy` is truthy, LazyCommands are used.
+            Files of `parse_workers_min_mb` or more are parsed with
+            `workers` processes (default: `parse_workers`).
+            Only the last `days` days/`sessions` Sessions are parsed
+            (default: `recent_days`/`recent_sessions`, 0 means all of them).
+            `progress` is passed to `History.update()`.
+        """
+        history = cls(
+            filepath=filepath,
+            lazy=lazy,
+            workers=workers,
+            days=days,
+            sessions=sessions,
+        )
+        history.update(progress=progress)
+        return history
+
+    def has_older(self):
+        """ Returns True if there are Sessions before the recent window
+            that haven't been loaded.
+        """
+        return self.start_offset > 0
+
+    @classmethod
+    def iter_file(cls, filepath, lazy=False, days=None, sessions=None):
+        """ Parse a WinCNC.csv file, yielding each Session as soon as it
+            ends (its "Exiting" line, or the next "Starting" line). The last
+            Session is yielded at the end of the file, even if it is still
+            open.
+            Yielded Sessions are released from the History (see
+            `History.release()`), so memory use doesn't grow with the file.
+            Sessions/Commands still get the same ids as `from_file()`.
+            Only the last `days` days/`sessions` Sessions are parsed
+            (default: `recent_days`/`recent_sessions`, 0 means all of them).
+        """
+        history = cls(
+            filepath=filepath,
+            lazy=lazy,
+            workers=1,
+            days=days,
+            sessions=sessions,
+        )
+        with open(filepath, 'rb') as f:
+            history.signature = f.read(SIGNATURE_SIZE)
+            size = os.fstat(f.fileno()).st_size
+            history.offset = history.start_offset = find_recent_start(
+                f,
+                size,
+                days=history.days,
+                sessions=history.sessions,
+            )
+            f.seek(history.offset)
+            for session in history.iter_parse(history.iter_rows(f)):
+                history.release(session)
+                yield session
+        if history.session is not None:
+            session = history.session
+            history.close_session()
+            history.release(session)
+            yield session
+
+    def extend(self, sessions):
+        """ Add Sessions, giving them (and their Commands) ids. """
+        for session in sessions:
+            self.append(session)
+
+    def file_stats(self, key='total', reverse=None, user_files=False):
+        """ Return a list of FileStats (run count, run time, and errors
+            for each file name), sorted by one of `FileIndex.sort_keys`.
+            If `user_files` is truthy, only user files are included.
         """
-        sessions = []
-        session = None
-        with open(filepath, 'r') as f:
-            for line in f:
-                if line.lower().startswith('file name'):
-                    # Skip headers.
+        return self.file_index.sorted(
+            key=key,
+            reverse=reverse,
+            type_codes=(TYPE_USER_FILE, ) if user_files else None,
+        )
+
+    def get_command(self, cmdid):
+        """ Retrieve a Command from this History by id (an int, or a str
+            from a Treeview tag).
+        """
+        try:
+            return self.command_index[int(cmdid)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'No Command with that id: {cmdid}')
+
+    def get_time_index(self):
+        """ Return a TimeIndex for this History. It is only rebuilt when
+            Sessions/Commands have been added since the last one.
+        """
+        if (self.time_index is None) or not self.time_index.is_current(self):
+            self.time_index = TimeIndex(self)
+        return self.time_index
+
+    def get_intervals(self):
+        """ Return HistoryIntervals for this History. They are only rebuilt
+            when Sessions/Commands have been added since the last ones.
+        """
+        if (self.intervals is None) or not self.intervals.is_current(self):
+            self.intervals = HistoryIntervals(self)
+        return self.intervals
+
+    def get_session(self, sessionid):
+        """ Retrieve a Session from this History by id (an int, or a str
+            from a Treeview tag).
+        """
+        try:
+            return self.session_index[int(sessionid)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'No Session with that id: {sessionid}')
+
+    def iter_parse(self, rows):
+        """ Parse csv rows (from `self.iter_rows()`) from WinCNC.csv, and
+            merge them into this History, yielding each Session once it is
+            closed by an "Exiting" or "Starting" line.
+            Marker rows are told apart from Command rows by the first field,
+            and Command rows are built in batches.
+        """
+        batch = []
+        try:
+            for row in rows:
+                if not row:
                     continue
-                if line.lower().startswith('starting'):
-                    if session is not None:
-                        # Starting a session without "exiting" the previous one.
-                        session.recalculate()
-                        sessions.append(session)
-                        session = None
-
-                    _, timestr, datestr = line.split(', ')
-
-                    session = Session(
-                        [],
-                        start_time=' '.join((
-                            datestr.strip(),
-                            timestr.strip(),
-                        ))
-                    )
+                marker = row[0][:9].lower()
+                if marker.startswith(MARKERS):
+                    if batch:
+                        self.add_commands(
+                            self.command_class.from_rows(batch)
+                        )
+                        batch = []
+                    session = self.session
+                    self.parse_marker(marker, row)
+                    if (session is not None) and (session is not self.session):
+                        yield session
                     continue
-                elif line.lower().startswith('exiting'):
-                    _, timestr, datestr = line.split(', ')
-                    session.end_time = parse_datetime(' '.join((
-                        datestr.strip(),
-                        timestr.strip(),
-                    )))
-                    session.recalculate()
-                    sessions.append(session)
-                    session = None
+                if self.session is None:
                     continue
-                if session is not None:
-                    session.append(Command.from_line(line))
-        # Pick up any non-exits.
-        if session is not None:
-            session.recalculate()
-            sessions.append(session)
-        return cls(sessions)
-
-    def get_command(self, hsh):
-        """ Retrieve a Command from this History by hash. """
-        for session in self:
-            hl = session.get_command(hsh)
-            if hl is not None:
-                return hl
-        raise ValueError(f'No Command with that hash: {hsh}')
-
-    def get_session(self, hsh):
-        """ Retrieve a Session from this History by hash. """
-        hsh = str(hsh)
-        for session in self:
-            if str(hash(session)) == hsh:
-                return session
-        raise ValueError(f'No Session with that hash: {hsh}')
+                batch.append(row)
+                if len(batch) == BATCH_SIZE:
+                    self.add_commands(self.command_class.from_rows(batch))
+                    batch = []
+        finally:
+            # Rows before `self.offset` are merged, even if parsing was
+            # stopped (see LoadCancelled).
+            if batch:
+                self.add_commands(self.command_class.from_rows(batch))
+
+    def iter_rows(self, f, end=None, progress=None):
+        """ Yield split csv rows from a binary WinCNC.csv file object,
+            starting at its current position, and stopping at byte offset
+            `end` (if given). Only complete lines are used, a last line
+            with no newline is only used if it is a complete row (see
+            `row_complete()`).
+            `self.offset` is moved past each block once all of its rows
+            have been consumed, and then `progress(self.offset)` is called
+            (if given).
+        """
+        remainder = b''
+        pos = f.tell()
+        while True:
+            size = BLOCK_SIZE if end is None else min(BLOCK_SIZE, end - pos)
+            block = f.read(size) if size > 0 else b''
+            pos += len(block)
+            if not block:
+                break
+            block = remainder + block
+            lineend = block.rfind(b'\n') + 1
+            remainder = block[lineend:]
+            if not lineend:
+                continue
+            text = block[:lineend].decode(FILE_ENCODING, errors='replace')
+            lines = text.splitlines()
+            if '"' in text:
+                # Quoted fields need the real csv parser.
+                yield from csv.reader(lines)
+            else:
+                # WinCNC doesn't quote anything, a plain split is the same
+                # as csv.reader, only faster.
+                for line in lines:
+                    if line:
+                        yield line.split(',')
+            self.offset += lineend
+            if progress is not None:
+                progress(self.offset)
+        if not remainder:
+            return
+        text = remainder.decode(FILE_ENCODING, errors='replace')
+        text = text.rstrip('\r')
+        if '"' in text:
+            row = next(csv.reader([text]), [])
+        else:
+            row = text.split(',')
+        if not row_complete(row):
+            # Still being written, it is parsed by the next update.
+            return
+        yield row
+        self.offset += len(remainder)
+        if progress is not None:
+            progress(self.offset)
+
+    def load_older(self, days=None, sessions=None):
+        """ Parse Sessions from before the recent window (the last `days`
+            days/`sessions` Sessions before it, default: `self.days` and
+            `self.sessions`), and insert them at the start of this History.
+            Returns the new Sessions, oldest first.
+        """
+        if not self.has_older():
+            return []
+        days = self.days if days is None else days
+        sessions = self.sessions if sessions is None else sessions
+        with open(self.filepath, 'rb') as f:
+            start = find_recent_start(
+                f,
+                self.start_offset,
+                days=days,
+                sessions=sessions,
+            )
+        lazy = self.command_class is LazyCommand
+        part = parse_range(self.filepath, start, self.start_offset, lazy)
+        self.start_offset = start
+        # The next Session (already loaded) closes the last one.
+        part.close_session()
+        self.prepend(part)
+        return list(part)
+
+    def parse_marker(self, marker, row):
+        """ Handle a header, "Starting", or "Exiting" row from WinCNC.csv.
+            `marker` is the lowercased first field.
+        """
+        if marker.startswith('file name'):
+            # Skip headers.
+            return
+        dtstr = f'{row[2].strip()} {row[1].strip()}'
+        if marker.startswith('starting'):
+            # Starting a session may happen without "exiting" the previous
+            # one.
+            self.close_session()
+            self.session = Session([], start_time=dtstr)
+            self.append(self.session)
+        elif self.session is not None:
+            self.session.end_time = parse_datetime(dtstr)
+            self.close_session()
+
+    def parse_parallel(self, f, size, bounds=None, progress=None):
+        """ Parse a whole WinCNC.csv file (binary file object `f`, with
+            `size` bytes) into this empty History, with a pool of
+            `self.workers` processes.
+            The file is split into byte ranges at session boundaries
+            ("Starting" lines), and the parsed Sessions are merged back in
+            order, so the result is the same as a single-process parse.
+            If `bounds` (byte offsets of session starts, and the end) are
+            given, they are used instead of searching for the boundaries.
+            `progress(self.offset)` is called (if given) as each range is
+            merged, and it may raise LoadCancelled to stop without waiting
+            for the other workers.
+        """
+        if bounds is None:
+            bounds = [0]
+            for i in range(1, self.workers):
+                offset = max(size * i // self.workers, bounds[-1] + 1)
+                start = find_session_start(f, offset)
+                if start >= size:
+                    break
+                bounds.append(start)
+            bounds.append(size)
+
+        lazy = self.command_class is LazyCommand
+        executor = ProcessPoolExecutor(max_workers=len(bounds) - 1)
+        cancelled = False
+        try:
+            parts = executor.map(
+                parse_range,
+                repeat(self.filepath),
+                bounds[:-1],
+                bounds[1:],
+                repeat(lazy),
+            )
+            for part in parts:
+                # Worker ids are only unique within a part.
+                self.extend(part)
+                # Only the last part's open session is still open.
+                self.offset = part.offset
+                self.session = part.session
+                if progress is not None:
+                    progress(self.offset)
+        except LoadCancelled:
+            cancelled = True
+            raise
+        finally:
+            # Parts that haven't been merged yet are not waited for when
+            # cancelled, the rest of the file is parsed on the next update.
+            executor.shutdown(wait=not cancelled, cancel_futures=cancelled)
+
+    def parse_rows(self, rows):
+        """ Parse csv rows (from `self.iter_rows()`) from WinCNC.csv, and
+            merge them into this History.
+        """
+        for _ in self.iter_parse(rows):
+            pass
+
+    def prepend(self, sessions):
+        """ Insert older Sessions at the start, giving them (and their
+            Commands) ids.
+        """
+        sessions = list(sessions)
+        if not sessions:
+            return
+        self.extend(sessions)
+        del self.data[-len(sessions):]
+        self.data[0:0] = sessions
+
+    def rebuild_indexes(self):
+        """ Rebuild the id indexes, from the ids that the Sessions and
+            Commands already have.
+        """
+        self.session_index = {session.id: session for session in self}
+        self.command_index = {
+            cmd.id: cmd
+            for session in self
+            for cmd in session
+        }
+
+    def release(self, session):
+        """ Remove a closed Session (and its Commands) from this History
+            and the id indexes. Ids are not reused, and the file index
+            keeps the Session's totals.
+        """
+        for i in range(len(self.data) - 1, -1, -1):
+            if self.data[i] is session:
+                del self.data[i]
+                break
+        else:
+            raise ValueError(f'Session is not in this History: {session!r}')
+        self.session_index.pop(session.id, None)
+        for cmd in session:
+            self.command_index.pop(cmd.id, None)
+
+    def reset(self):
+        """ Forget all Sessions and parser state, so the next
+            `self.update()` will parse the whole file.
+        """
+        self.data.clear()
+        self.offset = 0
+        self.start_offset = 0
+        self.signature = b''
+        self.session = None
+        self.session_index.clear()
+        self.command_index.clear()
+        self.file_index.clear()
+        self.next_session_id = 0
+        self.next_command_id = 0
+
+    def runtime(self, start=None, end=None):
+        """ Return totals for Sessions/Commands started between `start`
+            and `end` (datetimes, either may be None, `end` is not
+            included). See `TimeIndex.runtime()`.
+        """
+        return self.get_time_index().runtime(start=start, end=end)
+
+    def sessions_at(self, when):
+        """ Return Sessions that were open at `when` (a datetime). """
+        return self.get_intervals().sessions.at(when)
+
+    def sessions_between(self, start, end):
+        """ Return Sessions that were open at any time from `start` to
+            `end` (datetimes).
+        """
+        return self.get_intervals().sessions.overlapping(start, end)
+
+    def update(self, progress=None):
+        """ Parse any lines that were appended to `self.filepath` since the
+            last parse, and merge them into this History.
+            The still-open Session (no "Exiting" line yet) keeps receiving
+            Commands. If the file was truncated or replaced, the whole
+            file is parsed again.
+            A trailing partial line (still being written by WinCNC) is left
+            for the next update.
+            A full parse only parses the recent window (`self.days`/
+            `self.sessions`), if one is set.
+            If `progress` is given, it is called with the number of bytes
+            parsed so far and the number of bytes to parse, and it may
+            raise LoadCancelled to stop.
+            Returns True if the whole file was parsed, otherwise False.
+        """
+        with open(self.filepath, 'rb') as f:
+            signature = f.read(SIGNATURE_SIZE)
+            size = os.fstat(f.fileno()).st_size
+            full = (
+                (not self.offset) or
+                (size < self.offset) or
+                (not signature.startswith(self.signature))
+            )
+            if full:
+                self.reset()
+                self.offset = self.start_offset = find_recent_start(
+                    f,
+                    size,
+                    days=self.days,
+                    sessions=self.sessions,
+                )
+            self.signature = signature
+            min_size = parse_workers_min_mb * 1024 * 1024
+            parallel = full and (not self.start_offset) and (
+                (self.workers > 1) and (size >= min_size)
+            )
+            report = None
+            if progress is not None:
+                start = self.offset
+                total = max(size - start, 0)
+                report = lambda offset: progress(offset - start, total)  # noqa
+                report(start)
+            if parallel:
+                self.parse_parallel(f, size, progress=report)
+            else:
+                f.seek(self.offset)
+                self.parse_rows(self.iter_rows(f, progress=report))
+        return full
 
 
 class Session(UserList):
     """ A collection of Commands. """
     def __init__(self, iterable, start_time=None, end_time=None):
         super().__init__(iterable)
+        # Set by History when this Session is added to it.
+        self.id = None
 
         self.start_time = start_time
         if isinstance(start_time, str):
@@ -178,24 +924,19 @@ class Session(UserList):
         if isinstance(end_time, str):
             self.end_time = parse_datetime(end_time)
 
-        # Cannot calculate duration on an empty list.
+        # Running totals, updated as Commands are appended. The averages
+        # and formatted strings are properties, based on these.
         self.duration_delta = timedelta()
-        self.duration = '0s'
-
-        self.actual_delta = timedelta()
-        self.actual_duration = '0s'
-        self.end_of_day_delta = timedelta()
-        self.end_of_day_duration = '0s'
-        self.avg_delta = timedelta()
-        self.avg_duration = '0s'
         self.between_delta = timedelta()
-        self.between_duration = '0s'
-        self.avg_between_delta = timedelta()
-        self.avg_between_duration = '0s'
-
+        # Break time (see `break_schedule`) in between Commands.
+        self.between_break_delta = timedelta()
         self.count_commands = 0
         self.count_files = 0
         self.count_command_files = 0
+        self.error = False
+
+        # Time before each Command started, see `self.calc_gaps()`.
+        self.gaps = []
 
         self.recalculate()
 
@@ -216,15 +957,104 @@ class Session(UserList):
     def __hash__(self):
         return hash(self.time_str())
 
+    @property
+    def actual_delta(self):
+        """ Time from the start to the end of this Session. """
+        if self.end_time:
+            return self.end_time - self.start_time
+        return timedelta()
+
+    @property
+    def actual_adjusted_delta(self):
+        """ Time from the start to the end of this Session, without the
+            configured breaks.
+        """
+        if self.end_time:
+            return self.actual_delta - break_schedule.overlap(
+                self.start_time,
+                self.end_time,
+            )
+        return timedelta()
+
+    @property
+    def actual_adjusted_duration(self):
+        return timedelta_str(self.actual_adjusted_delta, short=True)
+
+    @property
+    def actual_duration(self):
+        return timedelta_str(self.actual_delta, short=True)
+
+    def append(self, command):
+        """ Add a Command, and update the running totals. """
+        if len(self.gaps) != len(self.data):
+            # Changed some other way, the totals need a fresh start.
+            self.recalculate()
+        if self.data:
+            prev_end = self.data[-1].end_time
+            gap = command.start_time - prev_end
+            self.between_delta = self.between_delta + gap
+            self.between_break_delta = (
+                self.between_break_delta +
+                break_schedule.overlap(prev_end, command.start_time)
+            )
+        else:
+            gap = command.start_time - (self.start_time or command.start_time)
+        self.gaps.append(gap)
+        self.data.append(command)
+        self.duration_delta = self.duration_delta + command.duration_delta
+        if command.type_code == TYPE_COMMAND:
+            self.count_commands += 1
+        elif command.type_code == TYPE_COMMAND_FILE:
+            self.count_command_files += 1
+        else:
+            self.count_files += 1
+        if command.is_error():
+            self.error = True
+
+    @property
+    def avg_between_delta(self):
+        """ Average time between Commands. """
+        length = len(self)
+        if self.between_delta and (length > 1):
+            return self.between_delta // (length - 1)
+        return timedelta()
+
+    @property
+    def avg_between_duration(self):
+        return timedelta_str(self.avg_between_delta, short=True)
+
+    @property
+    def avg_delta(self):
+        """ Average run time for the Commands. """
+        length = len(self)
+        if length:
+            return self.duration_delta // length
+        return timedelta()
+
+    @property
+    def avg_duration(self):
+        return timedelta_str(self.avg_delta, short=True)
+
+    @property
+    def between_adjusted_delta(self):
+        """ Time in between Commands, without the configured breaks. """
+        return self.between_delta - self.between_break_delta
+
+    @property
+    def between_adjusted_duration(self):
+        return timedelta_str(self.between_adjusted_delta, short=True)
+
+    @property
+    def between_duration(self):
+        return timedelta_str(self.between_delta, short=True)
+
     def between_time(self):
         """ Calculate a timedelta (duration) for all time in between commands.
         """
         delta = timedelta()
         # Skipping the first item on purpose.
-        for i in range(len(self) - 1, 0, -1):
-            cmd = self[i]
-            prevcmd = self[i - 1]
-            delta = delta + (cmd.start_time - prevcmd.end_time)
+        for gap in self.get_gaps()[1:]:
+            delta = delta + gap
         return delta
 
     def calc_duration(self):
@@ -236,6 +1066,20 @@ class Session(UserList):
             delta = delta + cmd.duration_delta
         return delta
 
+    def calc_gaps(self):
+        """ Return a list with the time before each Command started, since
+            the previous Command ended (or since the Session started, for
+            the first one).
+        """
+        gaps = []
+        if not self:
+            return gaps
+        prev_end = self.start_time or self[0].start_time
+        for cmd in self:
+            gaps.append(cmd.start_time - prev_end)
+            prev_end = cmd.end_time
+        return gaps
+
     def calc_end_of_day_duration(self):
         """ Calculate a timedelta for end_time - last_command.end_time. """
         if self and self.end_time:
@@ -246,34 +1090,94 @@ class Session(UserList):
     def count(self):
         return len(self)
 
-    def get_command(self, hsh):
-        """ Retrieve a Command from this Session by hash.
+    @property
+    def duration(self):
+        return timedelta_str(self.duration_delta, short=True)
+
+    @property
+    def end_of_day_adjusted_delta(self):
+        """ Time from the last Command to the end of this Session, without
+            the configured breaks.
+        """
+        if self and self.end_time:
+            return self.end_of_day_delta - break_schedule.overlap(
+                self[-1].end_time,
+                self.end_time,
+            )
+        return timedelta()
+
+    @property
+    def end_of_day_adjusted_duration(self):
+        return timedelta_str(self.end_of_day_adjusted_delta, short=True)
+
+    @property
+    def end_of_day_delta(self):
+        return self.calc_end_of_day_duration()
+
+    @property
+    def end_of_day_duration(self):
+        return timedelta_str(self.end_of_day_delta, short=True)
+
+    def extend(self, commands):
+        """ Add Commands, and update the running totals. """
+        for command in commands:
+            self.append(command)
+
+    def get_command(self, cmdid):
+        """ Retrieve a Command from this Session by id.
         """
-        hsh = str(hsh)
+        cmdid = int(cmdid)
         for cmd in self:
-            if hsh == str(hash(cmd)):
+            if cmd.id == cmdid:
                 return cmd
         return None
 
+    def get_gaps(self):
+        """ Return `self.gaps`, recalculating first if Commands were added
+            without `self.append()`/`self.extend()`.
+        """
+        if len(self.gaps) != len(self):
+            self.recalculate()
+        return self.gaps
+
     def has_error(self):
         """ Returns True if any cmds in this session had an error. """
-        return any(hl.is_error() for hl in self)
+        return self.error
 
     def last_status(self):
         """ Return the status of the last command/file in the history. """
         return self[-1].status if self else '<no commands>'
 
+    def position(self, command):
+        """ Return the index of `command` in this Session.
+            Command ids are consecutive within a Session, so for Sessions in
+            a History this doesn't need to search.
+        """
+        if self and (command.id is not None) and (self[0].id is not None):
+            index = command.id - self[0].id
+            if (0 <= index < len(self)) and (self[index] is command):
+                return index
+        try:
+            return self.index(command)
+        except ValueError:
+            raise ValueError(f'Command is not in this session: {command}')
+
     def recalculate(self):
-        """ Call all recalculate methods. """
+        """ Recalculate all of the running totals from scratch. Only needed
+            if Commands were changed without `self.append()`/`self.extend()`.
+        """
+        self.recalculate_gaps()
         self.recalculate_duration()
-        self.recalculate_runtime_info()
         self.recalculate_counts()
 
     def recalculate_counts(self):
-        """ Calculate the number of command types for this session. """
+        """ Calculate the number of command types for this session, and
+            whether any of them had an error.
+        """
         self.count_commands = 0
         self.count_files = 0
         self.count_command_files = 0
+        self.error = False
         for cmd in self:
             if cmd.is_command():
                 self.count_commands += 1
@@ -281,23 +1185,29 @@ class Session(UserList):
                 self.count_command_files += 1
             elif cmd.is_user_file():
                 self.count_files += 1
+            if cmd.is_error():
+                self.error = True
 
     def recalculate_duration(self):
-        """ Set `self.duration_delta` and `self.duration` based on current
-            Commands.
-        """
+        """ Set `self.duration_delta` based on current Commands. """
         self.duration_delta = self.calc_duration()
-        self.duration = timedelta_str(self.duration_delta, short=True)
-        self.end_of_day_delta = self.calc_end_of_day_duration()
-        self.end_of_day_duration = timedelta_str(
-            self.end_of_day_delta,
-            short=True,
-        )
 
-    def recalculate_runtime_info(self):
-        """ Set the average runtime attributes. """
-        for k, v in self.runtime_info().items():
-            setattr(self, k, v)
+    def recalculate_gaps(self):
+        """ Set `self.gaps`, the time before each Command started, and
+            `self.between_delta`/`self.between_break_delta`.
+        """
+        self.gaps = self.calc_gaps()
+        self.between_delta = timedelta()
+        for gap in self.gaps[1:]:
+            self.between_delta = self.between_delta + gap
+        self.between_break_delta = timedelta()
+        if not break_schedule:
+            return
+        for prevcmd, cmd in zip(self.data, self.data[1:]):
+            self.between_break_delta = (
+                self.between_break_delta +
+                break_schedule.overlap(prevcmd.end_time, cmd.start_time)
+            )
 
     def runtime_info(self):
         """ Build info about the Commands in this Session, like
@@ -305,63 +1215,34 @@ class Session(UserList):
             etc.
             Returns a dict of info.
         """
-        length = len(self)
-        if length:
-            avg_delta = self.duration_delta // length
-        else:
-            avg_delta = timedelta()
-        if self.end_time:
-            actual_delta = self.end_time - self.start_time
-        else:
-            actual_delta = timedelta()
-        between_delta = self.between_time()
-        if between_delta and (length > 1):
-            avg_between_delta = between_delta // (length - 1)
-        else:
-            avg_between_delta = timedelta()
-
         return {
-            'actual_delta': actual_delta,
-            'actual_duration': timedelta_str(actual_delta, short=True),
-            'avg_delta': avg_delta,
-            'avg_duration': timedelta_str(avg_delta, short=True),
-            'between_delta': between_delta,
-            'between_duration': timedelta_str(between_delta, short=True),
-            'avg_between_delta': avg_between_delta,
-            'avg_between_duration': timedelta_str(
-                avg_between_delta,
-                short=True
-            ),
+            'actual_delta': self.actual_delta,
+            'actual_duration': self.actual_duration,
+            'avg_delta': self.avg_delta,
+            'avg_duration': self.avg_duration,
+            'between_delta': self.between_delta,
+            'between_duration': self.between_duration,
+            'avg_between_delta': self.avg_between_delta,
+            'avg_between_duration': self.avg_between_duration,
         }
 
     def time_after(self, command):
         """ Return a timedelta for the time after `command` was ended
             and another one started.
         """
-        try:
-            index = self.index(command)
-        except ValueError:
-            raise ValueError(f'Command is not in this session: {command}')
+        index = self.position(command)
         if index == len(self) - 1:
             # No command after, try session end_time.
             if self.end_time:
                 return self.end_time - command.end_time
             # No end_time to use.
             return timedelta()
-        cmdafter = self[index + 1]
-        return cmdafter.start_time - command.end_time
+        return self.get_gaps()[index + 1]
 
     def time_before(self, command):
         """ Return a timedelta for the time before `command` was started. """
-        try:
-            index = self.index(command)
-        except ValueError:
-            raise ValueError(f'Command is not in this session: {command}')
-        if index == 0:
-            # No command before, use session start_time.
-            return command.start_time - self.start_time
-        cmdbefore = self[index - 1]
-        return command.start_time - cmdbefore.end_time
+        # The first gap is from the session start_time.
+        return self.get_gaps()[self.position(command)]
 
     def time_fmt(self, dt=None, time_args=None, date_args=None):
         """ Return a color formatted version of a datetime (self.start_time
@@ -400,17 +1281,22 @@ class Session(UserList):
             dt = self.start_time
         return time_str(dt, human=human, time_only=time_only)
 
+    def treeview_iid(self):
+        """ Return a Treeview item id for this Session. """
+        return f's{self.id}'
+
     def treeview_tags(self):
         """ Return a tuple of Treeview tag names for this Session. """
-        tags = [hash(self), 'session']
+        tags = [self.id, 'session']
         if self.has_error():
             tags.append('error')
         return tuple(tags)
 
 
-class Command(object):
-    """ Holds information about a single line from WinCNC.csv, a command,
-        file, or file-command.
+class BaseCommand(object):
+    """ Everything shared by Command and LazyCommand. Only the columns
+        needed for the session tree, and the values calculated from them,
+        have slots here. Subclasses decide how the other columns are kept.
     """
     colors = {
         'command': {'fore': 'dimgrey'},
@@ -471,65 +1357,16 @@ class Command(object):
         'atc1_t6', 'atc1_t7', 'atc1_t8', 'atc1_t9', 'atc1_t10'
     )
     row_len = len(header)
-
-    def __init__(
-            self, filename, minutes, seconds, time, date,
-            status, rapid, feed, laser,
-            axis1, axis2, axis3, axis4, axis5, axis6,
-            output_c1, output_c2, output_c3,
-            input_c1, input_c2, input_c3, input_c4, input_c5, input_c6,
-            input_c7, input_c8, input_c9, input_c10, input_c11, input_c12,
-            input_c13,
-            atc1_t0, atc1_t1, atc1_t2, atc1_t3, atc1_t4, atc1_t5, atc1_t6,
-            atc1_t7, atc1_t8, atc1_t9, atc1_t10):
-        self.filename = filename.strip().lower()
-        self.minutes = minutes.strip()
-        self.seconds = seconds.strip()
-        self.time = time.strip()
-        self.date = date.strip()
-        self.status = status.strip()
-        self.rapid = rapid.strip()
-        self.feed = feed.strip()
-        self.laser = laser.strip()
-        self.axis1 = axis1.strip()
-        self.axis2 = axis2.strip()
-        self.axis3 = axis3.strip()
-        self.axis4 = axis4.strip()
-        self.axis5 = axis5.strip()
-        self.axis6 = axis6.strip()
-        self.output_c1 = output_c1.strip()
-        self.output_c2 = output_c2.strip()
-        self.output_c3 = output_c3.strip()
-        self.input_c1 = input_c1.strip()
-        self.input_c2 = input_c2.strip()
-        self.input_c3 = input_c3.strip()
-        self.input_c4 = input_c4.strip()
-        self.input_c5 = input_c5.strip()
-        self.input_c6 = input_c6.strip()
-        self.input_c7 = input_c7.strip()
-        self.input_c8 = input_c8.strip()
-        self.input_c9 = input_c9.strip()
-        self.input_c10 = input_c10.strip()
-        self.input_c11 = input_c11.strip()
-        self.input_c12 = input_c12.strip()
-        self.input_c13 = input_c13.strip()
-        self.atc1_t0 = atc1_t0.strip()
-        self.atc1_t1 = atc1_t1.strip()
-        self.atc1_t2 = atc1_t2.strip()
-        self.atc1_t3 = atc1_t3.strip()
-        self.atc1_t4 = atc1_t4.strip()
-        self.atc1_t5 = atc1_t5.strip()
-        self.atc1_t6 = atc1_t6.strip()
-        self.atc1_t7 = atc1_t7.strip()
-        self.atc1_t8 = atc1_t8.strip()
-        self.atc1_t9 = atc1_t9.strip()
-        self.atc1_t10 = atc1_t10.strip()
-
-        # Non-csv-file attributes:
-        self.duration_delta = self.calc_duration()
-        self.duration = timedelta_str(self.duration_delta)
-        self.end_time = parse_datetime(f'{self.date} {self.time}')
-        self.start_time = self.end_time - self.duration_delta
+    # Columns that are always parsed when a row is built.
+    eager_columns = (
+        'filename', 'time', 'date', 'status', 'rapid', 'feed', 'laser',
+    )
+    # There can be millions of Commands, so no per-instance __dict__.
+    __slots__ = eager_columns + (
+        'duration_delta', 'end_time', 'id', 'start_time', 'type_code',
+    )
+    # Attributes saved when pickling (for worker processes and caches).
+    state_attrs = eager_columns + ('id', )
 
     def __colr__(self):
         return C(' ').join(
@@ -537,6 +1374,11 @@ class Command(object):
             self.status_fmt(),
         )
 
+    def __getstate__(self):
+        """ Pickle only the csv-file attributes, the rest is recalculated.
+        """
+        return tuple(getattr(self, name) for name in self.state_attrs)
+
     def __repr__(self):
         attrs = '  {}'.format(',\n  '.join(
             '{:>9}={!r}'.format(s, str(getattr(self, s, None)))
@@ -544,31 +1386,34 @@ class Command(object):
         ))
         return f'{type(self).__name__}(\n{attrs}\n)'
 
+    @property
+    def duration(self):
+        """ A human-readable string for `self.duration_delta`. """
+        return timedelta_str(self.duration_delta)
+
     def calc_duration(self):
         """ Return a timedelta representing the total run time for this
             command/file.
         """
-        return (
-            parse_timedelta(self.rapid) +
-            parse_timedelta(self.feed) +
-            parse_timedelta(self.laser)
-        )
+        return self.rapid_delta + self.feed_delta + self.laser_delta
+
+    def calc_type_code(self):
+        """ Return the TYPE_* code for this command/file. """
+        if self.filename.startswith('c:\\wincnc'):
+            return TYPE_COMMAND_FILE
+        if self.filename.startswith('c:\\'):
+            return TYPE_USER_FILE
+        return TYPE_COMMAND
 
     def command_type(self):
         """ Return the type of command as a string. """
-        if self.is_user_file():
-            return 'user file'
-        if self.is_command_file():
-            return 'command file'
-        return 'command'
+        return command_types[self.type_code]
 
     def filename_fmt(self):
         """ Return a colorized version of the filename value. """
-        if self.filename.lower().startswith('c:\\wincnc'):
-            # A command file.
+        if self.type_code == TYPE_COMMAND_FILE:
             args = self.colors['command_file']
-        elif not self.filename.lower().startswith('c:\\'):
-            # A command.
+        elif self.type_code == TYPE_COMMAND:
             args = self.colors['command']
         else:
             args = self.colors['filename']
@@ -581,20 +1426,56 @@ class Command(object):
             return hl
         raise ValueError(f'No line to parse: {line!r}')
 
+    @classmethod
+    def from_rows(cls, rows):
+        """ Build a list of Commands from already-split csv rows. """
+        return [cls(*row) for row in rows]
+
+    @property
+    def feed_delta(self):
+        return parse_timedelta(self.feed)
+
     def is_command(self):
-        return not self.is_file()
+        return self.type_code == TYPE_COMMAND
 
     def is_command_file(self):
-        return self.filename.lower().startswith('c:\\wincnc')
+        return self.type_code == TYPE_COMMAND_FILE
 
     def is_error(self):
         return 'ok' not in self.status.lower()
 
     def is_file(self):
-        return self.filename.lower().startswith('c:\\')
+        return self.type_code != TYPE_COMMAND
 
     def is_user_file(self):
-        return self.is_file() and (not self.is_command_file())
+        return self.type_code == TYPE_USER_FILE
+
+    @property
+    def laser_delta(self):
+        return parse_timedelta(self.laser)
+
+    @property
+    def rapid_delta(self):
+        return parse_timedelta(self.rapid)
+
+    def raw_fields(self):
+        """ Return a list with all of the csv-file columns, in file order.
+        """
+        return [getattr(self, name) for name in self.header]
+
+    def __setstate__(self, state):
+        for name, value in zip(self.state_attrs, state):
+            setattr(self, name, value)
+        self.recalculate()
+
+    def recalculate(self):
+        """ Set the non-csv-file attributes (duration, start/end times, and
+            type code) from the csv-file attributes.
+        """
+        self.duration_delta = self.calc_duration()
+        self.end_time = parse_datetime(f'{self.date} {self.time}')
+        self.start_time = self.end_time - self.duration_delta
+        self.type_code = self.calc_type_code()
 
     def status_fmt(self):
         """ Return a colorized version of the status value. """
@@ -608,17 +1489,140 @@ class Command(object):
             dt = self.start_time
         return time_str(dt, human=human, time_only=time_only)
 
+    def treeview_iid(self):
+        """ Return a Treeview item id for this Command. """
+        return f'c{self.id}'
+
     def treeview_tags(self):
         """ Return a tuple of ttk.Treeview tag names for this Command.
         """
-        tags = [hash(self)]
+        tags = [self.id]
         if self.is_error():
             tags.append('error')
 
-        if self.is_user_file():
-            tags.append('file')
-        elif self.is_command_file():
-            tags.append('file_command')
-        else:
-            tags.append('command')
+        tags.append(treeview_type_tags[self.type_code])
         return tuple(tags)
+
+
+class Command(BaseCommand):
+    """ Holds information about a single line from WinCNC.csv, a command,
+        file, or file-command.
+    """
+    __slots__ = tuple(
+        name
+        for name in BaseCommand.header
+        if name not in BaseCommand.eager_columns
+    )
+    state_attrs = BaseCommand.header + ('id', )
+
+    def __init__(
+            self, filename, minutes, seconds, time, date,
+            status, rapid, feed, laser,
+            axis1, axis2, axis3, axis4, axis5, axis6,
+            output_c1, output_c2, output_c3,
+            input_c1, input_c2, input_c3, input_c4, input_c5, input_c6,
+            input_c7, input_c8, input_c9, input_c10, input_c11, input_c12,
+            input_c13,
+            atc1_t0, atc1_t1, atc1_t2, atc1_t3, atc1_t4, atc1_t5, atc1_t6,
+            atc1_t7, atc1_t8, atc1_t9, atc1_t10):
+        self.filename = intern(filename.strip().lower())
+        self.minutes = intern(minutes.strip())
+        self.seconds = intern(seconds.strip())
+        self.time = intern(time.strip())
+        self.date = intern(date.strip())
+        self.status = intern(status.strip())
+        self.rapid = intern(rapid.strip())
+        self.feed = intern(feed.strip())
+        self.laser = intern(laser.strip())
+        self.axis1 = intern(axis1.strip())
+        self.axis2 = intern(axis2.strip())
+        self.axis3 = intern(axis3.strip())
+        self.axis4 = intern(axis4.strip())
+        self.axis5 = intern(axis5.strip())
+        self.axis6 = intern(axis6.strip())
+        self.output_c1 = intern(output_c1.strip())
+        self.output_c2 = intern(output_c2.strip())
+        self.output_c3 = intern(output_c3.strip())
+        self.input_c1 = intern(input_c1.strip())
+        self.input_c2 = intern(input_c2.strip())
+        self.input_c3 = intern(input_c3.strip())
+        self.input_c4 = intern(input_c4.strip())
+        self.input_c5 = intern(input_c5.strip())
+        self.input_c6 = intern(input_c6.strip())
+        self.input_c7 = intern(input_c7.strip())
+        self.input_c8 = intern(input_c8.strip())
+        self.input_c9 = intern(input_c9.strip())
+        self.input_c10 = intern(input_c10.strip())
+        self.input_c11 = intern(input_c11.strip())
+        self.input_c12 = intern(input_c12.strip())
+        self.input_c13 = intern(input_c13.strip())
+        self.atc1_t0 = intern(atc1_t0.strip())
+        self.atc1_t1 = intern(atc1_t1.strip())
+        self.atc1_t2 = intern(atc1_t2.strip())
+        self.atc1_t3 = intern(atc1_t3.strip())
+        self.atc1_t4 = intern(atc1_t4.strip())
+        self.atc1_t5 = intern(atc1_t5.strip())
+        self.atc1_t6 = intern(atc1_t6.strip())
+        self.atc1_t7 = intern(atc1_t7.strip())
+        self.atc1_t8 = intern(atc1_t8.strip())
+        self.atc1_t9 = intern(atc1_t9.strip())
+        self.atc1_t10 = intern(atc1_t10.strip())
+
+        # Non-csv-file attributes:
+        # Set by History when this Command is added to it.
+        self.id = None
+        self.recalculate()
+
+
+
+class LazyCommand(BaseCommand):
+    """ A Command that only parses the columns needed for the session tree
+        up front (filename, status, rapid/feed/laser, time and date).
+        The other columns are kept in one packed string, and parsed every
+        time they are used, so they don't need a slot each.
+    """
+    # Raw field index for the columns that are packed.
+    lazy_indexes = tuple(
+        i
+        for i, name in enumerate(BaseCommand.header)
+        if name not in BaseCommand.eager_columns
+    )
+    # Index into the packed string for each packed column.
+    lazy_columns = {
+        BaseCommand.header[i]: j
+        for j, i in enumerate(lazy_indexes)
+    }
+    __slots__ = ('fields', )
+    state_attrs = BaseCommand.state_attrs + ('fields', )
+
+    def __init__(self, *fields):
+        if len(fields) != self.row_len:
+            raise TypeError(
+                f'Expecting {self.row_len} fields, got: {len(fields)}'
+            )
+        # One packed string is much smaller than 35 separate slots.
+        self.fields = FIELD_SEP.join(
+            fields[i].strip()
+            for i in self.lazy_indexes
+        )
+        self.filename = intern(fields[0].strip().lower())
+        self.time = intern(fields[3].strip())
+        self.date = intern(fields[4].strip())
+        self.status = intern(fields[5].strip())
+        self.rapid = intern(fields[6].strip())
+        self.feed = intern(fields[7].strip())
+        self.laser = intern(fields[8].strip())
+
+        # Non-csv-file attributes:
+        # Set by History when this Command is added to it.
+        self.id = None
+        self.recalculate()
+
+    def __getattr__(self, name):
+        """ Parse packed columns from the raw fields when accessed. """
+        index = self.lazy_columns.get(name, None)
+        if index is None:
+            raise AttributeError(
+                f'{type(self).__name__!r} object has no attribute {name!r}'
+            )
+        return self.fields.split(FIELD_SEP)[index]
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - Libraries - Query
+    Filters for the Sessions/Commands in a History. A query is compiled
+    once into a list of predicates (cheapest first), and matches are
+    streamed, using the time and file name indexes to skip what can't
+    match.
+    -Christopher Welborn 05-26-2019
+"""
+
+import re
+from datetime import (
+    datetime,
+    timedelta,
+)
+from fnmatch import translate
+
+from .parser import (
+    TYPE_COMMAND,
+    TYPE_COMMAND_FILE,
+    TYPE_USER_FILE,
+    parse_user_date,
+)
+
+# Names for `type:` terms, and the Command.type_code they match.
+QUERY_TYPES = {
+    'command': TYPE_COMMAND,
+    'command_file': TYPE_COMMAND_FILE,
+    'user_file': TYPE_USER_FILE,
+}
+# Durations like '1h30m', '90s', or '45m'.
+DURATION_UNITS = re.compile(r'^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?$')
+
+QUERY_HELP = """Query terms (all of them must match):
+    from:date          : Commands started on or after this date.
+    to:date            : Commands started on or before this date.
+    type:name[,name]   : Command type: {types}.
+    status:error       : Commands that ended with an error.
+    status:ok          : Commands that ended without an error.
+    status:text        : Commands with `text` in their status.
+    file:glob          : File names matching a glob pattern (*.tap).
+    file:/regex/       : File names matching a regex pattern.
+    min:duration       : Commands that ran at least this long
+                         (seconds, mm:ss, hh:mm:ss, or 1h30m).
+    word               : File names containing `word`
+                         (every file/word term has to match).
+    Dates are yyyy-mm-dd or mm-dd-yy.
+""".format(types=', '.join(sorted(QUERY_TYPES)))
+
+
+def parse_duration(s):
+    """ Parse a duration typed in by the user, as seconds ('90'), 'mm:ss',
+        'hh:mm:ss', or with units ('1h30m', '45m', '90s').
+        Raises ValueError for anything else.
+    """
+    s = s.strip().lower()
+    if s.isdigit():
+        return timedelta(seconds=int(s))
+    if ':' in s:
+        pcs = s.split(':')
+        if (len(pcs) in (2, 3)) and all(pc.isdigit() for pc in pcs):
+            secs = 0
+            for pc in pcs:
+                secs = (secs * 60) + int(pc)
+            return timedelta(seconds=secs)
+    match = DURATION_UNITS.match(s)
+    if s and (match is not None):
+        hours, mins, secs = (int(x or 0) for x in match.groups())
+        return timedelta(hours=hours, minutes=mins, seconds=secs)
+    raise ValueError(f'Expecting a duration (90, 01:30, or 1h30m), got: {s!r}')
+
+
+class InvalidQuery(ValueError):
+    """ Raised when a query string can't be parsed. """
+    pass
+
+
+class Query(object):
+    """ A filter for Commands in a History.
+        Any of the arguments may be None (not used):
+            start, end    : Commands started from `start` up to `end`
+                            (datetimes, `end` is not included).
+            type_codes    : Collection of Command.type_code values.
+            errors        : True for errors only, False for no errors.
+            status        : Text that must be in the status.
+            filenames     : Compiled regexes for the file name, all of
+                            them must match.
+            min_duration  : Shortest run time (timedelta).
+            text          : Query string this was parsed from.
+    """
+    # Term names, each one is parsed by `self.parse_<name>()`.
+    term_names = ('file', 'from', 'min', 'status', 'to', 'type')
+
+    def __init__(
+            self, start=None, end=None, type_codes=None, errors=None,
+            status=None, filenames=None, min_duration=None, text=None):
+        self.start = start
+        self.end = end
+        self.type_codes = None if type_codes is None else set(type_codes)
+        self.errors = errors
+        self.status = None if status is None else status.lower()
+        self.filenames = list(filenames or ())
+        self.min_duration = min_duration
+        # Query string this was parsed from, if any.
+        self.text = text
+        self.predicates = self.compile()
+
+    def __bool__(self):
+        """ A Query is falsey if it matches everything. """
+        return bool(self.predicates) or bool(self.filenames)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.text!r})'
+
+    def all_predicates(self, history=None):
+        """ Return a list of all Command predicates, cheapest first,
+            including the file name matcher.
+            `history` is only used for its file index.
+        """
+        predicates = list(self.predicates)
+        filename_match = self.filename_matcher(history)
+        if filename_match is not None:
+            # Set lookups are cheaper than the time/status checks.
+            predicates.insert(0, filename_match)
+        return predicates
+
+    def compile(self):
+        """ Return a list of Command predicates, cheapest first.
+            File names are matched separately, see `self.filename_matcher()`.
+        """
+        predicates = []
+        if self.type_codes is not None:
+            type_codes = self.type_codes
+            predicates.append(lambda cmd: cmd.type_code in type_codes)
+        if self.min_duration is not None:
+            min_duration = self.min_duration
+            predicates.append(lambda cmd: cmd.duration_delta >= min_duration)
+        if self.start is not None:
+            start = self.start
+            predicates.append(lambda cmd: cmd.start_time >= start)
+        if self.end is not None:
+            end = self.end
+            predicates.append(lambda cmd: cmd.start_time < end)
+        if self.errors is not None:
+            errors = self.errors
+            predicates.append(lambda cmd: cmd.is_error() == errors)
+        if self.status is not None:
+            status = self.status
+            predicates.append(lambda cmd: status in cmd.status.lower())
+        return predicates
+
+    def commands(self, history):
+        """ Yield (session, command) tuples for matching Commands. """
+        for session, commands in self.sessions(history):
+            for cmd in commands:
+                yield session, cmd
+
+    def filter_commands(self, commands, history=None):
+        """ Return a list of the matching Commands from any iterable.
+            `history` is only used for its file index.
+        """
+        predicates = self.all_predicates(history)
+        return [
+            cmd
+            for cmd in commands
+            if all(predicate(cmd) for predicate in predicates)
+        ]
+
+    def filter_sessions(self, sessions, history=None):
+        """ Yield (session, commands) tuples for Sessions from any iterable
+            (like `History.iter_file()`), with a list of the matching
+            Commands for each Session that has any.
+            `history` is only used for its file index.
+        """
+        predicates = self.all_predicates(history)
+        for session in sessions:
+            if not self.session_possible(session):
+                continue
+            commands = [
+                cmd
+                for cmd in session
+                if all(predicate(cmd) for predicate in predicates)
+            ]
+            if commands:
+                yield session, commands
+
+    def filename_match(self, filename):
+        """ Returns True if a file name matches all of the file name
+            patterns.
+        """
+        return all(
+            pattern.search(filename) is not None
+            for pattern in self.filenames
+        )
+
+    def filename_matcher(self, history):
+        """ Return a predicate for the file name patterns. With a file
+            index, the patterns are only tried once per file name, and
+            Commands are matched with a set lookup.
+        """
+        if not self.filenames:
+            return None
+        file_index = getattr(history, 'file_index', None)
+        if not file_index:
+            return lambda cmd: self.filename_match(cmd.filename)
+        names = {
+            stats.filename
+            for stats in file_index
+            if self.filename_match(stats.filename)
+        }
+        return lambda cmd: cmd.filename in names
+
+    @classmethod
+    def parse(cls, s, start=None, end=None):
+        """ Parse a query string (see QUERY_HELP) into a Query.
+            `start` and `end` (datetimes) are used unless the query has its
+            own `from:`/`to:` terms.
+            Raises InvalidQuery for bad terms/values.
+        """
+        kwargs = {'start': start, 'end': end, 'text': s}
+        filenames = []
+        for term in (s or '').split():
+            name, sep, value = term.partition(':')
+            name = name.lower()
+            if (not sep) or (name not in cls.term_names):
+                # Bare words are file name substrings.
+                filenames.append(re.compile(re.escape(term.lower())))
+                continue
+            if not value:
+                raise InvalidQuery(f'Missing value for: {name}')
+            try:
+                parsed = getattr(cls, f'parse_{name}')(value)
+            except ValueError as ex:
+                raise InvalidQuery(f'Bad value for {name}: {ex}') from None
+            # File name terms add up, they all have to match.
+            filenames.extend(parsed.pop('filenames', ()))
+            kwargs.update(parsed)
+        return cls(filenames=filenames, **kwargs)
+
+    @staticmethod
+    def parse_file(value):
+        if (len(value) > 1) and value.startswith('/') and value.endswith('/'):
+            try:
+                pattern = re.compile(value[1:-1], re.IGNORECASE)
+            except re.error as ex:
+                raise ValueError(f'Invalid regex: {ex}') from None
+        else:
+            # Globs have to match the whole name.
+            pattern = re.compile(translate(value.lower()))
+        return {'filenames': [pattern]}
+
+    @staticmethod
+    def parse_from(value):
+        return {'start': parse_user_date(value)}
+
+    @staticmethod
+    def parse_min(value):
+        return {'min_duration': parse_duration(value)}
+
+    @staticmethod
+    def parse_status(value):
+        lowered = value.lower()
+        if lowered in ('error', 'errors'):
+            return {'errors': True}
+        if lowered == 'ok':
+            return {'errors': False}
+        return {'status': value}
+
+    @staticmethod
+    def parse_to(value):
+        # Include the whole day.
+        return {'end': parse_user_date(value) + timedelta(days=1)}
+
+    @staticmethod
+    def parse_type(value):
+        type_codes = set()
+        for name in value.lower().split(','):
+            try:
+                type_codes.add(QUERY_TYPES[name])
+            except KeyError:
+                names = ', '.join(sorted(QUERY_TYPES))
+                raise ValueError(
+                    f'Expecting one of: {names}, got: {name!r}'
+                ) from None
+        return {'type_codes': type_codes}
+
+    def session_possible(self, session):
+        """ Returns False if a Session's running totals show that none of
+            its Commands can match, so its Commands are never looked at.
+        """
+        if not session:
+            return False
+        if self.errors and not session.has_error():
+            return False
+        if self.type_codes is not None:
+            counts = {
+                TYPE_COMMAND: session.count_commands,
+                TYPE_COMMAND_FILE: session.count_command_files,
+                TYPE_USER_FILE: session.count_files,
+            }
+            if not any(counts[code] for code in self.type_codes):
+                return False
+        return True
+
+    def sessions(self, history):
+        """ Yield (session, commands) tuples, with a list of the matching
+            Commands for each Session that has any.
+            With a date range, only Sessions that were open during it are
+            looked at (using the History's interval index).
+        """
+        if (self.start is None) and (self.end is None):
+            candidates = history
+        else:
+            candidates = history.sessions_between(
+                datetime.min if self.start is None else self.start,
+                datetime.max if self.end is None else self.end,
+            )
+        return self.filter_sessions(candidates, history=history)
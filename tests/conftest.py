@@ -0,0 +1,103 @@
+""" WinCNC-History - Tests - Fixtures
+    Small, predictable WinCNC.csv logs for the tests.
+    -Christopher Welborn 05-29-2019
+"""
+
+import os
+import sys
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+import pytest
+
+# Use the lib/ from this repo, even when pytest is run from elsewhere.
+sys.path.insert(
+    0,
+    os.path.split(os.path.dirname(os.path.abspath(__file__)))[0],
+)
+
+HEADER = ','.join(
+    ('File Name', 'Minutes', 'Seconds', 'Time', 'Date') +
+    ('Status', 'Rapid', 'Feed', 'Laser') +
+    tuple(f'Axis{x}' for x in range(1, 7)) +
+    tuple(f'Output C{x}' for x in range(1, 4)) +
+    tuple(f'Input C{x}' for x in range(1, 14)) +
+    tuple(f'ATC1 T{x}' for x in range(11))
+)
+FILENAMES = (
+    'C:\\Jobs\\Part1.tap',
+    'C:\\Jobs\\Part2.tap',
+    'C:\\Jobs\\Other.tap',
+    'C:\\WinCNC\\Home.cnc',
+    'G0 X0 Y0',
+)
+
+
+def command_line(filename, dt, secs, status='OK'):
+    """ Return a Command line (no newline) that ended at `dt`. """
+    row = [
+        filename,
+        str(secs // 60),
+        str(secs % 60),
+        f'{dt:%H:%M:%S}',
+        f'{dt:%m-%d-%y}',
+        status,
+        '00:10',
+        f'{(secs - 10) // 60:02}:{(secs - 10) % 60:02}',
+        '00:00',
+    ]
+    row.extend('0.0000' for _ in range(6))
+    row.extend('0' for _ in range(16))
+    row.extend('00:00' for _ in range(11))
+    return ', '.join(row)
+
+
+def sample_lines(sessions=6, commands=5, start=None):
+    """ Return the lines for a log with `sessions` Sessions, one per day,
+        each with `commands` Commands and an "Exiting" line.
+    """
+    dt = start or datetime(2019, 1, 1, 7, 0, 0)
+    lines = [HEADER]
+    for day in range(sessions):
+        dt = dt.replace(hour=7, minute=0, second=0)
+        lines.append(f'Starting, {dt:%H:%M:%S}, {dt:%m-%d-%y}')
+        for i in range(commands):
+            secs = 60 + (i * 30)
+            dt += timedelta(seconds=secs + 120)
+            status = 'Error: Soft limit X' if (i == 3) else 'OK'
+            lines.append(
+                command_line(
+                    FILENAMES[(day + i) % len(FILENAMES)],
+                    dt,
+                    secs,
+                    status=status,
+                )
+            )
+        dt += timedelta(minutes=30)
+        lines.append(f'Exiting, {dt:%H:%M:%S}, {dt:%m-%d-%y}')
+        dt += timedelta(days=1)
+    return lines
+
+
+def sample_log(sessions=6, commands=5, newline='\r\n', final_newline=True):
+    """ Return the bytes for a sample log, see `sample_lines()`. """
+    text = newline.join(sample_lines(sessions=sessions, commands=commands))
+    if final_newline:
+        text += newline
+    return text.encode('ascii')
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    """ A function that writes a sample log (bytes) to a temporary
+        WinCNC.csv, and returns the path.
+    """
+    filepath = str(tmp_path / 'WinCNC.csv')
+
+    def write(data):
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        return filepath
+    return write
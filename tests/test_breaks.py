@@ -0,0 +1,142 @@
+""" WinCNC-History - Tests - Breaks
+    -Christopher Welborn 05-29-2019
+"""
+
+from datetime import (
+    datetime,
+    time,
+    timedelta,
+)
+
+import pytest
+
+from conftest import command_line
+from lib.util import parser
+from lib.util.breaks import BreakSchedule
+from lib.util.parser import (
+    Command,
+    Session,
+)
+
+LUNCH = (time(12, 0), time(12, 30))
+MORNING = (time(9, 0), time(9, 15))
+# A night shift break, across midnight.
+NIGHT = (time(23, 30), time(0, 30))
+
+
+def day(hour, minute=0, days=0):
+    return datetime(2019, 1, 1, hour, minute) + timedelta(days=days)
+
+
+def make_session(*times, start=None, end=None):
+    """ Build a Session with a Command for each (start, end) datetime. """
+    commands = [
+        Command(*command_line(
+            'C:\\Jobs\\Part1.tap',
+            cmdend,
+            int((cmdend - cmdstart).total_seconds()),
+        ).split(','))
+        for cmdstart, cmdend in times
+    ]
+    session = Session([], start_time=start or times[0][0], end_time=end)
+    session.extend(commands)
+    return session
+
+
+@pytest.fixture
+def lunch(monkeypatch):
+    schedule = BreakSchedule([LUNCH])
+    monkeypatch.setattr(parser, 'break_schedule', schedule)
+    return schedule
+
+
+def test_no_breaks(monkeypatch):
+    schedule = BreakSchedule()
+    assert not schedule
+    assert schedule.overlap(day(8), day(17)) == timedelta()
+    monkeypatch.setattr(parser, 'break_schedule', schedule)
+    session = make_session(
+        (day(11), day(11, 50)),
+        (day(12, 40), day(13)),
+        end=day(14),
+    )
+    assert session.between_break_delta == timedelta()
+    assert session.between_adjusted_delta == session.between_delta
+    assert session.actual_adjusted_delta == session.actual_delta
+    assert session.end_of_day_adjusted_delta == session.end_of_day_delta
+
+
+def test_break_secs_before():
+    schedule = BreakSchedule([LUNCH, MORNING])
+    assert schedule.day_secs == (30 + 15) * 60
+    whole_days = day(0).toordinal() * schedule.day_secs
+    assert schedule.break_secs_before(day(8)) == whole_days
+    assert schedule.break_secs_before(day(9, 10)) == whole_days + 600
+    assert schedule.break_secs_before(day(12, 10)) == whole_days + 1500
+    assert schedule.break_secs_before(day(18)) == whole_days + 2700
+    assert schedule.break_secs_before(day(0, days=1)) == (
+        whole_days + schedule.day_secs
+    )
+
+
+def test_overlap():
+    schedule = BreakSchedule([LUNCH, MORNING])
+    assert schedule.overlap(day(8), day(17)) == timedelta(minutes=45)
+    assert schedule.overlap(day(12, 15), day(12, 20)) == timedelta(minutes=5)
+    assert schedule.overlap(day(13), day(14)) == timedelta()
+    assert schedule.overlap(day(14), day(13)) == timedelta()
+    assert schedule.overlap(day(8), None) == timedelta()
+    # Whole days in between.
+    assert schedule.overlap(day(8), day(8, days=3)) == timedelta(
+        minutes=45 * 3
+    )
+
+
+def test_overlap_midnight():
+    schedule = BreakSchedule([NIGHT])
+    assert schedule.day_secs == 3600
+    assert schedule.overlap(day(22), day(2, days=1)) == timedelta(hours=1)
+    assert schedule.overlap(day(23, 45), day(0, 15, days=1)) == timedelta(
+        minutes=30
+    )
+    assert schedule.overlap(day(0), day(1)) == timedelta(minutes=30)
+    assert schedule.overlap(day(1), day(23)) == timedelta()
+
+
+def test_merged_windows():
+    schedule = BreakSchedule([LUNCH, (time(12, 15), time(13, 0))])
+    assert schedule.spans == [(12 * 3600, 13 * 3600)]
+    assert schedule.overlap(day(8), day(17)) == timedelta(hours=1)
+
+
+def test_session_straddles_break(lunch):
+    session = make_session(
+        (day(11), day(11, 50)),
+        # 50 minutes between, 30 of them at lunch.
+        (day(12, 40), day(13)),
+        (day(13, 10), day(13, 20)),
+        start=day(10, 45),
+        end=day(14),
+    )
+    assert session.between_delta == timedelta(minutes=60)
+    assert session.between_break_delta == timedelta(minutes=30)
+    assert session.between_adjusted_delta == timedelta(minutes=30)
+    assert session.actual_delta == timedelta(hours=3, minutes=15)
+    assert session.actual_adjusted_delta == timedelta(hours=2, minutes=45)
+    # No break after the last Command.
+    assert session.end_of_day_adjusted_delta == timedelta(minutes=40)
+    # The running total matches a fresh calculation.
+    running = session.between_break_delta
+    session.recalculate()
+    assert session.between_break_delta == running
+
+
+def test_session_during_break(lunch):
+    # A Command that ran through lunch doesn't count as break time.
+    session = make_session(
+        (day(11, 50), day(12, 40)),
+        (day(12, 45), day(13)),
+        end=day(13, 5),
+    )
+    assert session.between_break_delta == timedelta()
+    assert session.actual_adjusted_delta == timedelta(minutes=45)
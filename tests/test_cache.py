@@ -0,0 +1,80 @@
+""" WinCNC-History - Tests - Cache
+    -Christopher Welborn 05-29-2019
+"""
+
+import os
+
+import pytest
+
+from conftest import sample_log
+from lib.util import cache
+from lib.util.cache import (
+    load_history,
+    same_source,
+)
+from lib.util.parser import History
+
+
+@pytest.fixture
+def cachefile(tmp_path, monkeypatch):
+    monkeypatch.setitem(cache.config, 'cache_history', True)
+    return str(tmp_path / 'history.cache')
+
+
+def load(filepath, cachefile):
+    return load_history(
+        filepath,
+        workers=1,
+        days=0,
+        sessions=0,
+        cachefile=cachefile,
+    )
+
+
+def summary(history):
+    return [
+        (session.start_time, [cmd.filename for cmd in session])
+        for session in history
+    ]
+
+
+def test_same_source():
+    key = {'version': 1, 'path': '/a', 'size': 10, 'mtime': 1.0}
+    assert same_source(key, dict(key))
+    # Appended lines are parsed later.
+    assert same_source(key, dict(key, size=5, mtime=0.5))
+    # Same size, new mtime: rewritten.
+    assert not same_source(key, dict(key, mtime=0.5))
+    assert not same_source(key, dict(key, path='/b'))
+    assert not same_source(key, None)
+
+
+def test_load_cached(log_file, cachefile):
+    filepath = log_file(sample_log())
+    history = load(filepath, cachefile)
+    assert os.path.exists(cachefile)
+    cached = load(filepath, cachefile)
+    assert summary(cached) == summary(history)
+
+
+def test_load_appended(log_file, cachefile):
+    data = sample_log()
+    filepath = log_file(data[:len(data) // 2])
+    load(filepath, cachefile)
+    log_file(data)
+    history = load(filepath, cachefile)
+    expected = History.from_file(filepath, days=0, sessions=0, workers=1)
+    assert summary(history) == summary(expected)
+
+
+def test_load_rewritten(log_file, cachefile):
+    data = sample_log()
+    filepath = log_file(data)
+    load(filepath, cachefile)
+    # Same size and first bytes, different contents and mtime.
+    log_file(data.replace(b'Part2', b'Part3'))
+    st = os.stat(filepath)
+    os.utime(filepath, (st.st_atime, st.st_mtime + 10))
+    history = load(filepath, cachefile)
+    expected = History.from_file(filepath, days=0, sessions=0, workers=1)
+    assert summary(history) == summary(expected)
@@ -0,0 +1,98 @@
+""" WinCNC-History - Tests - Commands
+    -Christopher Welborn 05-29-2019
+"""
+
+import pickle
+import sys
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+import pytest
+
+from conftest import (
+    command_line,
+    sample_log,
+)
+from lib.util.parser import (
+    Command,
+    History,
+    LazyCommand,
+)
+
+ROW = command_line(
+    'C:\\Jobs\\Part1.tap',
+    datetime(2019, 1, 2, 8, 30, 15),
+    95,
+).split(',')
+
+
+def columns(cmd):
+    return [getattr(cmd, name) for name in Command.header]
+
+
+def test_lazy_columns():
+    cmd = Command(*ROW)
+    lazy = LazyCommand(*ROW)
+    for name in Command.header:
+        assert getattr(lazy, name) == getattr(cmd, name), name
+    assert lazy.filename == 'c:\\jobs\\part1.tap'
+    assert lazy.end_time == datetime(2019, 1, 2, 8, 30, 15)
+    assert lazy.duration_delta == timedelta(seconds=95)
+    assert lazy.start_time == cmd.start_time
+    assert lazy.type_code == cmd.type_code
+    with pytest.raises(AttributeError):
+        lazy.nothing
+
+
+def test_lazy_bad_row():
+    with pytest.raises(TypeError):
+        LazyCommand(*ROW[:-1])
+
+
+@pytest.mark.parametrize('cls', (Command, LazyCommand))
+def test_pickle(cls):
+    cmd = cls(*ROW)
+    cmd.id = 5
+    loaded = pickle.loads(pickle.dumps(cmd))
+    assert type(loaded) is cls
+    assert loaded.id == 5
+    for name in Command.header + ('start_time', 'end_time', 'type_code'):
+        assert getattr(loaded, name) == getattr(cmd, name), name
+
+
+def test_lazy_history(log_file):
+    filepath = log_file(sample_log())
+    eager = History.from_file(filepath, days=0, sessions=0, workers=1)
+    lazy = History.from_file(
+        filepath,
+        lazy=True,
+        days=0,
+        sessions=0,
+        workers=1,
+    )
+    assert all(isinstance(cmd, LazyCommand) for s in lazy for cmd in s)
+    assert [[columns(cmd) for cmd in s] for s in lazy] == [
+        [columns(cmd) for cmd in s] for s in eager
+    ]
+
+
+@pytest.mark.parametrize('cls', (Command, LazyCommand))
+def test_slots(cls):
+    cmd = cls(*ROW)
+    assert not hasattr(cmd, '__dict__')
+    assert cmd.raw_fields() == [ROW[0].lower()] + [
+        field.strip() for field in ROW[1:]
+    ]
+    # Repeated values are shared between rows.
+    other = cls(*ROW)
+    assert other.filename is cmd.filename
+    assert other.status is cmd.status
+
+
+def test_lazy_is_smaller():
+    # The packed columns have no slots of their own.
+    assert len(LazyCommand.__slots__) == 1
+    assert set(Command.__slots__).isdisjoint(LazyCommand.__slots__)
+    assert sys.getsizeof(LazyCommand(*ROW)) < sys.getsizeof(Command(*ROW))
@@ -0,0 +1,100 @@
+""" WinCNC-History - Tests - Database
+    -Christopher Welborn 05-29-2019
+"""
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+import pytest
+
+from conftest import (
+    command_line,
+    sample_lines,
+    sample_log,
+)
+from lib.util.database import HistoryDB
+from lib.util.parser import History
+
+
+@pytest.fixture
+def db(tmp_path):
+    with HistoryDB(str(tmp_path / 'history.db')) as db:
+        yield db
+
+
+def parse(filepath):
+    return History.from_file(filepath, days=0, sessions=0, workers=1)
+
+
+def summary(history):
+    return [
+        (
+            session.start_time,
+            session.end_time,
+            [cmd.raw_fields() for cmd in session],
+        )
+        for session in history
+    ]
+
+
+def test_import(log_file, db):
+    filepath = log_file(sample_log())
+    assert db.import_file(filepath) == 30
+    assert summary(db.load_history()) == summary(parse(filepath))
+    # Nothing new.
+    assert db.import_file(filepath) == 0
+    assert db.count_sessions() == 6
+
+
+def test_import_appended(log_file, db):
+    data = sample_log()
+    # Cut in the middle of a session, it is still open.
+    filepath = log_file(data[:(len(data) // 2) + 5])
+    first = db.import_file(filepath)
+    partial = db.load_history()
+    assert partial[-1].end_time is None
+    assert summary(partial) == summary(parse(filepath))
+    log_file(data)
+    assert db.import_file(filepath) == 30 - first
+    # The open Session got the rest of its Commands, and was closed.
+    assert db.count_sessions() == 6
+    assert summary(db.load_history()) == summary(parse(filepath))
+
+
+def test_import_rewritten(log_file, db):
+    data = sample_log()
+    filepath = log_file(data)
+    db.import_file(filepath)
+    log_file(data[:len(data) // 3])
+    db.import_file(filepath)
+    assert summary(db.load_history()) == summary(parse(filepath))
+
+
+def test_load_range(log_file, db):
+    filepath = log_file(sample_log())
+    db.import_file(filepath)
+    full = parse(filepath)
+    start = full[1].start_time
+    end = full[4].start_time
+    history = db.load_history(start=start, end=end)
+    assert summary(history) == summary(full.data[1:4])
+    assert db.count_sessions(start=start, end=end) == 3
+    assert len(db.load_history(start=full[-1].end_time)) == 0
+    assert len(db.load_history(end=start)) == 1
+
+
+def test_long_duration(log_file, db):
+    lines = sample_lines(sessions=1, commands=1)
+    # A Command that ran for more than a day.
+    dt = datetime(2019, 1, 3, 9, 0, 0)
+    lines.insert(-1, command_line('C:\\Jobs\\Long.tap', dt, 26 * 3600))
+    filepath = log_file(('\r\n'.join(lines) + '\r\n').encode('ascii'))
+    db.import_file(filepath)
+    duration, = db.conn.execute(
+        "SELECT duration FROM commands WHERE filename LIKE '%long.tap'"
+    ).fetchone()
+    assert duration == 26 * 3600
+    history = db.load_history()
+    assert history[0][-1].duration_delta == timedelta(hours=26)
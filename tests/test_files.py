@@ -0,0 +1,123 @@
+""" WinCNC-History - Tests - File stats
+    -Christopher Welborn 05-29-2019
+"""
+
+import importlib.util
+import os
+import pickle
+
+import pytest
+
+from conftest import sample_log
+from lib.util.indexes import FileIndex
+from lib.util.parser import (
+    History,
+    TYPE_USER_FILE,
+)
+
+
+@pytest.fixture
+def history(log_file):
+    return parse(log_file(sample_log()))
+
+
+@pytest.fixture(scope='module')
+def script():
+    """ The wincnc-history.py module, for its -f report. """
+    filepath = os.path.join(
+        os.path.split(os.path.dirname(os.path.abspath(__file__)))[0],
+        'wincnc-history.py',
+    )
+    spec = importlib.util.spec_from_file_location('wincnc_history', filepath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse(filepath):
+    return History.from_file(filepath, days=0, sessions=0, workers=1)
+
+
+def stats_summary(index):
+    return [
+        (
+            stats.filename,
+            stats.count,
+            stats.errors,
+            stats.total_secs,
+            stats.min_secs,
+            stats.max_secs,
+            stats.last_time,
+        )
+        for stats in index.sorted('name')
+    ]
+
+
+def test_file_index(history):
+    index = history.file_index
+    commands = [cmd for session in history for cmd in session]
+    # Kept up to date while parsing, same as building it afterwards.
+    assert stats_summary(index) == stats_summary(FileIndex(commands))
+    assert len(index) == len({cmd.filename for cmd in commands})
+    for stats in index:
+        runs = [cmd for cmd in commands if cmd.filename == stats.filename]
+        assert stats.count == len(runs)
+        assert stats.errors == sum(cmd.is_error() for cmd in runs)
+        assert stats.last_time == max(cmd.end_time for cmd in runs)
+        secs = [int(cmd.duration_delta.total_seconds()) for cmd in runs]
+        assert stats.total_secs == sum(secs)
+        assert (stats.min_secs, stats.max_secs) == (min(secs), max(secs))
+        assert stats.error_rate == stats.errors / stats.count
+
+
+def test_file_index_update(log_file):
+    data = sample_log()
+    filepath = log_file(data[:(len(data) // 2) + 5])
+    history = parse(filepath)
+    log_file(data)
+    history.update()
+    assert stats_summary(history.file_index) == stats_summary(
+        parse(filepath).file_index
+    )
+    # Rewritten files start over.
+    log_file(data[:len(data) // 3])
+    history.update()
+    assert stats_summary(history.file_index) == stats_summary(
+        parse(filepath).file_index
+    )
+
+
+def test_sorted(history):
+    index = history.file_index
+    counts = [stats.count for stats in index.sorted('count')]
+    assert counts == sorted(counts, reverse=True)
+    names = [stats.filename for stats in index.sorted('name')]
+    assert names == sorted(names)
+    totals = [s.total_secs for s in index.sorted('total', reverse=False)]
+    assert totals == sorted(totals)
+    with pytest.raises(ValueError):
+        index.sorted('nothing')
+    user_files = history.file_stats(user_files=True)
+    assert user_files
+    assert all(stats.type_code == TYPE_USER_FILE for stats in user_files)
+
+
+def test_pickle(history):
+    index = pickle.loads(pickle.dumps(history.file_index))
+    assert stats_summary(index) == stats_summary(history.file_index)
+
+
+def test_print_files(history, script, capsys):
+    assert script.print_files(history, sort='count') == 0
+    lines = capsys.readouterr().out.splitlines()
+    user_files = history.file_stats(key='count', user_files=True)
+    assert len(lines) == len(user_files) + 1
+    for line, stats in zip(lines[1:], user_files):
+        assert line.split()[0] == str(stats.count)
+        assert line.endswith(stats.filename)
+    with pytest.raises(script.InvalidArg):
+        script.print_files(history, sort='nothing')
+
+
+def test_print_files_none(script, capsys):
+    assert script.print_files(History(days=0, sessions=0)) == 1
@@ -0,0 +1,153 @@
+""" WinCNC-History - Tests - Indexes
+    -Christopher Welborn 05-29-2019
+"""
+
+import random
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+import pytest
+
+from conftest import sample_log
+from lib.util.indexes import (
+    IntervalIndex,
+    TimeIndex,
+)
+from lib.util.parser import History
+
+
+@pytest.fixture
+def history(log_file):
+    return History.from_file(
+        log_file(sample_log()),
+        days=0,
+        sessions=0,
+        workers=1,
+    )
+
+
+def at(hour):
+    return datetime(2019, 1, 1, hour)
+
+
+def test_sum_range():
+    starts = [at(1), at(2), at(3), at(4)]
+    sums = [0, 10, 30, 60, 100]
+    assert TimeIndex.sum_range(starts, sums) == (4, 100)
+    assert TimeIndex.sum_range(starts, sums, at(2), at(4)) == (2, 50)
+    # `end` is not included.
+    assert TimeIndex.sum_range(starts, sums, end=at(1)) == (0, 0)
+    assert TimeIndex.sum_range(starts, sums, start=at(5)) == (0, 0)
+    assert TimeIndex.sum_range(starts, sums, at(3), at(2)) == (0, 0)
+
+
+def test_time_index(history):
+    index = TimeIndex(history)
+    assert index.is_current(history)
+    info = index.runtime()
+    commands = [cmd for session in history for cmd in session]
+    assert info['commands'] == len(commands)
+    assert info['sessions'] == len(history)
+    assert info['run_delta'] == sum(
+        (cmd.duration_delta for cmd in commands),
+        timedelta(),
+    )
+    assert info['session_delta'] == sum(
+        (session.actual_delta for session in history),
+        timedelta(),
+    )
+
+
+def test_runtime_range(history):
+    start = history[1].start_time
+    end = history[4].start_time
+    info = history.runtime(start=start, end=end)
+    commands = [
+        cmd
+        for session in history
+        for cmd in session
+        if start <= cmd.start_time < end
+    ]
+    assert info['commands'] == len(commands)
+    assert info['run_delta'] == sum(
+        (cmd.duration_delta for cmd in commands),
+        timedelta(),
+    )
+    assert info['sessions'] == 3
+
+
+def test_time_index_current(history, log_file):
+    index = history.get_time_index()
+    assert history.get_time_index() is index
+    # New lines make it stale, and it is rebuilt.
+    log_file(sample_log(sessions=7))
+    history.update()
+    assert not index.is_current(history)
+    assert history.get_time_index().runtime()['sessions'] == 7
+
+
+def test_interval_at():
+    index = IntervalIndex((
+        (at(8), at(9), 'b'),
+        (at(1), at(20), 'a'),
+        (at(10), at(12), 'c'),
+        (at(11), at(11), 'd'),
+    ))
+    assert len(index) == 4
+    assert index.at(at(0)) == []
+    assert index.at(at(1)) == ['a']
+    assert index.at(at(9)) == ['a', 'b']
+    assert index.at(at(11)) == ['a', 'c', 'd']
+    assert index.at(at(20)) == ['a']
+    assert index.at(at(21)) == []
+
+
+def test_interval_overlapping():
+    index = IntervalIndex((
+        (at(1), at(2), 'a'),
+        (at(3), at(4), 'b'),
+        (at(5), at(6), 'c'),
+    ))
+    assert index.overlapping(at(2), at(3)) == ['a', 'b']
+    assert index.overlapping(at(0), at(23)) == ['a', 'b', 'c']
+    assert index.overlapping(at(7), at(8)) == []
+    assert IntervalIndex(()).overlapping(at(0), at(23)) == []
+
+
+@pytest.mark.parametrize('count', (1, 2, 3, 7, 64, 257))
+def test_interval_brute_force(count):
+    rand = random.Random(count)
+    intervals = []
+    for i in range(count):
+        start = rand.randrange(1000)
+        # Some long ones, like a Session that was never closed.
+        length = rand.choice((0, 1, 5, 20, 500))
+        intervals.append((start, start + length, i))
+    index = IntervalIndex(intervals)
+    ordered = sorted(intervals, key=lambda interval: interval[0])
+    for _ in range(200):
+        start = rand.randrange(-10, 1600)
+        end = start + rand.choice((0, 0, 3, 50))
+        assert index.overlapping(start, end) == [
+            item
+            for istart, iend, item in ordered
+            if (istart <= end) and (iend >= start)
+        ]
+
+
+def test_running_at(history):
+    session = history[2]
+    cmd = session[2]
+    when = cmd.start_time + ((cmd.end_time - cmd.start_time) / 2)
+    assert history.sessions_at(when) == [session]
+    assert history.commands_at(when) == [(session, cmd)]
+    # Between sessions.
+    assert history.sessions_at(session.end_time + (
+        history[3].start_time - session.end_time
+    ) / 2) == []
+    assert history.sessions_between(
+        history[1].start_time,
+        history[2].start_time,
+    ) == [history[1], history[2]]
@@ -0,0 +1,43 @@
+""" WinCNC-History - Tests - Loader
+    -Christopher Welborn 05-29-2019
+"""
+
+from conftest import sample_log
+from lib.util.loader import HistoryLoader
+from lib.util.parser import History
+
+
+def test_loader_done(log_file):
+    filepath = log_file(sample_log())
+    history = History(filepath=filepath, days=0, sessions=0, workers=1)
+    loader = HistoryLoader(history.update)
+    loader.start()
+    loader.join()
+    messages = list(loader.messages())
+    kinds = [kind for kind, _ in messages]
+    assert kinds[-1] == 'done'
+    assert set(kinds[:-1]) == {'progress'}
+    assert len(history) == 6
+
+
+def test_loader_cancelled(log_file):
+    filepath = log_file(sample_log())
+    history = History(filepath=filepath, days=0, sessions=0, workers=1)
+    loader = HistoryLoader(history.update)
+    loader.cancel()
+    loader.start()
+    loader.join()
+    assert list(loader.messages()) == [('cancelled', None)]
+
+
+def test_loader_error(tmp_path):
+    loader = HistoryLoader(
+        History.from_file,
+        str(tmp_path / 'missing.csv'),
+        workers=1,
+    )
+    loader.start()
+    loader.join()
+    (kind, ex), = loader.messages()
+    assert kind == 'error'
+    assert isinstance(ex, OSError)
@@ -0,0 +1,231 @@
+""" WinCNC-History - Tests - Offsets
+    -Christopher Welborn 05-29-2019
+"""
+
+import os
+from datetime import datetime
+
+import pytest
+
+from conftest import (
+    command_line,
+    sample_lines,
+    sample_log,
+)
+from lib.util import offsets
+from lib.util.offsets import (
+    HEADER_SIZE,
+    SessionOffsets,
+    load_history_range,
+)
+from lib.util.parser import History
+
+
+@pytest.fixture
+def indexfile(tmp_path):
+    return str(tmp_path / 'offsets.idx')
+
+
+def parse(filepath):
+    return History.from_file(filepath, days=0, sessions=0, workers=1)
+
+
+def session_lines(data):
+    """ Return the byte offset of each "Starting" line in `data`. """
+    found = []
+    pos = 0
+    for line in data.splitlines(keepends=True):
+        if line.startswith(b'Starting,'):
+            found.append(pos)
+        pos += len(line)
+    return found
+
+
+def test_scan(log_file, indexfile):
+    data = sample_log()
+    index = SessionOffsets.load(log_file(data), indexfile=indexfile)
+    assert index.offsets == session_lines(data)
+    assert index.scanned == len(data)
+    history = parse(log_file(data))
+    assert index.starts == [session.start_time for session in history]
+
+
+def test_no_final_newline(log_file, indexfile):
+    data = sample_log(final_newline=False)
+    index = SessionOffsets.load(log_file(data), indexfile=indexfile)
+    assert index.scanned == len(data)
+    # An unfinished last line is scanned again next time.
+    index = SessionOffsets(log_file(data[:-3]), indexfile=indexfile)
+    index.update()
+    assert index.scanned < len(data) - 3
+
+
+def test_no_final_newline_encoding(log_file, indexfile, monkeypatch):
+    monkeypatch.setattr(offsets, 'FILE_ENCODING', 'utf-8')
+    lines = sample_lines(sessions=1)
+    # A non-ascii file name on the last line.
+    lines.append(command_line(
+        'C:\\Jobs\\Pièce.tap',
+        datetime(2019, 1, 3, 12, 0, 0),
+        90,
+    ))
+    data = '\r\n'.join(lines).encode('utf-8')
+    index = SessionOffsets.load(log_file(data), indexfile=indexfile)
+    assert index.scanned == len(data)
+
+
+def test_read_saved(log_file, indexfile):
+    filepath = log_file(sample_log())
+    index = SessionOffsets.load(filepath, indexfile=indexfile)
+    loaded = SessionOffsets(filepath, indexfile=indexfile)
+    assert loaded.read()
+    assert loaded.offsets == index.offsets
+    assert loaded.starts == index.starts
+    assert loaded.header_size == HEADER_SIZE
+    assert not loaded.update()
+
+
+def test_long_path_header(tmp_path, indexfile):
+    # A header line that doesn't fit in HEADER_SIZE.
+    dirpath = tmp_path / ('x' * 150)
+    dirpath.mkdir()
+    filepath = str(dirpath / 'WinCNC.csv')
+    data = sample_log()
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    index = SessionOffsets.load(filepath, indexfile=indexfile)
+    loaded = SessionOffsets(filepath, indexfile=indexfile)
+    assert loaded.read()
+    assert loaded.header_size > HEADER_SIZE
+    assert loaded.offsets == index.offsets
+    assert loaded.starts == index.starts
+    # Grow the header (bigger size/scanned numbers) and add records.
+    more = sample_log(sessions=60)
+    with open(filepath, 'wb') as f:
+        f.write(more)
+    index = SessionOffsets.load(filepath, indexfile=indexfile)
+    assert index.offsets == session_lines(more)
+    loaded = SessionOffsets(filepath, indexfile=indexfile)
+    assert loaded.read()
+    assert loaded.offsets == index.offsets
+    assert loaded.starts == index.starts
+    assert not loaded.update()
+
+
+def test_appended(log_file, indexfile):
+    lines = sample_lines(sessions=12)
+    first = ('\r\n'.join(lines[:30]) + '\r\n').encode('ascii')
+    data = ('\r\n'.join(lines) + '\r\n').encode('ascii')
+    filepath = log_file(first)
+    SessionOffsets.load(filepath, indexfile=indexfile)
+    log_file(data)
+    index = SessionOffsets(filepath, indexfile=indexfile)
+    assert index.read()
+    saved = len(index)
+    assert not index.update()
+    assert len(index) > saved
+    assert index.offsets == session_lines(data)
+    index.save()
+    loaded = SessionOffsets(filepath, indexfile=indexfile)
+    assert loaded.read()
+    assert loaded.offsets == index.offsets
+
+
+@pytest.mark.parametrize('change', ('truncated', 'rewritten'))
+def test_rebuilt(log_file, indexfile, change):
+    data = sample_log()
+    filepath = log_file(data)
+    SessionOffsets.load(filepath, indexfile=indexfile)
+    if change == 'truncated':
+        data = data[:len(data) // 2]
+    else:
+        # Same size, different first bytes.
+        data = b'X' + data[1:]
+    log_file(data)
+    index = SessionOffsets(filepath, indexfile=indexfile)
+    assert index.read()
+    assert index.update()
+    assert index.offsets == session_lines(data)
+
+
+def test_moved_session(log_file, indexfile):
+    data = sample_log()
+    filepath = log_file(data)
+    SessionOffsets.load(filepath, indexfile=indexfile)
+    # Same first bytes, but the last Session moved and the file grew.
+    lines = sample_lines()
+    lines.insert(-7, lines[-8])
+    data = ('\r\n'.join(lines) + '\r\n').encode('ascii')
+    log_file(data)
+    index = SessionOffsets(filepath, indexfile=indexfile)
+    assert index.read()
+    assert index.update()
+    assert index.offsets == session_lines(data)
+
+
+def test_range(log_file, indexfile):
+    data = sample_log()
+    filepath = log_file(data)
+    index = SessionOffsets.load(filepath, indexfile=indexfile)
+    starts = index.starts
+    assert index.range() == (index.offsets[0], None)
+    assert index.range(start=starts[2], end=starts[4]) == (
+        index.offsets[2],
+        index.offsets[4],
+    )
+    assert index.range(start=starts[-1]) == (index.offsets[-1], None)
+    # Nothing in range.
+    assert index.range(start=starts[2], end=starts[2]) == (
+        len(data),
+        len(data),
+    )
+    assert index.range_at(starts[3]) == (index.offsets[3], index.offsets[4])
+    assert index.range_at(starts[0].replace(year=2000)) == (
+        len(data),
+        len(data),
+    )
+
+
+def test_split(log_file, indexfile):
+    data = sample_log(sessions=20)
+    index = SessionOffsets.load(log_file(data), indexfile=indexfile)
+    bounds = index.split(index.offsets[0], len(data), 4)
+    assert bounds[0] == index.offsets[0]
+    assert bounds[-1] == len(data)
+    assert bounds == sorted(set(bounds))
+    assert all(offset in index.offsets for offset in bounds[1:-1])
+
+
+def test_load_history_range(log_file, indexfile):
+    filepath = log_file(sample_log())
+    full = parse(filepath)
+    start = full[1].start_time
+    end = full[4].start_time
+    history = load_history_range(
+        filepath,
+        start=start,
+        end=end,
+        workers=1,
+        indexfile=indexfile,
+    )
+    assert [s.start_time for s in history] == [
+        s.start_time for s in full.data[1:4]
+    ]
+    assert [len(s) for s in history] == [len(s) for s in full.data[1:4]]
+    # The last Session is closed by the next one.
+    assert history[-1].end_time == full[3].end_time
+    cmd = full[2][1]
+    history = load_history_range(
+        filepath,
+        at=cmd.start_time,
+        workers=1,
+        indexfile=indexfile,
+    )
+    assert [s.start_time for s in history] == [full[2].start_time]
+
+
+def test_index_disabled(log_file, indexfile, monkeypatch):
+    monkeypatch.setitem(offsets.config, 'offset_index', False)
+    index = SessionOffsets.load(log_file(sample_log()), indexfile=indexfile)
+    assert len(index) == 6
+    assert not os.path.exists(indexfile)
@@ -0,0 +1,237 @@
+""" WinCNC-History - Tests - Parser
+    -Christopher Welborn 05-29-2019
+"""
+
+import os
+
+import pytest
+
+from conftest import (
+    sample_lines,
+    sample_log,
+)
+from lib.util import parser
+from lib.util.parser import (
+    History,
+    LoadCancelled,
+    row_complete,
+)
+
+
+def summary(history):
+    """ Return the parts of a History that should match between parses. """
+    return [
+        (
+            session.id,
+            session.start_time,
+            session.end_time,
+            [(cmd.id, cmd.filename, cmd.start_time) for cmd in session],
+        )
+        for session in history
+    ]
+
+
+def parse(filepath, **kwargs):
+    kwargs.setdefault('days', 0)
+    kwargs.setdefault('sessions', 0)
+    kwargs.setdefault('workers', 1)
+    return History.from_file(filepath, **kwargs)
+
+
+@pytest.mark.parametrize('newline', ('\r\n', '\n'))
+def test_from_file(log_file, newline):
+    history = parse(log_file(sample_log(newline=newline)))
+    assert len(history) == 6
+    assert all(len(session) == 5 for session in history)
+    assert all(session.end_time is not None for session in history)
+    ids = [cmd.id for session in history for cmd in session]
+    assert ids == sorted(set(ids))
+
+
+@pytest.mark.parametrize('newline', ('\r\n', '\n'))
+def test_no_final_newline(log_file, newline):
+    data = sample_log(newline=newline, final_newline=False)
+    filepath = log_file(data)
+    history = parse(filepath)
+    expected = parse(log_file(sample_log(newline=newline)))
+    # The last "Exiting" line is not lost.
+    assert history[-1].end_time is not None
+    assert summary(history) == summary(expected)
+    assert history.offset == len(data)
+
+
+def test_no_final_newline_command(log_file):
+    lines = sample_lines(sessions=1)[:-1]
+    history = parse(log_file('\r\n'.join(lines).encode('ascii')))
+    assert len(history[-1]) == 5
+
+
+def test_partial_last_line(log_file):
+    data = sample_log(final_newline=False)
+    # Still being written: part of the date is missing.
+    filepath = log_file(data[:-3])
+    history = parse(filepath)
+    assert history[-1].end_time is None
+    log_file(data + b'\r\n')
+    assert not history.update()
+    assert summary(history) == summary(parse(filepath))
+
+
+def test_row_complete():
+    lines = sample_lines(sessions=1)
+    assert row_complete(lines[1].split(','))
+    assert row_complete(lines[2].split(','))
+    assert row_complete(lines[-1].split(','))
+    assert not row_complete(lines[-1][:-1].split(','))
+    assert not row_complete(lines[2][:-1].split(','))
+    assert not row_complete(lines[2][:40].split(','))
+    assert not row_complete([])
+
+
+def test_update_appended(log_file):
+    data = sample_log()
+    # Cut in the middle of a line, and in the middle of a session.
+    cut = (len(data) // 2) + 5
+    filepath = log_file(data[:cut])
+    history = parse(filepath)
+    count = sum(len(session) for session in history)
+    log_file(data)
+    assert not history.update()
+    assert sum(len(session) for session in history) > count
+    assert summary(history) == summary(parse(filepath))
+
+
+def test_update_truncated(log_file):
+    data = sample_log()
+    filepath = log_file(data)
+    history = parse(filepath)
+    log_file(data[:len(data) // 3])
+    assert history.update()
+    assert summary(history) == summary(parse(filepath))
+
+
+def test_update_rewritten(log_file):
+    data = sample_log()
+    filepath = log_file(data)
+    history = parse(filepath)
+    # A different file with the same size.
+    log_file(data.replace(b'Part1', b'Part3'))
+    assert history.update()
+    assert summary(history) == summary(parse(filepath))
+
+
+def test_update_cancelled(log_file, monkeypatch):
+    monkeypatch.setattr(parser, 'BLOCK_SIZE', 256)
+    filepath = log_file(sample_log())
+    history = History(filepath=filepath, days=0, sessions=0, workers=1)
+    calls = []
+
+    def progress(done, total):
+        calls.append((done, total))
+        if len(calls) == 4:
+            raise LoadCancelled()
+    with pytest.raises(LoadCancelled):
+        history.update(progress=progress)
+    assert 0 < history.offset < os.path.getsize(filepath)
+    # Rows before the offset were kept, the rest is parsed next time.
+    history.update()
+    assert summary(history) == summary(parse(filepath))
+    assert calls[0] == (0, os.path.getsize(filepath))
+
+
+@pytest.mark.parametrize('block_size', (7, 64, 1000))
+def test_block_sizes(log_file, monkeypatch, block_size):
+    filepath = log_file(sample_log())
+    expected = summary(parse(filepath))
+    monkeypatch.setattr(parser, 'BLOCK_SIZE', block_size)
+    assert summary(parse(filepath)) == expected
+
+
+def test_quoted_fields(log_file):
+    lines = sample_lines(sessions=1)
+    # A quoted file name with a comma in it.
+    row = lines[2].replace('C:\\Jobs\\Part1.tap', '"C:\\Jobs\\Part, 9.tap"')
+    lines.insert(3, row)
+    history = parse(log_file('\r\n'.join(lines).encode('ascii') + b'\r\n'))
+    assert history[0][1].filename == 'c:\\jobs\\part, 9.tap'
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    """ Parse files of any size with worker processes. """
+    monkeypatch.setattr(parser, 'parse_workers_min_mb', 0)
+
+
+def test_parallel(log_file, parallel):
+    filepath = log_file(sample_log(sessions=12))
+    history = parse(filepath, workers=2)
+    assert summary(history) == summary(parse(filepath, workers=1))
+
+
+def test_parallel_update(log_file, parallel):
+    data = sample_log(sessions=12)
+    # Cut in the middle of a session, it is still open.
+    filepath = log_file(data[:(len(data) // 2) + 5])
+    history = parse(filepath, workers=2)
+    assert summary(history) == summary(parse(filepath, workers=1))
+    log_file(data)
+    assert not history.update()
+    assert summary(history) == summary(parse(filepath, workers=1))
+
+
+def test_parallel_cancelled(log_file, parallel):
+    filepath = log_file(sample_log(sessions=12))
+    history = History(filepath=filepath, days=0, sessions=0, workers=3)
+    calls = []
+
+    def progress(done, total):
+        calls.append(done)
+        if len(calls) == 2:
+            raise LoadCancelled()
+    with pytest.raises(LoadCancelled):
+        history.update(progress=progress)
+    assert 0 < history.offset < os.path.getsize(filepath)
+    # The first part was kept, the rest is parsed next time.
+    history.update()
+    assert summary(history) == summary(parse(filepath, workers=1))
+
+
+def test_iter_file(log_file):
+    filepath = log_file(sample_log())
+    expected = summary(parse(filepath))
+    sessions = list(History.iter_file(filepath, days=0, sessions=0))
+    assert summary(sessions) == expected
+
+
+def test_iter_file_open(log_file):
+    data = sample_log()
+    # The last Session is still open, it is yielded at the end.
+    filepath = log_file(data[:data.rindex(b'Exiting')])
+    sessions = list(History.iter_file(filepath, days=0, sessions=0))
+    assert len(sessions) == 6
+    assert sessions[-1].end_time is None
+    assert len(sessions[-1]) == 5
+
+
+def test_iter_file_early(log_file):
+    filepath = log_file(sample_log())
+    # Sessions come out one at a time, and are released when yielded.
+    sessions = History.iter_file(filepath, days=0, sessions=0)
+    first = next(sessions)
+    assert first.end_time is not None
+    assert len(first) == 5
+    sessions.close()
+
+
+def test_recent_window(log_file):
+    filepath = log_file(sample_log())
+    full = parse(filepath)
+    history = parse(filepath, sessions=2)
+    assert len(history) == 2
+    assert history.has_older()
+    assert [s.start_time for s in history] == [
+        s.start_time for s in full.data[-2:]
+    ]
+    while history.has_older():
+        history.load_older()
+    assert [s.start_time for s in history] == [s.start_time for s in full]
@@ -0,0 +1,169 @@
+""" WinCNC-History - Tests - Query
+    -Christopher Welborn 05-29-2019
+"""
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+import pytest
+
+from conftest import sample_log
+from lib.util.parser import (
+    History,
+    TYPE_COMMAND,
+    TYPE_USER_FILE,
+)
+from lib.util.query import (
+    InvalidQuery,
+    Query,
+    parse_duration,
+)
+
+
+@pytest.fixture
+def history(log_file):
+    return History.from_file(
+        log_file(sample_log()),
+        days=0,
+        sessions=0,
+        workers=1,
+    )
+
+
+def matches(query, history):
+    """ Return a list of the Commands that match a Query. """
+    return [cmd for _, cmd in query.commands(history)]
+
+
+def all_commands(history):
+    return [cmd for session in history for cmd in session]
+
+
+@pytest.mark.parametrize('s, secs', (
+    ('90', 90),
+    ('01:30', 90),
+    ('1:00:30', 3630),
+    ('1h30m', 5400),
+    ('45m', 2700),
+    ('90s', 90),
+    (' 2H ', 7200),
+))
+def test_parse_duration(s, secs):
+    assert parse_duration(s) == timedelta(seconds=secs)
+
+
+@pytest.mark.parametrize('s', ('', 'h', '1:2:3:4', '1x', 'a:b', '-5'))
+def test_parse_duration_bad(s):
+    with pytest.raises(ValueError):
+        parse_duration(s)
+
+
+def test_parse_terms():
+    query = Query.parse(
+        'from:2019-01-02 to:01-04-19 type:command,user_file status:error '
+        'min:1m30s'
+    )
+    assert query.start == datetime(2019, 1, 2)
+    # `to:` includes the whole day.
+    assert query.end == datetime(2019, 1, 5)
+    assert query.type_codes == {TYPE_COMMAND, TYPE_USER_FILE}
+    assert query.errors is True
+    assert query.min_duration == timedelta(seconds=90)
+    assert query
+
+
+def test_parse_empty():
+    for s in (None, '', '   '):
+        query = Query.parse(s)
+        assert not query
+    start = datetime(2019, 1, 1)
+    assert Query.parse('', start=start).start == start
+    assert Query.parse('from:2019-02-01', start=start).start == datetime(
+        2019,
+        2,
+        1,
+    )
+
+
+@pytest.mark.parametrize('s', (
+    'from:',
+    'from:yesterday',
+    'type:nothing',
+    'min:forever',
+    'file:/(/',
+))
+def test_parse_invalid(s):
+    with pytest.raises(InvalidQuery):
+        Query.parse(s)
+
+
+def test_bare_words(history):
+    query = Query.parse('part')
+    found = matches(query, history)
+    assert found
+    assert all('part' in cmd.filename for cmd in found)
+    # Unknown term names are file name words too.
+    assert Query.parse('c:\\jobs').filenames
+
+
+def test_filenames_combined(history):
+    # Every file name term has to match, not just the last one.
+    query = Query.parse('jobs file:*1.tap')
+    assert len(query.filenames) == 2
+    found = matches(query, history)
+    assert found
+    assert {cmd.filename for cmd in found} == {'c:\\jobs\\part1.tap'}
+    assert not matches(Query.parse('other file:*1.tap'), history)
+    regex = Query.parse('file:/part[12]/ file:*2.tap')
+    assert {cmd.filename for cmd in matches(regex, history)} == {
+        'c:\\jobs\\part2.tap',
+    }
+
+
+def test_status(history):
+    errors = matches(Query.parse('status:error'), history)
+    assert errors
+    assert all(cmd.is_error() for cmd in errors)
+    ok = matches(Query.parse('status:ok'), history)
+    assert len(errors) + len(ok) == len(all_commands(history))
+    assert matches(Query.parse('status:soft'), history) == errors
+
+
+def test_date_range(history):
+    start = history[1].start_time
+    end = history[3].start_time
+    query = Query(start=start, end=end)
+    expected = [
+        cmd
+        for cmd in all_commands(history)
+        if start <= cmd.start_time < end
+    ]
+    assert matches(query, history) == expected
+
+
+def test_type_and_duration(history):
+    query = Query.parse('type:user_file min:2m')
+    expected = [
+        cmd
+        for cmd in all_commands(history)
+        if (cmd.type_code == TYPE_USER_FILE) and
+        (cmd.duration_delta >= timedelta(minutes=2))
+    ]
+    assert expected
+    assert matches(query, history) == expected
+
+
+def test_filter_commands(history):
+    query = Query.parse('part status:ok')
+    commands = all_commands(history)
+    expected = [
+        cmd
+        for cmd in commands
+        if ('part' in cmd.filename) and not cmd.is_error()
+    ]
+    # With and without the History's file index.
+    assert query.filter_commands(commands, history) == expected
+    assert query.filter_commands(commands) == expected
+    assert Query().filter_commands(commands) == commands
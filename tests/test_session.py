@@ -0,0 +1,108 @@
+""" WinCNC-History - Tests - Session
+    -Christopher Welborn 05-29-2019
+"""
+
+from datetime import timedelta
+
+import pytest
+
+from conftest import sample_log
+from lib.util.parser import (
+    History,
+    Session,
+)
+
+
+@pytest.fixture
+def history(log_file):
+    return History.from_file(
+        log_file(sample_log()),
+        days=0,
+        sessions=0,
+        workers=1,
+    )
+
+
+def test_time_before(history):
+    for session in history:
+        prev_end = session.start_time
+        for cmd in session:
+            assert session.time_before(cmd) == cmd.start_time - prev_end
+            prev_end = cmd.end_time
+
+
+def test_time_after(history):
+    for session in history:
+        for cmd, nextcmd in zip(session, session.data[1:]):
+            assert session.time_after(cmd) == (
+                nextcmd.start_time - cmd.end_time
+            )
+        last = session[-1]
+        assert session.time_after(last) == session.end_time - last.end_time
+    # An open Session has nothing after the last Command.
+    session = history[-1]
+    session.end_time = None
+    assert session.time_after(session[-1]) == timedelta()
+
+
+def test_gaps_changed(history):
+    session = history[0]
+    gaps = session.get_gaps()
+    assert gaps == session.calc_gaps()
+    # Changed without append(), the gaps are calculated again.
+    del session.data[1]
+    assert session.get_gaps() == session.calc_gaps()
+    assert session.time_before(session[1]) == (
+        session[1].start_time - session[0].end_time
+    )
+
+
+def test_position(history):
+    session = history[2]
+    for i, cmd in enumerate(session):
+        assert session.position(cmd) == i
+    with pytest.raises(ValueError):
+        session.position(history[3][0])
+
+
+def totals(session):
+    """ Return the running totals for a Session. """
+    return (
+        session.duration_delta,
+        session.between_delta,
+        session.count_commands,
+        session.count_command_files,
+        session.count_files,
+        session.error,
+        list(session.gaps),
+    )
+
+
+def test_running_totals(history):
+    for session in history:
+        appended = totals(session)
+        session.recalculate()
+        assert totals(session) == appended
+        assert session.duration_delta == sum(
+            (cmd.duration_delta for cmd in session),
+            timedelta(),
+        )
+        assert session.between_delta == session.between_time()
+        assert session.count_commands + session.count_command_files + (
+            session.count_files
+        ) == len(session)
+        assert session.has_error() == any(cmd.is_error() for cmd in session)
+
+
+def test_running_totals_append(history):
+    session = Session([], start_time=history[0].start_time)
+    session.extend(history[0])
+    assert totals(session) == totals(history[0])
+    # Changed without append(), the next append starts over.
+    del session.data[0]
+    session.append(history[1][0])
+    expected = Session(
+        history[0].data[1:] + [history[1][0]],
+        start_time=history[0].start_time,
+    )
+    assert totals(session) == totals(expected)
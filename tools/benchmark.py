@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+""" WinCNC-History - Tools - Benchmark
+    Parse a large synthetic WinCNC.csv and report parse speed and memory
+    used per Command, for Command and LazyCommand.
+    -Christopher Welborn 05-20-2019
+"""
+
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+# Use the lib/ from this repo, and its config file.
+sys.path.insert(
+    0,
+    os.path.split(os.path.dirname(os.path.abspath(__file__)))[0],
+)
+
+from lib.util.parser import History  # noqa
+
+USAGESTR = """ Usage:
+        benchmark.py [COMMANDS] [FILE]
+
+    Options:
+        COMMANDS  : Number of Commands in the synthetic log.
+                    Default: 200000
+        FILE      : Use an existing WinCNC.csv instead of a synthetic one.
+"""
+
+# File names for the synthetic log. Mostly user files, like a real log.
+FILENAMES = [f'C:\\Jobs\\Part{x}.tap' for x in range(40)] + [
+    'C:\\WinCNC\\Home.cnc',
+    'C:\\WinCNC\\ToolChange.cnc',
+    'G0 X0 Y0',
+    'M5',
+]
+
+
+def main(args):
+    """ Main entry point, expects sys.argv[1:]. """
+    if ('-h' in args) or ('--help' in args):
+        print(USAGESTR)
+        return 0
+    count = int(args[0]) if args else 200000
+    if len(args) > 1:
+        return benchmark(args[1])
+
+    fd, filepath = tempfile.mkstemp(prefix='wincnc-bench-', suffix='.csv')
+    os.close(fd)
+    try:
+        print(f'Writing {count} Commands to: {filepath}')
+        write_log(filepath, count)
+        return benchmark(filepath)
+    finally:
+        os.remove(filepath)
+
+
+def benchmark(filepath):
+    """ Parse `filepath` with each Command class and print the results. """
+    size = os.path.getsize(filepath) / (1024 * 1024)
+    print(f'File size: {size:.1f} MB')
+    for lazy in (False, True):
+        name = 'LazyCommand' if lazy else 'Command'
+        gc.collect()
+        start = time.perf_counter()
+        history = History.from_file(filepath, lazy=lazy)
+        duration = time.perf_counter() - start
+        count = sum(len(session) for session in history)
+        del history
+        gc.collect()
+
+        # Measure memory in a second run, tracemalloc slows parsing down.
+        tracemalloc.start()
+        history = History.from_file(filepath, lazy=lazy)
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del history
+        print('\n'.join((
+            f'\n{name}:',
+            f'    Commands: {count}',
+            f'  Parse time: {duration:.2f}s ({count / duration:,.0f}/s)',
+            f'      Memory: {used / (1024 * 1024):.1f} MB',
+            f' Per Command: {used / count:,.0f} bytes',
+        )))
+    return 0
+
+
+def write_log(filepath, count):
+    """ Write a synthetic WinCNC.csv with `count` Commands. """
+    rand = random.Random(1)
+    dt = datetime(2017, 1, 2, 7, 0, 0)
+    with open(filepath, 'w', newline='') as f:
+        f.write(
+            ','.join(
+                ('File Name', 'Minutes', 'Seconds', 'Time', 'Date') +
+                ('Status', 'Rapid', 'Feed', 'Laser') +
+                tuple(f'Axis{x}' for x in range(1, 7)) +
+                tuple(f'Output C{x}' for x in range(1, 4)) +
+                tuple(f'Input C{x}' for x in range(1, 14)) +
+                tuple(f'ATC1 T{x}' for x in range(11))
+            )
+        )
+        f.write('\r\n')
+        written = 0
+        while written < count:
+            dt = (dt + timedelta(days=1)).replace(hour=7)
+            f.write(f'Starting, {dt:%H:%M:%S}, {dt:%m-%d-%y}\r\n')
+            for _ in range(rand.randint(1, 60)):
+                rapid = rand.randint(0, 120)
+                feed = rand.randint(0, 900)
+                total = rapid + feed
+                dt = dt + timedelta(seconds=rand.randint(5, 400) + total)
+                row = [
+                    rand.choice(FILENAMES),
+                    str(total // 60),
+                    str(total % 60),
+                    f'{dt:%H:%M:%S}',
+                    f'{dt:%m-%d-%y}',
+                    'OK' if rand.random() > 0.05 else 'Error: Soft limit X',
+                    f'{rapid // 60:02}:{rapid % 60:02}',
+                    f'{feed // 60:02}:{feed % 60:02}',
+                    '00:00',
+                ]
+                row.extend(
+                    f'{rand.choice((0, 0, rand.random() * 48)):.4f}'
+                    for _ in range(6)
+                )
+                row.extend(rand.choice('01') for _ in range(16))
+                row.extend('00:00' for _ in range(11))
+                f.write(', '.join(row))
+                f.write('\r\n')
+                written += 1
+            dt = dt + timedelta(seconds=rand.randint(5, 4000))
+            f.write(f'Exiting, {dt:%H:%M:%S}, {dt:%m-%d-%y}\r\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -8,35 +8,103 @@
 """
 
 import sys
+from datetime import timedelta
+from itertools import islice
+from textwrap import fill
 
 from lib.gui.main import load_gui
 from lib.gui.dialogs import show_error
+from lib.util.breaks import break_schedule
+from lib.util.cache import load_history
 from lib.util.config import (
     SCRIPT,
     VERSIONSTR,
     docopt,
     get_wincnc_file,
 )
+from lib.util.database import HistoryDB
+from lib.util.indexes import FileIndex
+from lib.util.offsets import load_history_range
 from lib.util.debug import (
     C,
     debug,
     debugprinter,
     print_err,
 )
-from lib.util.parser import History
+from lib.util.parser import (
+    History,
+    Session,
+    parse_user_date,
+    parse_user_datetime,
+    timedelta_str,
+)
+from lib.util.query import (
+    QUERY_HELP,
+    InvalidQuery,
+    Query,
+)
 
 
 USAGESTR = """{versionstr}
     Usage:
         {script} -h | -v
-        {script} [-D] [-c]
+        {script} [-D] [-c] [-d] [-s date] [-e date] [-F query] [-n num]
+        {script} [-D] [-c] [-F query] [-n num] [--days num]
+        {spaces} [--sessions num]
+        {script} [-D] -r [-d] [-s date] [-e date]
+        {script} [-D] -r [--days num] [--sessions num]
+        {script} [-D] -a time [-d]
+        {script} [-D] -f [-d] [-S key]
+        {script} [-D] -f [-S key] [--days num] [--sessions num]
 
     Options:
-        -c,--console  : Run in console-mode.
-        -D,--debug    : Show some debug info while running.
-        -h,--help     : Show this help message.
-        -v,--version  : Show version.
-""".format(script=SCRIPT, versionstr=VERSIONSTR)
+        -a time,--at time     : Show what was running at a date/time
+                                (mm-dd-yy hh:mm[:ss] or
+                                yyyy-mm-dd hh:mm[:ss]).
+        -c,--console          : Run in console-mode. This is implied by
+                                -d, -s, -e, -F, and -n.
+        -d,--database         : Import new lines into the history database,
+                                and list sessions from there.
+        -D,--debug            : Show some debug info while running.
+        --days num            : Only load sessions from the last `num`
+                                days in the file (0 for all of them).
+                                Not used with -a, -d, -s, or -e.
+                                Default: recent_days from the config.
+        -e date,--end date    : Only list sessions started on or before
+                                this date (yyyy-mm-dd or mm-dd-yy).
+        -f,--files            : Print run count, run time, and error rate
+                                for each user file.
+        -F query,--filter query
+                              : Only list Commands matching a query
+                                (see below).
+        -h,--help             : Show this help message.
+        -n num,--limit num    : Only list the first `num` sessions.
+        -r,--runtime          : Print total run time and session time,
+                                instead of listing sessions.
+        -s date,--start date  : Only list sessions started on or after
+                                this date (yyyy-mm-dd or mm-dd-yy).
+        --sessions num        : Only load the last `num` sessions in the
+                                file (0 for all of them).
+                                Not used with -a, -d, -s, or -e.
+                                Default: recent_sessions from the config.
+        -S key,--sort key     : Sort the --files report by one of:
+                                {sort_keys}.
+                                Default: total
+        -v,--version          : Show version.
+
+    {query_help}
+""".format(
+    script=SCRIPT,
+    spaces=' ' * len(SCRIPT),
+    versionstr=VERSIONSTR,
+    sort_keys=fill(
+        ', '.join(sorted(FileIndex.sort_keys)),
+        width=72,
+        initial_indent=' ' * 32,
+        subsequent_indent=' ' * 32,
+    ).lstrip(),
+    query_help=QUERY_HELP.replace('\n', '\n    ').rstrip(),
+)
 
 
 def main(argd):
@@ -48,17 +116,292 @@ def main(argd):
         show_error(ex)
         return 1
 
-    if argd['--console']:
-        debug('Using file: {}'.format(wincnc_file))
-        return list_history(wincnc_file)
-    return load_gui(filepath=wincnc_file)
+    # The GUI doesn't use any of the listing options, so they imply -c.
+    console = any(
+        argd[opt]
+        for opt in (
+            '--console', '--runtime', '--at', '--files', '--database',
+            '--start', '--end', '--filter', '--limit',
+        )
+    )
+    # Recent window, Sessions before it are not loaded.
+    window = {
+        'days': parse_arg_int(argd['--days'], minimum=0),
+        'sessions': parse_arg_int(argd['--sessions'], minimum=0),
+    }
+    if not console:
+        return load_gui(filepath=wincnc_file, **window)
+
+    debug('Using file: {}'.format(wincnc_file))
+    if argd['--files']:
+        history = get_history(
+            wincnc_file,
+            use_db=argd['--database'],
+            **window,
+        )
+        return print_files(history, sort=argd['--sort'] or 'total')
+    if argd['--at']:
+        when = parse_arg_time(argd['--at'])
+        history = get_history(
+            wincnc_file,
+            end=when + timedelta(seconds=1),
+            at=when,
+            use_db=argd['--database'],
+            **window,
+        )
+        return print_running(history, when)
+    start = parse_arg_date(argd['--start'])
+    end = parse_arg_date(argd['--end'])
+    if end is not None:
+        # Include the whole end day.
+        end = end + timedelta(days=1)
+    if argd['--runtime']:
+        history = get_history(
+            wincnc_file,
+            start=start,
+            end=end,
+            use_db=argd['--database'],
+            **window,
+        )
+        return print_runtime(history, start=start, end=end)
+    query = None
+    if argd['--filter']:
+        try:
+            query = Query.parse(argd['--filter'], start=start, end=end)
+        except InvalidQuery as ex:
+            raise InvalidArg(f'bad filter, {ex}')
+    limit = parse_arg_int(argd['--limit'])
+    if argd['--database'] or (start is not None) or (end is not None):
+        sessions = get_history(
+            wincnc_file,
+            start=start,
+            end=end,
+            use_db=argd['--database'],
+        )
+    else:
+        # Sessions are printed while the file is still being parsed.
+        sessions = History.iter_file(wincnc_file, lazy=True, **window)
+    return list_history(
+        sessions,
+        start=start,
+        end=end,
+        query=query,
+        limit=limit,
+    )
+
+
+def format_session_times(session):
+    """ Return the Session time and the time between Commands, with and
+        without the configured breaks, for the session listing.
+    """
+    pcs = []
+    if session.end_time:
+        pcs.append(('Session Time', session.actual_duration))
+        pcs.append(('No Breaks', session.actual_adjusted_duration))
+    pcs.append(('Time Between', session.between_duration))
+    pcs.append(('No Breaks', session.between_adjusted_duration))
+    return C('  ').join(
+        C(': ').join(C(label, 'blue'), C(value, 'cyan'))
+        for label, value in pcs
+    )
 
 
-def list_history(filepath):
-    history = History.from_file(filepath)
-    for session in history:
+def get_history(
+        filepath, start=None, end=None, at=None, use_db=False, days=None,
+        sessions=None):
+    """ Load a History for console-mode.
+        If `use_db` is truthy, new lines are imported into the history
+        database, and only the Sessions started between `start` and `end`
+        (datetimes, either may be None) are loaded.
+        Otherwise, with `at` (a datetime) only the Session open at that time
+        is parsed, and with `start`/`end` only the Sessions started between
+        them are parsed (using the session offset index).
+        With none of those, only the recent window (`days`/`sessions`, see
+        `History.from_file()`) is loaded.
+    """
+    if use_db:
+        with HistoryDB() as db:
+            db.import_file(filepath)
+            return db.load_history(start=start, end=end, lazy=True)
+    if at is not None:
+        return load_history_range(filepath, at=at, lazy=True)
+    if (start is not None) or (end is not None):
+        return load_history_range(filepath, start=start, end=end, lazy=True)
+    return load_history(filepath, lazy=True, days=days, sessions=sessions)
+
+
+def list_history(sessions, start=None, end=None, query=None, limit=None):
+    """ Print Sessions (from a History, or `History.iter_file()`), started
+        between `start` and `end` (datetimes, either may be None).
+        If a Query is given, only Sessions with matching Commands are
+        printed, showing only the matching Commands.
+        Stops after `limit` Sessions, if given.
+        With breaks in the config, each Session is followed by its times
+        with and without the breaks.
+    """
+    if query:
+        matches = (
+            Session(
+                commands,
+                start_time=session.start_time,
+                end_time=session.end_time,
+            )
+            for session, commands in query.filter_sessions(sessions)
+        )
+    else:
+        matches = (
+            session
+            for session in sessions
+            if ((start is None) or (session.start_time >= start)) and
+            ((end is None) or (session.start_time < end))
+        )
+    count = 0
+    for session in islice(matches, limit):
         print(C(session))
-    return 0 if history else 1
+        if break_schedule:
+            print(C(' ').join(' ', format_session_times(session)))
+        count += 1
+    return 0 if count else 1
+
+
+def parse_arg_date(s):
+    """ Parse a date from the command line, in the form yyyy-mm-dd or
+        mm-dd-yy. Returns None for an empty value.
+    """
+    if not s:
+        return None
+    try:
+        return parse_user_date(s)
+    except ValueError:
+        raise InvalidArg(f'expecting a date (yyyy-mm-dd or mm-dd-yy): {s}')
+
+
+def parse_arg_int(s, minimum=1):
+    """ Parse a number (at least `minimum`) from the command line.
+        Returns None for an empty value.
+    """
+    if not s:
+        return None
+    try:
+        val = int(s)
+    except ValueError:
+        val = minimum - 1
+    if val < minimum:
+        raise InvalidArg(f'expecting a number >= {minimum}: {s}')
+    return val
+
+
+def parse_arg_time(s):
+    """ Parse a date and time from the command line, in the form
+        mm-dd-yy hh:mm[:ss] or yyyy-mm-dd hh:mm[:ss].
+    """
+    try:
+        return parse_user_datetime(s)
+    except ValueError:
+        raise InvalidArg(
+            f'expecting a time (mm-dd-yy hh:mm or yyyy-mm-dd hh:mm): {s}'
+        )
+
+
+def print_files(history, sort='total'):
+    """ Print run count, run time, rapid/feed time, and error rate for
+        each user file, sorted by one of `FileIndex.sort_keys`.
+    """
+    try:
+        files = history.file_stats(key=sort, user_files=True)
+    except ValueError as ex:
+        raise InvalidArg(str(ex).lower())
+    if not files:
+        print_err('No user files were found.')
+        return 1
+    headers = (
+        'Runs', 'Total', 'Mean', 'Min', 'Max', 'Rapid', 'Feed', 'Errors',
+    )
+    print(C(' ').join(
+        C(' ').join(C(f'{s:>12}', 'blue') for s in headers),
+        C('File', 'blue'),
+    ))
+    for stats in files:
+        times = (
+            stats.total_delta,
+            stats.mean_delta,
+            stats.min_delta,
+            stats.max_delta,
+            stats.rapid_delta,
+            stats.feed_delta,
+        )
+        print(C(' ').join(
+            C(f'{stats.count:>12}', 'cyan'),
+            C(' ').join(
+                C(f'{timedelta_str(delta, short=True):>12}', 'cyan')
+                for delta in times
+            ),
+            C(
+                f'{stats.error_rate:>12.1%}',
+                'red' if stats.errors else 'cyan',
+            ),
+            C(stats.filename, 'blue', style='bright'),
+        ))
+    return 0
+
+
+def print_running(history, when):
+    """ Print the Sessions and Commands that were running at `when`
+        (a datetime).
+    """
+    sessions = history.sessions_at(when)
+    if not sessions:
+        print_err(f'Nothing was running at: {when:%m-%d-%y %H:%M:%S}')
+        return 1
+    commands = history.commands_at(when)
+    for session in sessions:
+        end = session.time_str(session.end_time) or 'still running'
+        print(C(' ').join(
+            C('Session:', 'blue'),
+            C(session.time_str(), 'cyan'),
+            C('to', 'blue'),
+            C(end, 'cyan'),
+        ))
+        running = [cmd for cmdses, cmd in commands if cmdses is session]
+        if not running:
+            gap = 'between commands' if session else 'no commands'
+            print(C(f'    ({gap})', 'dimgrey'))
+        for cmd in running:
+            print(C(' ').join(
+                '   ',
+                C(cmd.time_str(time_only=True), 'cyan'),
+                C('to', 'blue'),
+                C(cmd.time_str(cmd.end_time, time_only=True), 'cyan'),
+                cmd.filename_fmt(),
+                cmd.status_fmt(),
+            ))
+    return 0
+
+
+def print_runtime(history, start=None, end=None):
+    """ Print total Command run time and Session time for Sessions and
+        Commands started between `start` and `end` (datetimes, either may
+        be None).
+    """
+    info = history.runtime(start=start, end=end)
+    if end is not None:
+        # Show the last day that was included.
+        end = end - timedelta(days=1)
+    pcs = (
+        ('From', 'beginning' if start is None else f'{start:%m-%d-%y}'),
+        ('To', 'end' if end is None else f'{end:%m-%d-%y}'),
+        ('Sessions', info['sessions']),
+        ('Commands', info['commands']),
+        ('Run Time', timedelta_str(info['run_delta'])),
+        ('Session Time', timedelta_str(info['session_delta'])),
+    )
+    if break_schedule:
+        pcs += (
+            ('No Breaks', timedelta_str(info['session_adjusted_delta'])),
+        )
+    for label, value in pcs:
+        print(C(': ').join(C(f'{label:>12}', 'blue'), C(value, 'cyan')))
+    return 0 if info['sessions'] else 1
 
 
 class InvalidArg(ValueError):